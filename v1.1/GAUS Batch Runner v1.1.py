@@ -0,0 +1,270 @@
+import os
+import csv
+import math
+import shutil
+import tempfile
+import json
+import time
+import itertools
+import subprocess
+from qgis import processing
+from qgis.processing import alg
+from qgis.PyQt.QtCore import QVariant
+from qgis.core import (QgsApplication, QgsProject, QgsVectorLayer, QgsVectorFileWriter, QgsFeature, QgsField, QgsWkbTypes)
+
+#ui input parameters
+@alg(name='GAUS_batch11', label='GAUS Batch Runner 1.1', group='GAUS v1.1', group_label='GAUS v1.1')
+@alg.input(type=alg.FILE, name='jobfile', label='Job Specification File (JSON)', extension='json')
+@alg.input(type=alg.NUMBER, name='workers', label='Worker Processes', default=1)
+@alg.input(type=alg.FILE_DEST, name='logfile', label='Timing Log (CSV)', optional = True)
+
+#ui output definition (does nothing, it is here because qgis requires the declaration of at least one output)
+@alg.output(type=alg.NUMBER, name='numoffeat', label='Number of Analyses Run')
+
+def computeMetrics(instance, parameters, context, feedback, inputs):
+    """
+    Runs a grid of GAUS Points+Lines 1.1 and GAUS Lines 1.1 analyses described in a job specification file.
+
+    Fields Description:
+    Job Specification File: JSON file with a list of jobs (or an object with the list in its "jobs" key). Each job has the keys:
+    "network": "Points+Lines" or "Lines"; "lines" and "points": paths or names in the project of the layers (points only for Points+Lines networks);
+    "analysis": "Topological" or "Geodetic"; "radius": number (0 = global); "metrics": names or codes of the metrics (Acc, Btw, Cen, Opp, Cvg, Pol, Rea, Cnc);
+    "geomrule" (Lines networks, 0 to 2), "precision" (Points+Lines networks), "impedance", "load", "supply" and "demand" (lists of field names) are optional.
+    The values of "lines", "points", "analysis" and "radius" can also be lists, and the job is expanded to every combination of them.
+    Jobs with the same network, layers, fields, analysis, radius and connection rules are merged in a single analysis computing all their metrics, so the network is built once for them.
+    Analyses of the same layers and connection rules that cannot be merged (other analysis types, radii or fields) are run by the same process where possible, and the network built by the first one is read from a temporary cache by the next ones.
+    Worker Processes: number of analyses run at the same time. Values higher than 1 run each analysis in a separate qgis_process command, which must be installed with QGIS and have the GAUS scripts available; otherwise the analyses are run one at a time in QGIS. Canceling stops the running commands.
+    Timing Log: CSV file where each analysis is logged with the jobs it serves, its parameters and its duration in seconds.
+    Each analysis runs on temporary GeoPackage copies of the layers, which keep the full names of the fields, and the results of all analyses are inserted in the points vector layers (or in the lines vector layers, in Lines networks) in a single update per layer.
+    """
+
+    metricNames = ['Accessibility','Betweenness','Freeman-Krafta Centrality','Opportunity','Convergence','Polarity','Reach','Connectivity']
+    codesL = ["Acc","Btw","Cen","Opp","Cvg","Pol","Rea","Cnc"]
+
+    #layer of the project with the informed name or layer read from the informed path, each source is opened once
+    def openLayer(source):
+        if source not in layersD:
+            layersL = QgsProject.instance().mapLayersByName(source)
+            layersD[source] = layersL[0] if layersL != [] else QgsVectorLayer(source, os.path.splitext(os.path.basename(source))[0], "ogr")
+            if not layersD[source].isValid(): raise ValueError(f'layer {source} could not be opened')
+        return layersD[source]
+
+    #list of values of a key that may hold a single value
+    def asList(value):
+        return value if isinstance(value, list) else [value]
+
+    #jobs of the specification expanded to one entry per combination, as analysis units with a key shared by the jobs that can be merged
+    def expandJobs(jobsL):
+        unitsD = {}
+        for jobIndex in range(len(jobsL)):
+            job = jobsL[jobIndex]
+            network = ['Points+Lines','Lines'].index(job.get("network", "Points+Lines"))
+            metricsL = sorted(set(codesL.index(name) if name in codesL else metricNames.index(name) for name in asList(job["metrics"])))
+            fieldsT = tuple(tuple(asList(job.get(key, []))) for key in ["impedance", "load", "supply", "demand"])
+            pointsL = asList(job["points"]) if network == 0 else [None]
+            for lines, points, analysis, radius in itertools.product(asList(job["lines"]), pointsL, asList(job.get("analysis", "Geodetic")), asList(job.get("radius", 0.0))):
+                analysisType = ['Topological','Geodetic'].index(analysis)
+                ruleT = (float(job.get("precision", 0.00015)),) if network == 0 else (int(job.get("geomrule", 0)),)
+                key = (network, lines, points, analysisType, float(radius)) + fieldsT + ruleT
+                if key not in unitsD: unitsD[key] = [set(), []]
+                unitsD[key][0].update(metricsL)
+                if jobIndex+1 not in unitsD[key][1]: unitsD[key][1].append(jobIndex+1)
+        return [[key, sorted(metricsS), jobsIndexL] for key, (metricsS, jobsIndexL) in unitsD.items()]
+
+    #copy of the features of a layer with the informed fields in a temporary GeoPackage, the original id of each feature kept in the gausFid field
+    #GeoPackage keeps the full names of the fields, which shapefiles cut to 10 characters
+    def copyLayer(layer, fieldNames, path):
+        memLayer = QgsVectorLayer(QgsWkbTypes.displayString(layer.wkbType()) + "?crs=" + layer.crs().authid(), layer.name(), "memory")
+        memLayer.dataProvider().addAttributes([layer.fields().field(name) for name in fieldNames] + [QgsField("gausFid", QVariant.Int)])
+        memLayer.updateFields()
+        featsA = []
+        for feat in layer.getFeatures():
+            copyFeat = QgsFeature(memLayer.fields())
+            copyFeat.setGeometry(feat.geometry())
+            copyFeat.setAttributes([feat.attribute(name) for name in fieldNames] + [feat.id()])
+            featsA.append(copyFeat)
+        memLayer.dataProvider().addFeatures(featsA)
+        QgsVectorFileWriter.writeAsVectorFormat(memLayer, path, "UTF-8", layer.crs(), "GPKG")
+        return QgsVectorLayer(path, layer.name(), "ogr")
+
+    #algorithm and parameters of the analysis of one unit, with the layers informed by the copies of a process
+    def unitParams(unitIndex, worker, layersF):
+        key, metricsL, jobsIndexL = unitsA[unitIndex]
+        network, lines, points, analysisType, radius, impField, loadField, supplyField, demandField, rule = key
+        params = {'inpLines': layersF(lines), 'analysis': analysisType, 'metrics': metricsL, 'radius': radius, 'impedance': list(impField), 'load': list(loadField), 'supply': list(supplyField), 'demand': list(demandField), 'cachefolder': os.path.join(cacheDir, str(worker))}
+        if network == 0: params.update({'inpPoints': layersF(points), 'precision': rule})
+        else: params['geomrule'] = rule
+        return ("script:GAUS_pl11" if network == 0 else "script:GAUS_l11"), params
+
+    #names and values of the fields created by an analysis in the results layer of its unit
+    def unitResults(resLayer, namesBefore):
+        newNames = [name for name in resLayer.fields().names() if name not in namesBefore]
+        return newNames, {feat.attribute("gausFid"): [feat.attribute(name) for name in newNames] for feat in resLayer.getFeatures()}
+
+    #analysis of one unit on the copies of its layers, returning the names and the values of the fields it creates
+    def runUnit(unitIndex, worker):
+        key = unitsA[unitIndex][0]
+        start = time.perf_counter()
+        resLayer = copiesD[key[2] if key[0] == 0 else key[1]]
+        namesBefore = resLayer.fields().names()
+        algName, params = unitParams(unitIndex, worker, lambda source: copiesD[source])
+        processing.run(algName, params, context = context, is_child_algorithm = True)
+        return unitResults(resLayer, namesBefore) + (time.perf_counter() - start,)
+
+    #command line launcher of the processing algorithms, installed with QGIS
+    def processLauncher():
+        for name in ['qgis_process', 'qgis_process-qgis', 'qgis_process-qgis-ltr']:
+            path = shutil.which(name) or shutil.which(name, path = os.path.join(QgsApplication.prefixPath(), 'bin'))
+            if path != None: return path
+        return None
+
+    #separate process running the analysis of one unit on the GeoPackage copies of a worker
+    #nothing of the QGIS process is shared with it, the results are read from the copies when it ends
+    def startUnit(unitIndex, worker, logFile):
+        algName, params = unitParams(unitIndex, worker, lambda source: copyPath(source, worker))
+        command = [launcher, 'run', algName]
+        if context.ellipsoid() not in ('', 'NONE'): command.append(f'--ellipsoid={context.ellipsoid()}')
+        command.append('--')
+        for name, value in params.items():
+            for item in (value if isinstance(value, list) else [value]): command.append(f'{name}={item}')
+        return subprocess.Popen(command, stdin = subprocess.DEVNULL, stdout = logFile, stderr = subprocess.STDOUT)
+
+    #units sharing a network (layers and connection rule) are run by the same process, which builds the network once and reads it from the cache in the next units
+    #a process only takes more units of a network while it has fewer units than its even share, so a single network is still spread among the processes
+    def shareUnits():
+        sharesL, ownerD = [[] for w in range(workers)], {}
+        for unitIndex in range(len(unitsA)):
+            key = unitsA[unitIndex][0]
+            graph = (key[0], key[1], key[2], key[9])
+            w = ownerD.get(graph)
+            if w == None or len(sharesL[w]) >= math.ceil(len(unitsA)/workers): w = min(range(workers), key = lambda w: len(sharesL[w]))
+            ownerD[graph] = w
+            sharesL[w].append(unitIndex)
+        return sharesL
+
+    #path of the copy of a layer used by one process
+    def copyPath(source, worker):
+        return os.path.join(tempDir, f'layer_{list(layersD).index(source)}_{worker}.gpkg')
+
+    #copies of the layers used by one process, with the fields required by their analyses
+    def copyLayers(worker):
+        for source in layersD: copiesD[source] = copyLayer(layersD[source], fieldsD[source], copyPath(source, worker))
+
+    #import user input parameters
+    jobPath = instance.parameterAsFile(parameters, 'jobfile', context)
+    workers = max(1, instance.parameterAsInt(parameters, 'workers', context))
+    logPath = instance.parameterAsFileOutput(parameters, 'logfile', context)
+
+    #jobs and analysis units
+    layersD = {}
+    try:
+        with open(jobPath) as jobFile: jobsL = json.load(jobFile)
+        if isinstance(jobsL, dict): jobsL = jobsL["jobs"]
+        unitsA = expandJobs(jobsL)
+        for key, metricsL, jobsIndexL in unitsA:
+            openLayer(key[1])
+            if key[0] == 0: openLayer(key[2])
+    except (OSError, ValueError, KeyError, TypeError) as error:
+        feedback.reportError(f'Invalid job specification: {error}')
+        return {'numoffeat': 0}
+    #the largest analyses first, so the processes finish at similar times
+    workers = min(workers, len(unitsA))
+    unitsA.sort(key = lambda unit: (unit[0][4] != 0.0, -unit[0][4], -len(unit[1])))
+    feedback.pushInfo(f'{len(jobsL)} Jobs Merged in {len(unitsA)} Analyses on {len(layersD)} Layers')
+
+    #fields of each layer required by its analyses
+    fieldsD = {source: [] for source in layersD}
+    for key, metricsL, jobsIndexL in unitsA:
+        fieldsD[key[1]] += [name for name in key[5] if name not in fieldsD[key[1]]]
+        resSource = key[2] if key[0] == 0 else key[1]
+        fieldsD[resSource] += [name for fieldT in key[6:9] for name in fieldT if name not in fieldsD[resSource]]
+    tempDir = tempfile.mkdtemp(prefix='gaus_batch_')
+    cacheDir = os.path.join(tempDir, 'cache') #networks shared by the analyses of each process, in one folder per process
+    copiesD = {}
+
+    #analyses
+    resultsD = {} #unit index: (new field names, values of each feature, seconds)
+    launcher = processLauncher() if workers > 1 else None
+    if launcher != None:
+        feedback.pushInfo(f'Running {len(unitsA)} Analyses in {workers} Processes of {launcher}')
+        for worker in range(workers): copyLayers(worker)
+        copiesD.clear()
+        pendingL = shareUnits()
+        runningD = {} #worker: [unit index, process, log file, names of the fields of its results layer before the analysis, start]
+        while not feedback.isCanceled() and (runningD != {} or any(pendingL)):
+            for worker in range(workers):
+                if worker not in runningD and pendingL[worker] != []:
+                    unitIndex = pendingL[worker].pop(0)
+                    key = unitsA[unitIndex][0]
+                    resPath = copyPath(key[2] if key[0] == 0 else key[1], worker)
+                    namesBefore = QgsVectorLayer(resPath, "copy", "ogr").fields().names()
+                    logFile = open(os.path.join(tempDir, f'log_{worker}.txt'), 'w+')
+                    runningD[worker] = [unitIndex, startUnit(unitIndex, worker, logFile), logFile, namesBefore, time.perf_counter()]
+            time.sleep(0.2)
+            for worker in list(runningD):
+                unitIndex, proc, logFile, namesBefore, start = runningD[worker]
+                if proc.poll() == None: continue
+                del runningD[worker]
+                logFile.seek(0)
+                logL = logFile.read().strip().splitlines()
+                logFile.close()
+                if proc.returncode != 0:
+                    feedback.pushWarning(f'Analysis {unitIndex+1} failed with exit code {proc.returncode}: ' + (logL[-1] if logL != [] else 'no output'))
+                    continue
+                key = unitsA[unitIndex][0]
+                resLayer = QgsVectorLayer(copyPath(key[2] if key[0] == 0 else key[1], worker), "copy", "ogr")
+                resultsD[unitIndex] = unitResults(resLayer, namesBefore) + (time.perf_counter() - start,)
+                feedback.pushInfo(f'Analysis {unitIndex+1} (Jobs {", ".join(str(ind) for ind in unitsA[unitIndex][2])}) Finished in {resultsD[unitIndex][2]:.2f} s')
+                feedback.setProgress(100*len(resultsD)/len(unitsA))
+        for unitIndex, proc, logFile, namesBefore, start in runningD.values(): #analyses stopped by the cancellation
+            proc.terminate()
+            proc.wait()
+            logFile.close()
+    else:
+        if workers > 1: feedback.pushWarning('The qgis_process command was not found, analyses will be run in a single process')
+        workers = 1
+        copyLayers(0)
+        for unitIndex in range(len(unitsA)):
+            if feedback.isCanceled(): break
+            resultsD[unitIndex] = runUnit(unitIndex, 0)
+            feedback.pushInfo(f'Analysis {unitIndex+1} (Jobs {", ".join(str(ind) for ind in unitsA[unitIndex][2])}) Finished in {resultsD[unitIndex][2]:.2f} s')
+            feedback.setProgress(100*(unitIndex+1)/len(unitsA))
+    if len(resultsD) < len(unitsA): feedback.reportError(f'{len(unitsA) - len(resultsD)} Analyses were not finished')
+
+    #update table of contents, one update per layer
+    changesD = {source: {} for source in layersD}
+    logL = []
+    for unitIndex in sorted(resultsD):
+        key, metricsL, jobsIndexL = unitsA[unitIndex]
+        newNames, valuesD, seconds = resultsD[unitIndex]
+        resLayer = layersD[key[2] if key[0] == 0 else key[1]]
+        indexL = []
+        for name in newNames:
+            aux = 0
+            while resLayer.fields().indexFromName(name[:-1] + str(aux)) != -1: aux += 1
+            resLayer.dataProvider().addAttributes([QgsField(name[:-1] + str(aux),QVariant.Double)])
+            resLayer.updateFields()
+            indexL.append(resLayer.fields().indexFromName(name[:-1] + str(aux)))
+        layerChangesD = changesD[key[2] if key[0] == 0 else key[1]]
+        for featId, valuesL in valuesD.items():
+            if featId not in layerChangesD: layerChangesD[featId] = {}
+            for ind in range(len(indexL)): layerChangesD[featId][indexL[ind]] = valuesL[ind]
+        logL.append([unitIndex+1, " ".join(str(ind) for ind in jobsIndexL), ['Points+Lines','Lines'][key[0]], key[1], key[2] or "", ['Topological','Geodetic'][key[3]], key[4], " ".join(codesL[metric] for metric in metricsL), " ".join(resLayer.fields().field(index).name() for index in indexL), round(seconds, 3)])
+    for source in layersD:
+        if changesD[source] != {}: layersD[source].dataProvider().changeAttributeValues(changesD[source])
+    copiesD.clear()
+    for worker in range(workers):
+        for ind in range(len(layersD)):
+            for fileSuffix in ['', '-wal', '-shm']:
+                if os.path.isfile(os.path.join(tempDir, f'layer_{ind}_{worker}.gpkg{fileSuffix}')): os.remove(os.path.join(tempDir, f'layer_{ind}_{worker}.gpkg{fileSuffix}'))
+        if os.path.isfile(os.path.join(tempDir, f'log_{worker}.txt')): os.remove(os.path.join(tempDir, f'log_{worker}.txt'))
+    shutil.rmtree(cacheDir, ignore_errors = True)
+    if os.listdir(tempDir) == []: os.rmdir(tempDir)
+
+    if logPath != "":
+        with open(logPath, "w", newline = "") as logFile:
+            writer = csv.writer(logFile)
+            writer.writerow(["analysis", "jobs", "network", "lines", "points", "analysis_type", "radius", "metrics", "fields", "seconds"])
+            writer.writerows(logL)
+
+    return {'numoffeat': len(resultsD)}
@@ -1,8 +1,20 @@
+import os
+import math
+import multiprocessing
+import zlib
+import heapq
+import hashlib
+import struct
+from array import array
+from queue import Empty
 from decimal import Decimal
+from collections import OrderedDict
 from qgis import processing
 from qgis.processing import alg
 from qgis.PyQt.QtCore import QVariant
-from qgis.core import (NULL, QgsProject, QgsGeometry, QgsVectorFileWriter, QgsDistanceArea, QgsPointXY, QgsField, QgsFields, QgsVectorDataProvider)
+from qgis.core import (NULL, QgsProject, QgsGeometry, QgsVectorFileWriter, QgsDistanceArea, QgsPointXY, QgsField, QgsFields, QgsVectorDataProvider, QgsFeatureRequest, QgsSpatialIndex)
+
+networksD = OrderedDict() #networks built by the last runs, kept while QGIS is open
 
 #ui input parameters
 @alg(name='GAUS_l11', label='GAUS Lines 1.1', group='GAUS v1.1', group_label='GAUS v1.1')
@@ -10,11 +22,24 @@ from qgis.core import (NULL, QgsProject, QgsGeometry, QgsVectorFileWriter, QgsDi
 @alg.input(type=alg.ENUM, name='analysis', label='Analysis Type', options=['Topological','Geodetic'], default = 0)
 @alg.input(type=alg.ENUM, name='metrics', label='Metrics to be Computed', options=['Accessibility','Betweenness','Freeman-Krafta Centrality','Opportunity','Convergence','Polarity','Reach','Connectivity'], allowMultiple=True)
 @alg.input(type=alg.ENUM, name='geomrule', label='Rule for Connecting Lines', options=['Overlapping Vertices','Crossing Lines', 'Overlapping Vertices + Crossing Lines'], default = 0)
+@alg.input(type=alg.NUMBER, name='vertextol', label='Tolerance of Overlapping Vertices (0.0 = Exact Coordinates)', default=0.0)
+@alg.input(type=alg.BOOL, name='exactcheck', label='Verify Overlapping Vertices with the Exact Geometric Test', default = True)
+@alg.input(type=alg.NUMBER, name='workers', label='Worker Processes (Network Construction)', default=1)
 @alg.input(type=alg.NUMBER, name='radius', label='Analysis Radius (0.0 = Global Analysis)')
 @alg.input(type=alg.FIELD, name='impedance',label='Impedance of Lines',parentLayerParameterName = 'inpLines',allowMultiple=True,optional = True)
 @alg.input(type=alg.FIELD, name='load',label='Load of Lines',parentLayerParameterName = 'inpLines',allowMultiple=True,optional = True)
 @alg.input(type=alg.FIELD, name='supply',label='Supply in Lines',parentLayerParameterName = 'inpLines',allowMultiple=True,optional = True)
 @alg.input(type=alg.FIELD, name='demand',label='Demand in Lines',parentLayerParameterName = 'inpLines',allowMultiple=True,optional = True)
+@alg.input(type=alg.ENUM, name='sources', label='Source Features', options=['All Features','Selected Features','Features Matching Expression'], default = 0)
+@alg.input(type=alg.EXPRESSION, name='sourceexpr', label='Source Filter Expression', parentLayerParameterName = 'inpLines', optional = True)
+@alg.input(type=alg.BOOL, name='contract', label='Contract Degree-2 Chains', default = False)
+@alg.input(type=alg.BOOL, name='blocks', label='Betweenness by Biconnected Components', default = False)
+@alg.input(type=alg.BOOL, name='diststats', label='Distance Distribution of Sources', default = False)
+@alg.input(type=alg.STRING, name='bands', label='Distance Bands (comma separated limits) [optional]', optional = True)
+@alg.input(type=alg.FILE_DEST, name='odfile', label='Export Origin-Destination Costs [optional]', optional = True, createByDefault = False)
+@alg.input(type=alg.ENUM, name='odformat', label='Origin-Destination Costs Format', options=['Dense Float32 Matrix','Compressed Blocks per Source'], default = 0)
+@alg.input(type=alg.FILE, name='cachefolder', label='Cache Folder (Results and Networks) [optional]', behavior=1, optional = True)
+@alg.input(type=alg.NUMBER, name='cachesize', label='Cache Size (MB)', default=1000.0)
 @alg.input(type=alg.VECTOR_LAYER_DEST, name='dest', label='Create New Shapefiles for Results? [optional]', optional = True, createByDefault = False)
 
 #ui output definition (does nothing, it is here because qgis requires the declaration of at least one output)
@@ -26,50 +51,43 @@ def computeMetrics(instance, parameters, context, feedback, inputs):
     
     Fields Description:
     Lines: shapefile containing the geometry of the lines which compose the network.
-    Analysis: how the distance between lines is computed. In the topological analysis, the distance between each pair of connected lines is equal to 1. In the geometric analysis, the distance is equal to the geodetic distance between them.
+    Analysis: how the distance between lines is computed. In the topological analysis, the distance between each pair of connected lines is equal to 1. In the geometric analysis, the distance is equal to the geodetic distance between them. Lengths are planar, in the units of the layer, for projected coordinate systems, and ellipsoidal, in meters, for geographic coordinate systems, with the ellipsoid of the project.
     Analysis Radius: Zero means that all lines will be considered for the computation of the metrics for all other lines. A value higher than zero means that only the lines within the defined radius will be considered for the computation of the metrics of each line.
-    Rule for Connecting the Lines: definition of how the connection between lines will be computed.
+    Rule for Connecting the Lines: definition of how the connection between lines will be computed. With the Crossing Lines rules, only the lines with intersecting bounding boxes, found in a spatial index, are tested.
+    Tolerance of Overlapping Vertices: with the Overlapping Vertices rule, the vertices of the lines are grouped by their coordinates, and each end of a line is only compared with the lines that have a vertex at the same place, instead of every other line. A value higher than zero groups the vertices closer than it. Ends of lines touching another line between two of its vertices are not found by this rule.
+    Verify Overlapping Vertices with the Exact Geometric Test: the lines found with overlapping vertices are only connected if they touch each other, as in the comparison of every pair of lines. Without the test, lines with overlapping vertices are connected even if they also overlap or cross elsewhere, and the tolerance is fully used.
+    Worker Processes: number of processes among which the tiles of the extent of the lines are distributed to find their connections. Each line is assigned to every tile it overlaps, and each pair of lines is only tested in one tile. Values higher than 1 are only used on systems that are able to fork the QGIS process. If any process fails, the connections are found again in a single process.
     Load: field of the selected line shapefile containing the value of the load of each line.
     Impedance: field of the selected line shapefile containing the value of the impedance of each line.
+    Contract Degree-2 Chains: lines connected to exactly two others are removed from the priority queue of the shortest paths and their distances are obtained along the chains that join the remaining lines. The results are the same, with fewer operations in networks with many curve vertices or split lines.
+    Betweenness by Biconnected Components: in global analysis, the betweenness is computed inside each biconnected component of the network, the parts joined by a single edge being accounted for without searching them. The results are the same, with fewer operations in networks with many dead ends and tree-like branches, apart from paths of equal length that differ only by rounding. It has no effect on the other metrics or when a radius is defined.
+    Source Features: lines from which the shortest paths are computed, which can be all lines, the lines currently selected or the lines matching the filter expression. Accessibility, Opportunity, Reach and Connectivity are only written for the source lines. Betweenness, Freeman-Krafta Centrality, Convergence and Polarity only consider the paths that start at the source lines, and their fields are marked as restricted to the sources.
+    Distance Distribution of Sources: for each source edge, the mean (Dav), the 25th, 50th (median), 75th and 90th percentiles (P25 to P90) of the shortest path costs to the other edges within the radius, weighted by their load, and the load within each distance band (Bd1 to Bd9, the limit of each band being informed in the field alias). They are computed from the costs already found by the analysis.
+    Distance Bands: upper limits of the distance bands, separated by commas, up to 9 bands. The band fields hold the load of the edges whose cost is not higher than the limit.
+    Export Origin-Destination Costs: file where the shortest path costs between each source and the features within the radius are written during the analysis, in native byte order. The dense matrix is a float32 matrix with one row and one column per feature id, which can be memory-mapped, with infinity for pairs that are not connected within the radius. The compressed blocks keep only the reached features of each source, for large networks: each block starts with the source id (int64), the number of destinations (int32) and the size of the compressed data (int32), followed by the destination ids (int64) and their costs (float32) compressed with zlib.
+    Cache Folder: if a folder is informed, the results are stored in it, identified by a hash of the geometries of the lines, of the selected fields, of the source features and of the analysis type, radius and rule for connecting the lines. When every requested field is found in the cache, the results are written without building the network, unless the origin-destination costs are requested. The connections between the lines and their lengths are also stored, identified by the file of the layer, its modification time and the rule for connecting the lines (the fields written by the analysis itself do not invalidate them), and the next runs with other metrics, radii, analysis types or impedances read them instead of comparing the geometries again. The last networks read are also kept in memory while QGIS is open. Files are only used for layers stored in files without unsaved edits.
+    Cache Size: size of the cache folder, in megabytes, above which the least recently used results and networks are removed.
     Create New Shapefile for Results?: if this field is left blank, the results will be inserted in the existing nodes shapefile. Otherwise, a copy of the existing shapefile will be created containing the results.
     """
     
     #Edges of the network
+    #weights, lengths and metrics are kept in typed arrays indexed by the edge id, the objects only hold the graph structure
     class EdgeObj:
-        def __init__(self, featCount, feat, loadF, supplyF, demandF, impF, analysisType, metricsL):
+        __slots__ = ('id', 'heapPos', 'comp', 'pos', 'neighA')
+        def __init__(self, feat):
             self.id = feat.id()
             self.heapPos = -1 #current position of the edge inside the heap
+            self.comp, self.pos = -1, -1 #connected component of the edge and its position inside it
             self.neighA = [] #list of connected edges
-            self.geom = feat.geometry()
-            self.length = QgsDistanceArea().measureLength(feat.geometry()) if analysisType == 1 else 1
-            
-            #configurational metrics
-            if 0 in metricsL: self.access = 0
-            if 1 in metricsL: self.btw = 0
-            if 2 in metricsL: self.cent = 0
-            if 3 in metricsL: self.opport = 0
-            if 4 in metricsL: self.converg = 0
-            if 5 in metricsL: self.polarity = 0
-            if 6 in metricsL: self.reach = 0
-            
-            self.load, self.supply, self.demand, self.imp = 0,0,0,0
-            if loadF == []: self.load = 1
-            else:
-                for i in range(len(loadF)): 
-                    if feat.attribute(loadF[i]) != NULL: self.load += feat.attribute(loadF[i])
-            if supplyF == []: self.supply = 1
-            else:
-                for i in range(len(supplyF)): 
-                    if feat.attribute(supplyF[i]) != NULL: self.supply += feat.attribute(supplyF[i])
-            if demandF == []: self.demand = 1
-            else:
-                for i in range(len(demandF)): 
-                    if feat.attribute(demandF[i]) != NULL: self.demand += feat.attribute(demandF[i])
-            if impF == []: self.imp = 1
-            else:
-                for i in range(len(impF)): 
-                    if feat.attribute(impF[i]) != NULL: self.imp += feat.attribute(impF[i])
-    
+
+    #sum of the selected fields of a feature, NULL values are ignored and no selected field means 1
+    def fieldsSum(feat, fieldsF):
+        if fieldsF == []: return 1
+        value = 0
+        for i in range(len(fieldsF)):
+            if feat.attribute(fieldsF[i]) != NULL: value += feat.attribute(fieldsF[i])
+        return value
+
     #verifies if highest id number is lower than number of features
     #in order to avoid potential conflicts with matrices' size
     def verifyFeatCount(inputFeat):
@@ -77,8 +95,562 @@ def computeMetrics(instance, parameters, context, feedback, inputs):
         for feat in inputFeat.getFeatures(): featCount = max(featCount, feat.id()+1)
         return featCount
     
+    #Connected Components
+    #shortest paths never leave the component of the source, so each search only uses the edges of that component
+    def buildComponents():
+        compsA = []
+        for root in edgesA:
+            if root.comp != -1: continue
+            root.comp = 0
+            compA, ind = [root], 0
+            while ind < len(compA):
+                for neigh in compA[ind].neighA:
+                    if neigh[0].comp == -1:
+                        neigh[0].comp = 0
+                        compA.append(neigh[0])
+                ind += 1
+            compsA.append(compA)
+        compsA.sort(key = len, reverse = True) #largest components first
+        for ind in range(len(compsA)):
+            for pos in range(len(compsA[ind])): compsA[ind][pos].comp, compsA[ind][pos].pos = ind, pos
+        return compsA
+
+    #compute shortest paths (djikstra algorithm with binary heap as priority queue)
+    def searchFrom(source, doPath, compA):
+    #step 1: heap cretation
+        finitePos = 0
+        costA = [99999999999999 for i in range(len(compA))]
+        costA[source.pos] = 0 #distance from the source edge to itself is zero
+        for ind in range(len(source.neighA)): costA[source.neighA[ind][0].pos] = min(costA[source.neighA[ind][0].pos], source.neighA[ind][1]) #shortest of parallel connections, loops are ignored
+        heap = [compA[0] for i in range(len(set(neigh[0].id for neigh in source.neighA) | {source.id}))]
+        for destin in compA:
+            if costA[destin.pos] == 99999999999999:
+                heap.append(destin)
+                destin.heapPos = len(heap) - 1
+            else:
+                heap[finitePos] = destin
+                destin.heapPos = finitePos
+                n = finitePos
+                finitePos += 1
+                parent = int((n-1)/2)
+                while n !=0 and costA[heap[n].pos] < costA[heap[parent].pos]:
+                    heap[n].heapPos, heap[parent].heapPos = parent, n
+                    heap[n], heap[parent] = heap[parent], heap[n]
+                    n = parent
+                    parent = int((n-1)/2)
+    #step 2 heapsort
+        pivotA = [[] for i in range(len(compA))] #array of pivot edges in shortest paths
+        level = [99999999999999 for i in range(len(compA))]
+        sortedA = []
+        numSP = [0 for i in range(len(compA))]
+        numSP[source.pos], level[source.pos] = 1,0
+        for ind in range(len(source.neighA)):
+            if source.neighA[ind][0] != source and source.neighA[ind][1] == costA[source.neighA[ind][0].pos]:
+                numSP[source.neighA[ind][0].pos] += 1 #each parallel connection of minimum cost is a shortest path
+                level[source.neighA[ind][0].pos] = 1
+        while heap != []:
+            closest = heap[0]
+            if costA[closest.pos] == 99999999999999: break #remaining elements are not connected to the source
+            if costA[closest.pos] <= radius or radius == 0.0: sortedA.append(closest)
+            if finitePos > 0:
+                heap[0].heapPos, heap[finitePos-1].heapPos = finitePos-1, 0
+                heap[0], heap[finitePos-1] = heap[finitePos-1], heap[0]
+                heap[finitePos-1].heapPos, heap[-1].heapPos = len(heap)-1, finitePos-1
+                heap[finitePos-1], heap[-1] = heap[-1], heap[finitePos-1]
+                finitePos -= 1
+            heap.pop(len(heap)-1)
+        
+            n = 0
+            lh = finitePos
+            posChild1, posChild2 = n*2+1, n*2+2
+            if posChild2 <= lh-1:
+                costChild1, costChild2 = costA[heap[n*2+1].pos], costA[heap[n*2+2].pos]
+                if any(x < costA[heap[n].pos] for x in [costChild1,costChild2]):
+                    if costChild1 <= costChild2: sc = posChild1
+                    else: sc = posChild2
+                else: sc = -1
+            elif posChild2 == lh:
+                if costA[heap[n*2+1].pos] < costA[heap[n].pos]: sc = posChild1
+                else: sc = -1
+            else: sc = -1
+            
+            while sc >= 0:
+                heap[n].heapPos, heap[sc].heapPos = sc, n
+                heap[n], heap[sc] = heap[sc], heap[n]
+                n = sc
+                lh = len(heap)
+                posChild1, posChild2 = n*2+1, n*2+2
+                if posChild2 <= lh-1:
+                    costChild1, costChild2 = costA[heap[n*2+1].pos], costA[heap[n*2+2].pos]
+                    if any(x < costA[heap[n].pos] for x in [costChild1,costChild2]):
+                        if costChild1 <= costChild2: sc = posChild1
+                        else: sc = posChild2
+                    else: sc = -1
+                elif posChild2 == lh:
+                    if costA[heap[n*2+1].pos] < costA[heap[n].pos]: sc = posChild1
+                    else: sc = -1
+                else: sc = -1
+            
+            for ind in range(len(closest.neighA)):
+                if closest.neighA[ind][0].heapPos < len(heap):
+                    cost = costA[closest.pos] + closest.neighA[ind][1]
+                    prevCost = costA[closest.neighA[ind][0].pos]
+                    if prevCost > cost and (radius == 0.0 or cost <= radius):
+                        costA[closest.neighA[ind][0].pos], level[closest.neighA[ind][0].pos] = cost, level[closest.pos] + 1
+                        if doPath:
+                            pivotA[closest.neighA[ind][0].pos] = []
+                            pivotA[closest.neighA[ind][0].pos].append(closest)
+                            numSP[closest.neighA[ind][0].pos] = numSP[closest.pos] #paths counted through a previous pivot are no longer shortest
+                    
+                        n = closest.neighA[ind][0].heapPos
+                        if prevCost == 99999999999999: 
+                            heap[finitePos].heapPos, closest.neighA[ind][0].heapPos = n, finitePos
+                            heap[n], heap[finitePos] = heap[finitePos], closest.neighA[ind][0]
+                            n = finitePos
+                            finitePos += 1
+                        parent = int((n-1)/2)
+                        while n !=0 and costA[heap[n].pos] < costA[heap[parent].pos]:
+                            heap[n].heapPos, heap[parent].heapPos = parent, n
+                            heap[n], heap[parent] = heap[parent], heap[n]
+                            n = parent
+                            parent = int((n-1)/2)
+
+                    elif doPath and source.id != closest.id and costA[closest.neighA[ind][0].pos] == cost and (radius == 0.0 or cost <= radius):
+                        pivotA[closest.neighA[ind][0].pos].append(closest)
+                        numSP[closest.neighA[ind][0].pos] += numSP[closest.pos]
+                        level[closest.neighA[ind][0].pos] = min(level[closest.neighA[ind][0].pos], level[closest.pos] + 1) #fewest steps among the shortest paths, regardless of heap order
+        return costA, sortedA, pivotA, numSP, level
+
+    #Degree-2 Chains Contraction
+    #edges with exactly two connections (lines split in consecutive segments) are not inserted in the priority queue
+    #their distances are obtained by walking along the chains that link the remaining edges
+    def buildChains():
+        keptA = [True for i in range(edgesCount)]
+        for edge in edgesA: keptA[edge.id] = len(edge.neighA) != 2 or edge.neighA[0][0] == edge.neighA[1][0]
+        chainOfA = [-1 for i in range(edgesCount)] #chain and position inside the chain of each contracted edge
+        chainPosA = [0 for i in range(edgesCount)]
+        chainsA = [] #[first kept edge, contracted edges, distances between consecutive edges, last kept edge]
+        superA = [[] for i in range(edgesCount)] #connections of the kept edges: [kept edge, -1, distance] or [kept edge, chain, walking forward]
+        
+        def chainFrom(edge):
+            for neigh in edge.neighA:
+                if keptA[neigh[0].id]: superA[edge.id].append([neigh[0], -1, neigh[1]])
+                elif chainOfA[neigh[0].id] == -1:
+                    interiorA, distA = [], [neigh[1]]
+                    prev, cur = edge, neigh[0]
+                    while not keptA[cur.id]:
+                        chainOfA[cur.id], chainPosA[cur.id] = len(chainsA), len(interiorA)
+                        interiorA.append(cur)
+                        nextN = cur.neighA[1] if cur.neighA[0][0] == prev else cur.neighA[0]
+                        distA.append(nextN[1])
+                        prev, cur = cur, nextN[0]
+                    superA[edge.id].append([cur, len(chainsA), True])
+                    superA[cur.id].append([edge, len(chainsA), False])
+                    chainsA.append([edge, interiorA, distA, cur])
+        
+        for edge in edgesA:
+            if keptA[edge.id]: chainFrom(edge)
+        for edge in edgesA: #rings without any kept edge
+            if not keptA[edge.id] and chainOfA[edge.id] == -1:
+                keptA[edge.id] = True
+                chainFrom(edge)
+        compChainsA = [[] for compA in compsA] #chains of each connected component
+        for chain in chainsA: compChainsA[chain[0].comp].append(chain)
+        return keptA, chainOfA, chainPosA, chainsA, superA, compChainsA
+    
+    #same results as searchFrom, with the priority queue restricted to the kept edges
+    def searchContracted(source, doPath, compA):
+        costA = [99999999999999 for i in range(len(compA))]
+        costA[source.pos] = 0
+        queue = []
+        if keptA[source.id]: queue.append((0, source.pos, source))
+        else: #source inside a chain: its ends are reached by walking from the source
+            first, interiorA, distA, last = chainsA[chainOfA[source.id]]
+            cost = 0
+            for i in range(chainPosA[source.id], -1, -1):
+                cost += distA[i]
+                if radius != 0.0 and cost > radius: break
+                edge = interiorA[i-1] if i > 0 else first
+                if cost < costA[edge.pos]: costA[edge.pos] = cost
+            cost = 0
+            for i in range(chainPosA[source.id]+1, len(distA)):
+                cost += distA[i]
+                if radius != 0.0 and cost > radius: break
+                edge = interiorA[i] if i < len(interiorA) else last
+                if cost < costA[edge.pos]: costA[edge.pos] = cost
+            for edge in [first, last]:
+                if costA[edge.pos] != 99999999999999: queue.append((costA[edge.pos], edge.pos, edge))
+            heapq.heapify(queue)
+        
+        #shortest paths between kept edges, chains are walked so the sums are the same of the full search
+        while queue != []:
+            cost, pos, closest = heapq.heappop(queue)
+            if cost > costA[pos]: continue #outdated entry
+            for neigh in superA[closest.id]:
+                if neigh[1] == -1: newCost = cost + neigh[2]
+                else:
+                    newCost = cost
+                    for dist in (chainsA[neigh[1]][2] if neigh[2] else reversed(chainsA[neigh[1]][2])): newCost += dist
+                if newCost < costA[neigh[0].pos] and (radius == 0.0 or newCost <= radius):
+                    costA[neigh[0].pos] = newCost
+                    heapq.heappush(queue, (newCost, neigh[0].pos, neigh[0]))
+        
+        #contracted edges: shortest of the walks from both ends of their chains
+        for first, interiorA, distA, last in compChainsA[source.comp]:
+            cost = costA[first.pos]
+            if cost != 99999999999999:
+                for i in range(len(interiorA)):
+                    cost += distA[i]
+                    if radius != 0.0 and cost > radius: break
+                    if cost < costA[interiorA[i].pos]: costA[interiorA[i].pos] = cost
+            cost = costA[last.pos]
+            if cost != 99999999999999:
+                for i in range(len(interiorA)-1, -1, -1):
+                    cost += distA[i+1]
+                    if radius != 0.0 and cost > radius: break
+                    if cost < costA[interiorA[i].pos]: costA[interiorA[i].pos] = cost
+        
+        #expansion of the shortest paths to all edges
+        sortedA = [edge for edge in compA if costA[edge.pos] != 99999999999999 and (radius == 0.0 or costA[edge.pos] <= radius)]
+        sortedA.sort(key = lambda edge: (costA[edge.pos], edge != source))
+        pivotA = [[] for i in range(len(compA))]
+        level = [0 for i in range(len(compA))]
+        numSP = [0 for i in range(len(compA))]
+        numSP[source.pos] = 1
+        if doPath:
+            orderA = [-1 for i in range(len(compA))]
+            for pos in range(len(sortedA)): orderA[sortedA[pos].pos] = pos
+            for edge in sortedA[1:]:
+                direct, firstPivot = 0, None
+                for neigh in edge.neighA:
+                    if neigh[0] == source:
+                        if neigh[1] == costA[edge.pos]: direct += 1 #parallel connections of minimum cost
+                    elif 0 <= orderA[neigh[0].pos] < orderA[edge.pos] and costA[neigh[0].pos] + neigh[1] == costA[edge.pos]:
+                        pivotA[edge.pos].append(neigh[0])
+                        numSP[edge.pos] += numSP[neigh[0].pos]
+                        if firstPivot == None or level[neigh[0].pos] < level[firstPivot.pos]: firstPivot = neigh[0]
+                if direct > 0: numSP[edge.pos], level[edge.pos] = numSP[edge.pos] + direct, 1
+                elif firstPivot != None: level[edge.pos] = level[firstPivot.pos] + 1
+        return costA, sortedA, pivotA, numSP, level
+
+    #Biconnected Components Decomposition (Puzis et al.)
+    #shortest paths between two edges of a block never leave it, and a cut edge lies on every path between the parts it separates
+    #the betweenness is obtained inside each block, weighting its edges by the number of edges that reach it through them
+    def buildBlocks(isSourceA):
+        disc = [-1 for i in range(edgesCount)] #discovery order of the depth-first search
+        low = [0 for i in range(edgesCount)] #lowest discovery order reachable through the subtree
+        sizeA = [1 for i in range(edgesCount)] #edges in the subtree
+        sizeSA = [isSourceA[i] for i in range(edgesCount)] #source edges in the subtree
+        hangA = [[] for i in range(edgesCount)] #[edges, source edges] of the subtrees separated by each edge
+        blocksA = [] #[edges of the block, weights as target, weights as source]
+        sepA = [0 for i in range(edgesCount)] #pairs separated by each cut edge
+        order = 0
+        for root in edgesA:
+            if disc[root.id] != -1: continue
+            disc[root.id], low[root.id] = order, order
+            order += 1
+            stack, edgeStack, compBlocksA, compA = [[root, 0]], [root], [], [root]
+            while stack != []:
+                edge, ind = stack[-1]
+                if ind < len(edge.neighA):
+                    stack[-1][1] += 1
+                    neigh = edge.neighA[ind][0]
+                    if disc[neigh.id] == -1:
+                        disc[neigh.id], low[neigh.id] = order, order
+                        order += 1
+                        stack.append([neigh, 0])
+                        edgeStack.append(neigh)
+                        compA.append(neigh)
+                    elif disc[neigh.id] < low[edge.id]: low[edge.id] = disc[neigh.id]
+                else:
+                    stack.pop(len(stack)-1)
+                    if stack == []: break
+                    parent = stack[-1][0]
+                    if low[edge.id] < low[parent.id]: low[parent.id] = low[edge.id]
+                    sizeA[parent.id] += sizeA[edge.id]
+                    sizeSA[parent.id] += sizeSA[edge.id]
+                    if low[edge.id] >= disc[parent.id]: #parent separates the subtree of edge from the rest of the network
+                        hangA[parent.id].append([sizeA[edge.id], sizeSA[edge.id]])
+                        blockA = [parent]
+                        while blockA[-1] != edge: blockA.append(edgeStack.pop(len(edgeStack)-1))
+                        compBlocksA.append([blockA, sizeA[edge.id], sizeSA[edge.id]])
+            n, nS = sizeA[root.id], sizeSA[root.id]
+            for edge in compA:
+                partsA = hangA[edge.id] + [[n - 1 - sum(part[0] for part in hangA[edge.id]), nS - isSourceA[edge.id] - sum(part[1] for part in hangA[edge.id])]]
+                sepA[edge.id] = ((nS - isSourceA[edge.id])*(n - 1) - sum(part[0]*part[1] for part in partsA))/2
+            for blockA, sizeC, sizeSC in compBlocksA:
+                if len(blockA) < 3: continue #a single connection has no intermediate edge
+                weightA = [n - sizeC] + [1 + sum(part[0] for part in hangA[edge.id]) for edge in blockA[1:]]
+                weightSA = [nS - sizeSC] + [isSourceA[edge.id] + sum(part[1] for part in hangA[edge.id]) for edge in blockA[1:]]
+                blocksA.append([blockA, weightA, weightSA])
+        return blocksA, sepA
+
+    def blockBetweenness(isSourceA):
+        blocksA, sepA = buildBlocks(isSourceA)
+        for edge in edgesA: btwA[edge.id] += sepA[edge.id]
+        blockOf = [-1 for i in range(edgesCount)]
+        weightOf = [0 for i in range(edgesCount)]
+        for bInd in range(len(blocksA)):
+            blockA, weightA, weightSA = blocksA[bInd]
+            for ind in range(len(blockA)): blockOf[blockA[ind].id], weightOf[blockA[ind].id] = bInd, weightA[ind]
+            for ind in range(len(blockA)):
+                if weightSA[ind] == 0: continue
+                source = blockA[ind]
+                costA, numSP, pivotA = {source.id: 0}, {source.id: 1}, {source.id: []}
+                sortedA, heap, done = [], [(0, source.id, source)], set()
+                while heap != []:
+                    cost, nid, closest = heapq.heappop(heap)
+                    if nid in done: continue
+                    done.add(nid)
+                    sortedA.append(closest)
+                    for neigh, dist in closest.neighA:
+                        if blockOf[neigh.id] != bInd or neigh.id in done: continue
+                        newCost = cost + dist
+                        if neigh.id not in costA or newCost < costA[neigh.id]:
+                            costA[neigh.id], numSP[neigh.id], pivotA[neigh.id] = newCost, numSP[nid], [closest]
+                            heapq.heappush(heap, (newCost, neigh.id, neigh))
+                        elif newCost == costA[neigh.id]:
+                            numSP[neigh.id] += numSP[nid]
+                            pivotA[neigh.id].append(closest)
+                btwTemp = {}
+                for farest in reversed(sortedA):
+                    acc = btwTemp.get(farest.id, 0)
+                    for neigh in pivotA[farest.id]: btwTemp[neigh.id] = btwTemp.get(neigh.id, 0) + (numSP[neigh.id]/numSP[farest.id])*(weightOf[farest.id] + acc)
+                    if farest != source: btwA[farest.id] += weightSA[ind]*acc/2
+        return len(blocksA)
+
+    #load-weighted distribution of the costs from a source: mean, percentiles and load within each distance band
+    #pairsA holds the cost and the load of each destination, sources without load around them have no mean or percentiles
+    def distanceStats(pairsA):
+        pairsA = sorted(pair for pair in pairsA if pair[1] != 0)
+        total = sum(pair[1] for pair in pairsA)
+        if total <= 0: return [float('nan') for perc in percL] + [float('nan')] + [0 for band in bandsL]
+        percA, cumul = [], 0
+        for cost, weight in pairsA:
+            cumul += weight
+            while len(percA) < len(percL) and cumul >= percL[len(percA)]*total/100: percA.append(cost)
+        percA += [pairsA[-1][0] for perc in percL[len(percA):]] #rounding of the cumulative load
+        return [sum(cost*weight for cost, weight in pairsA)/total] + percA + [sum(weight for cost, weight in pairsA if cost <= band) for band in bandsL]
+
+    #Origin-Destination Costs Export
+    #dense matrix: float32 costs in rows and columns ordered by feature id, infinity for pairs not connected within the radius
+    #compressed blocks: for each source, its id (int64), number of destinations (int32), size of the block (int32) and a zlib block with the destination ids (int64) followed by their costs (float32)
+    def openOD(rowSize):
+        odFile = open(odPath, 'w+b')
+        if odFormat == 0:
+            if rowSize > 20000: feedback.pushWarning(f'The dense matrix will take {rowSize*rowSize*4/1073741824:.1f} GB, compressed blocks are recommended for large networks')
+            noPathA = array('f', [float('inf')])*rowSize
+            for ind in range(rowSize): noPathA.tofile(odFile)
+        return odFile
+
+    #costs of one source, streamed while the analysis runs
+    def writeODRow(odFile, rowSize, sourceId, pairsA):
+        pairsA = [pair for pair in pairsA if radius == 0.0 or pair[1] <= radius]
+        if odFormat == 0:
+            rowA = array('f', [float('inf')])*rowSize
+            for destin, cost in pairsA: rowA[destin] = cost
+            odFile.seek(sourceId*rowSize*rowA.itemsize)
+            rowA.tofile(odFile)
+        else:
+            block = zlib.compress(array('q', [pair[0] for pair in pairsA]).tobytes() + array('f', [pair[1] for pair in pairsA]).tobytes())
+            odFile.write(struct.pack('=qii', sourceId, len(pairsA), len(block)) + block)
+
+    #Results Cache
+    #each file holds the values of one field indexed by the feature id, NaN for the features without value
+    #files are named by a hash of everything the results depend on, their modification time marks their last use
+    def cacheKey():
+        digest = hashlib.sha256(repr(["GAUS_l11", analysisType, radius, geomR, distArea.ellipsoid(), vertexTol if geomR == 0 else 0.0, exactCheck if geomR == 0 else True, impField, loadField, supplyField, demandField, sorted(sourceIds) if sourceIds != None else None]).encode())
+        for feat in inputEdges.getFeatures():
+            digest.update(repr([feat.id()] + [feat.attribute(name) for name in impField + loadField + supplyField + demandField]).encode())
+            digest.update(bytes(feat.geometry().asWkb()))
+        return digest.hexdigest()
+
+    def cachePath(code):
+        return os.path.join(cacheFolder, f'{cacheHash}_{code if code[:2] != "Bd" else "Bd" + repr(bandsL[int(code[2:])-1])}.bin')
+
+    #values of the requested fields, None if any of them is not in the cache
+    def readCache():
+        if any(not os.path.isfile(cachePath(code)) for code in fieldCodesL): return None
+        valuesD = {}
+        for code in fieldCodesL:
+            valuesD[code] = array('d')
+            with open(cachePath(code), 'rb') as cacheFile: valuesD[code].frombytes(cacheFile.read())
+            os.utime(cachePath(code))
+        return valuesD
+
+    def writeCache(valuesD):
+        for code, valueA in valuesD.items():
+            with open(cachePath(code), 'wb') as cacheFile: valueA.tofile(cacheFile)
+        evictCache(cacheHash)
+
+    #least recently used files removed while the folder is larger than the cache size, except the ones just written
+    def evictCache(keptPrefix):
+        filesA = sorted([os.path.getmtime(path), os.path.getsize(path), path] for path in [os.path.join(cacheFolder, name) for name in os.listdir(cacheFolder) if name.endswith('.bin')])
+        total = sum(fileA[1] for fileA in filesA)
+        for mtime, size, path in filesA:
+            if total <= cacheSize*1048576: break
+            if os.path.basename(path).startswith(keptPrefix): continue
+            os.remove(path)
+            total -= size
+
+    #Length Calculator
+    #a single calculator for every line: planar lengths in the units of the layer for projected systems, ellipsoidal lengths in meters for geographic systems
+    def lengthCalculator(layer):
+        distArea = QgsDistanceArea()
+        if layer.crs().isGeographic():
+            distArea.setSourceCrs(layer.crs(), context.transformContext())
+            distArea.setEllipsoid(context.ellipsoid() if context.ellipsoid() not in ('', 'NONE') else layer.crs().ellipsoidAcronym())
+        return distArea
+
+    #Overlapping Vertices by Hashing
+    #the vertices are bucketed by their coordinates (cells of the tolerance size), and an end of a line can only touch the lines with a vertex in its cell or in the cells around it
+    #returns the pairs of positions of the connected lines among the positions of posL, only the pairs of the tile when it is informed
+    def vertexPairs(geomsA, posL, tile):
+        def cellOf(vertex):
+            return (vertex.x(), vertex.y()) if vertexTol == 0.0 else (math.floor(vertex.x()/vertexTol), math.floor(vertex.y()/vertexTol))
+
+        cellsD = {} #lines with a vertex in each cell and the coordinates of the vertex
+        endsD = {} #ends of the parts of each line
+        for pos in posL:
+            partsA = geomsA[pos].asMultiPolyline() if geomsA[pos].isMultipart() else [geomsA[pos].asPolyline()]
+            for part in partsA:
+                for vertex in part: cellsD.setdefault(cellOf(vertex), []).append((pos, vertex.x(), vertex.y()))
+            endsD[pos] = [vertex for part in partsA if part != [] for vertex in [part[0], part[-1]]]
+        pairsS = set()
+        for pos in posL:
+            for vertex in endsD[pos]:
+                cellX, cellY = cellOf(vertex)
+                for cell in ([(cellX, cellY)] if vertexTol == 0.0 else [(cellX + dx, cellY + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]):
+                    for other, x, y in cellsD.get(cell, []):
+                        if other != pos and (vertexTol == 0.0 or (x - vertex.x())**2 + (y - vertex.y())**2 <= vertexTol**2): pairsS.add((min(pos, other), max(pos, other)))
+        if tile != None: pairsS = set(pair for pair in pairsS if pairTile(pair[0], pair[1]) == tile)
+        if exactCheck: pairsS = set(pair for pair in pairsS if geomsA[pair[1]].touches(geomsA[pair[0]]))
+        return pairsS
+
+    #Crossing Lines by Spatial Index
+    #only the lines with intersecting bounding boxes are candidates, tested by a prepared geometry of each line
+    #one relate gives the DE-9IM matrix of both rules: crossing lines meet at points of their interiors, touching lines only meet at their boundaries
+    #returns the pairs of positions of the connected lines among the positions of posL, only the pairs of the tile when it is informed
+    def crossingPairs(geomsA, posL, tile):
+        spaceIndex = QgsSpatialIndex()
+        for pos in posL:
+            if not geomsA[pos].isEmpty(): spaceIndex.addFeature(pos, geomsA[pos].boundingBox())
+        pairsS = set()
+        for count in range(len(posL)):
+            pos = posL[count]
+            if tile == None and count % 1000 == 0: feedback.pushInfo(f'Crossing Lines: Testing Edge {pos}')
+            if geomsA[pos].isEmpty(): continue
+            engine = QgsGeometry.createGeometryEngine(geomsA[pos].constGet())
+            engine.prepareGeometry()
+            for other in spaceIndex.intersects(geomsA[pos].boundingBox()):
+                if other <= pos or (tile != None and pairTile(pos, other) != tile) or not engine.intersects(geomsA[other].constGet()): continue
+                matrix = engine.relate(geomsA[other].constGet())
+                if matrix[0] == '0' or (geomR == 2 and matrix[0] == 'F' and matrix[1] + matrix[3] + matrix[4] != 'FFF'): pairsS.add((pos, other))
+        return pairsS
+
+    #Parallel Construction by Tiles
+    #the extent of the lines is divided in tiles, and each line is assigned to every tile that its bounding box (grown by the tolerance) overlaps
+    #a pair belongs to the tile with the lower left corner of the intersection of their boxes, which holds both lines, so it is only tested there
+    def tileOf(x, y):
+        return (min(int((x - gridA[0])/gridA[2]), tileCount - 1), min(int((y - gridA[1])/gridA[3]), tileCount - 1))
+
+    def pairTile(pos, other):
+        return tileOf(max(boxesA[pos].xMinimum(), boxesA[other].xMinimum()), max(boxesA[pos].yMinimum(), boxesA[other].yMinimum()))
+
+    #connections of a share of the tiles inside a forked process
+    def pairsShare(tilesL, queue):
+        try:
+            for tile, posL in tilesL: queue.put(sorted(vertexPairs(geomsA, posL, tile) if geomR == 0 else crossingPairs(geomsA, posL, tile)))
+        except Exception as error: queue.put(f'{type(error).__name__}: {error}') #failure of the share, reported by the main process
+        finally: queue.put(None)
+
+    #Network Build Cache
+    #the connections between the lines only depend on their geometries and on the rule for connecting them
+    #they are kept as adjacency arrays (CSR) by the position of the edges in the layer: their ids, offsets, connected positions and geodetic lengths
+    #connections keep the order of the layer, so the searches find the same paths as in a network built from the geometries
+    def networkKey():
+        path = inputEdges.source().split('|')[0]
+        if not os.path.isfile(path) or inputEdges.isModified(): return None #unsaved edits are not in the file
+        return hashlib.sha256(repr(["GAUS_l11", geomR, distArea.ellipsoid(), vertexTol if geomR == 0 else 0.0, exactCheck if geomR == 0 else True, inputEdges.source(), os.path.getmtime(path), inputEdges.featureCount()]).encode()).hexdigest()
+
+    def keepNetwork(key, arraysL):
+        networksD[key] = arraysL
+        networksD.move_to_end(key)
+        while len(networksD) > 4: networksD.popitem(last = False)
+
+    #arrays of a network from the memory or from the cache folder, None if it was not stored
+    def loadNetwork(key):
+        if key in networksD:
+            networksD.move_to_end(key)
+            return networksD[key]
+        path = os.path.join(cacheFolder, f'net_{key}.bin')
+        if not os.path.isfile(path): return None
+        arraysL = []
+        with open(path, 'rb') as netFile:
+            header = netFile.read(9)
+            while header != b'':
+                typecode, count = struct.unpack('=cq', header)
+                arraysL.append(array(typecode.decode()))
+                arraysL[-1].fromfile(netFile, count)
+                header = netFile.read(9)
+        os.utime(path)
+        keepNetwork(key, arraysL)
+        return arraysL
+
+    #each array is written after its type and size
+    def saveNetwork(key, arraysL):
+        with open(os.path.join(cacheFolder, f'net_{key}.bin'), 'wb') as netFile:
+            for valueA in arraysL:
+                netFile.write(struct.pack('=cq', valueA.typecode.encode(), len(valueA)))
+                valueA.tofile(netFile)
+        keepNetwork(key, arraysL)
+        evictCache(f'net_{key}')
+
+    #the fields written by an analysis do not change its connections, which are kept under the key of the files after the writing
+    def renewNetwork(key):
+        newKey = networkKey()
+        if newKey == None or newKey == key: return
+        path = os.path.join(cacheFolder, f'net_{key}.bin')
+        if os.path.isfile(path): os.replace(path, os.path.join(cacheFolder, f'net_{newKey}.bin'))
+        if key in networksD: keepNetwork(newKey, networksD.pop(key))
+
+    #first free name of a result field from suffix 0 to 9, the field of suffix 9 is reused when all of them are taken
+    #the same names are used by the analysis and by the results served from the cache
+    def fieldName(prefix):
+        aux = 0
+        while inputEdges.fields().indexFromName(prefix + str(aux)) != -1 and aux < 9: aux += 1
+        return prefix + str(aux)
+
+    #results served from the cache, written in new fields as in the analysis
+    def writeCached(valuesD):
+        strBegin = "T" if analysisType == 0 else "G"
+        strMid = "g" if radius == 0.0 else str(int(radius))
+        if len(strMid) > 5: strBegin += strMid[0:5]
+        else: strBegin += strMid
+        indexD = {}
+        for code in fieldCodesL:
+            name = fieldName(strBegin + code)
+            inputEdges.dataProvider().addAttributes([QgsField(name,QVariant.Double)])
+            inputEdges.updateFields()
+            indexD[code] = inputEdges.fields().indexFromName(name)
+            if code[:2] == "Bd": inputEdges.setFieldAlias(indexD[code], name + f" (load within {bandsL[int(code[2:])-1]:g})")
+            if sourceIds != None and code in ["Btw", "Cen", "Cvg", "Pol"]: inputEdges.setFieldAlias(indexD[code], inputEdges.fields()[indexD[code]].name() + " (sources subset)")
+        changesD = {}
+        for feat in inputEdges.getFeatures():
+            metricsD = {indexD[code]: valuesD[code][feat.id()] for code in fieldCodesL if feat.id() < len(valuesD[code]) and not math.isnan(valuesD[code][feat.id()])}
+            if metricsD != {}: changesD[feat.id()] = metricsD
+        inputEdges.dataProvider().changeAttributeValues(changesD)
+        feedback.pushInfo(f'Results Cache: {len(fieldCodesL)} Fields Read for {len(changesD)} Edges')
+
+        if outPath != "":
+            crs = QgsProject.instance().crs()
+            writer = QgsVectorFileWriter.writeAsVectorFormat(inputEdges, outPath, "System", crs, "ESRI Shapefile")
+            inputEdges.dataProvider().deleteAttributes(list(indexD.values()))
+            inputEdges.updateFields()
+
     #import input parameters
     inputEdges = instance.parameterAsVectorLayer(parameters, 'inpLines', context) #edges vector layer
+    distArea = lengthCalculator(inputEdges) #single calculator of the lengths of the lines
     metricsL = instance.parameterAsEnums(parameters, 'metrics', context)
     impField = instance.parameterAsFields(parameters, 'impedance', context) #shp column with impedance values
     loadField = instance.parameterAsFields(parameters, 'load', context) #shp column with potential value
@@ -87,157 +659,236 @@ def computeMetrics(instance, parameters, context, feedback, inputs):
     analysisType = instance.parameterAsEnum(parameters, 'analysis', context) #indication if analysis is topo or geom
     radius = instance.parameterAsDouble(parameters, 'radius', context) #radius of the analysis
     geomR = instance.parameterAsEnum(parameters, 'geomrule', context) #chosen rule for geometry connection
+    vertexTol = instance.parameterAsDouble(parameters, 'vertextol', context) #tolerance of the overlapping vertices
+    exactCheck = instance.parameterAsBool(parameters, 'exactcheck', context) #touches test of the lines with overlapping vertices
+    workers = max(1, instance.parameterAsInt(parameters, 'workers', context)) #processes that find the connections of the lines
     outPath = instance.parameterAsOutputLayer(parameters, 'dest', context) #path where results will be saved
+    sourceSet = instance.parameterAsEnum(parameters, 'sources', context) #all, selected or filtered features as sources
+    sourceExpr = instance.parameterAsExpression(parameters, 'sourceexpr', context)
+    contract = instance.parameterAsBool(parameters, 'contract', context) #contraction of degree-2 chains
+    blocks = instance.parameterAsBool(parameters, 'blocks', context) #betweenness by biconnected components
+    odPath = instance.parameterAsFileOutput(parameters, 'odfile', context) #export of the origin-destination costs
+    odFormat = instance.parameterAsEnum(parameters, 'odformat', context)
+    distStats = instance.parameterAsBool(parameters, 'diststats', context) #distribution of the distances from each source
+    try: bandsL = sorted(float(band) for band in instance.parameterAsString(parameters, 'bands', context).split(',') if band.strip() != '')
+    except ValueError:
+        feedback.reportError('The distance bands must be numbers separated by commas')
+        return
+    if len(bandsL) > 9:
+        feedback.pushWarning('Only the first 9 distance bands are used')
+        bandsL = bandsL[:9]
+    percL = [25, 50, 75, 90] #percentiles of the distance distribution
+    statsCodes = ["Dav"] + ["P" + str(perc) for perc in percL] + ["Bd" + str(ind+1) for ind in range(len(bandsL))]
+    doSearches = metricsL != [7] or odPath != "" or distStats #shortest paths are needed
+    cacheFolder = instance.parameterAsFile(parameters, 'cachefolder', context) #folder of the results cache, empty when it is not used
+    cacheSize = instance.parameterAsDouble(parameters, 'cachesize', context)
+    codesL = ["Acc","Btw","Cen","Opp","Cvg","Pol","Rea","Cnc"]
+    fieldCodesL = [codesL[metric] for metric in metricsL] + (statsCodes if distStats else []) #codes of the result fields of the edges
+
+    #source edges of the shortest paths
+    sourceIds = None #None means that every edge is a source
+    if sourceSet == 1: sourceIds = set(inputEdges.selectedFeatureIds())
+    elif sourceSet == 2 and sourceExpr != "": sourceIds = set(feat.id() for feat in inputEdges.getFeatures(QgsFeatureRequest().setFilterExpression(sourceExpr)))
+
+    #results served from the cache when every field is found, without building the network
+    if cacheFolder != "":
+        os.makedirs(cacheFolder, exist_ok = True)
+        cacheHash = cacheKey()
+        cachedD = readCache() if odPath == "" else None
+        if cachedD != None:
+            netKey = networkKey()
+            writeCached(cachedD)
+            if netKey != None: renewNetwork(netKey)
+            return
+        feedback.pushInfo(f'Results Cache: Results Not Found, They Will Be Stored as {cacheHash[:12]}')
     
     #edges initialization
     edgesCount = verifyFeatCount(inputEdges)
     edgesA = [] #array that stores network edges
-    for edge in inputEdges.getFeatures():
+    loadA, supplyA, demandA = [array('d', [0])*edgesCount for i in range(3)] #load, supply and demand of each edge, indexed by its id
+    metricA = [array('d', [0])*edgesCount if metric in metricsL else None for metric in range(7)] #one accumulator per metric, indexed by the edge id
+    accessA, btwA, centA, opportA, convergA, polarityA, reachA = metricA
+    statsA = [array('d', [float('nan')])*edgesCount for code in statsCodes] if distStats else [] #distance distribution of each source
+    impA, lengthA = array('d', [0])*edgesCount, array('d', [0])*edgesCount
+    netKey = networkKey() if cacheFolder != "" else None
+    networkA = loadNetwork(netKey) if netKey != None else None
+    if networkA != None and list(networkA[0]) != [edge.id() for edge in inputEdges.getFeatures(QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry))]: networkA = None #features changed since it was stored
+    geomsA = [] #geometries of the edges, only used to find their connections
+    adjL, baseA = [], array('d') #connections and geodetic lengths of the edges, stored in the cache
+    for edge in inputEdges.getFeatures(QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry) if networkA != None else QgsFeatureRequest()):
         if edge.id() % 50 == 0: feedback.pushInfo(f'Initializing Edge {edge.id()}')
-        edgesA.append(EdgeObj(edgesCount, edge, loadField, supplyField, demandField, impField, analysisType, metricsL))
-        for i in range(len(edgesA)-1):
-            if (geomR==0 and edgesA[-1].geom.touches(edgesA[i].geom)) or (geomR==1 and edgesA[-1].geom.crosses(edgesA[i].geom)) or (geomR==2 and (edgesA[-1].geom.crosses(edgesA[i].geom) or edgesA[-1].geom.touches(edgesA[i].geom))):
-                    dist = (edgesA[-1].imp*edgesA[-1].length + edgesA[i].imp*edgesA[i].length)/2
-                    if dist <= radius or radius == 0.0:
-                        edgesA[-1].neighA.append([edgesA[i], dist])
-                        edgesA[i].neighA.append([edgesA[-1], dist])
+        edgesA.append(EdgeObj(edge))
+        loadA[edge.id()], supplyA[edge.id()], demandA[edge.id()] = fieldsSum(edge, loadField), fieldsSum(edge, supplyField), fieldsSum(edge, demandField)
+        impA[edge.id()] = fieldsSum(edge, impField)
+        if networkA != None:
+            lengthA[edge.id()] = networkA[3][len(edgesA)-1] if analysisType == 1 else 1
+            continue
+        geomsA.append(edge.geometry())
+        lengthA[edge.id()] = distArea.measureLength(edge.geometry()) if analysisType == 1 else 1
+        if netKey != None:
+            adjL.append([])
+            baseA.append(lengthA[edge.id()] if analysisType == 1 else distArea.measureLength(edge.geometry()))
+    if networkA == None:
+        #connections found after all lines are read, sorted pairs keep the connections of each edge in the order of the layer, as in the comparison of every pair
+        if workers > 1 and 'fork' in multiprocessing.get_all_start_methods() and len(geomsA) > 1:
+            boxesA = [geom.boundingBox().buffered(vertexTol if geomR == 0 else 0.0) for geom in geomsA]
+            fullL = [pos for pos in range(len(geomsA)) if not geomsA[pos].isEmpty()]
+            tileCount = math.ceil(math.sqrt(4*workers)) #tiles per side, several per process to balance their work
+            gridA = [min(boxesA[pos].xMinimum() for pos in fullL), min(boxesA[pos].yMinimum() for pos in fullL)] if fullL != [] else [0.0, 0.0]
+            gridA += [(max([boxesA[pos].xMaximum() for pos in fullL] + [gridA[0]]) - gridA[0])/tileCount or 1.0, (max([boxesA[pos].yMaximum() for pos in fullL] + [gridA[1]]) - gridA[1])/tileCount or 1.0]
+            tilesD = {} #positions of the lines of each tile
+            for pos in fullL:
+                tileX1, tileY1 = tileOf(boxesA[pos].xMinimum(), boxesA[pos].yMinimum())
+                tileX2, tileY2 = tileOf(boxesA[pos].xMaximum(), boxesA[pos].yMaximum())
+                for tileX in range(tileX1, tileX2 + 1):
+                    for tileY in range(tileY1, tileY2 + 1): tilesD.setdefault((tileX, tileY), []).append(pos)
+            tilesL = sorted(tilesD.items(), key = lambda item: -len(item[1])) #largest tiles first
+            feedback.pushInfo(f'Parallel Construction: {len(tilesL)} Tiles in {workers} Processes')
+            ctx = multiprocessing.get_context('fork')
+            queue = ctx.Queue()
+            procL = [ctx.Process(target=pairsShare, args=(tilesL[w::workers], queue)) for w in range(workers)]
+            for proc in procL: proc.start()
+            pairsS, finished, failedL = set(), 0, [] #pairs of every tile, a pair found twice is only kept once
+            while finished < len(procL):
+                try: item = queue.get(timeout=1)
+                except Empty:
+                    if any(proc.exitcode not in (None, 0) for proc in procL): break #a process ended without finishing its share
+                    continue
+                if item == None: finished += 1
+                elif isinstance(item, str): failedL.append(item)
+                else: pairsS.update(item)
+            if failedL != [] or finished < len(procL):
+                for proc in procL: proc.terminate()
+            for proc in procL: proc.join()
+            if failedL != [] or any(proc.exitcode != 0 for proc in procL):
+                feedback.pushWarning('Parallel construction failed (' + (failedL[0] if failedL != [] else f'exit code {[proc.exitcode for proc in procL]}') + '), the connections will be found in a single process')
+                pairsS = None
+            del boxesA, tilesD, tilesL
+        else:
+            if workers > 1: feedback.pushWarning('Forking processes is not available in this system, the connections will be found in a single process')
+            pairsS = None
+        if pairsS == None: pairsS = vertexPairs(geomsA, range(len(geomsA)), None) if geomR == 0 else crossingPairs(geomsA, range(len(geomsA)), None)
+        pairsA = sorted(pairsS)
+        del pairsS
+        feedback.pushInfo(f'{["Overlapping Vertices", "Crossing Lines", "Overlapping Vertices + Crossing Lines"][geomR]}: {len(pairsA)} Connections Found')
+        for pos1, pos2 in pairsA:
+            if netKey != None:
+                adjL[pos1].append(pos2)
+                adjL[pos2].append(pos1)
+            dist = (impA[edgesA[pos1].id]*lengthA[edgesA[pos1].id] + impA[edgesA[pos2].id]*lengthA[edgesA[pos2].id])/2
+            if dist <= radius or radius == 0.0:
+                edgesA[pos1].neighA.append([edgesA[pos2], dist])
+                edgesA[pos2].neighA.append([edgesA[pos1], dist])
+        del pairsA
+    del geomsA #the geometries are not kept during the analysis
+    if networkA != None:
+        #connections read from the cache, with the impedances and the radius of this analysis
+        idsA, offsetA, targetA, baseA = networkA
+        for pos in range(len(edgesA)):
+            edge = edgesA[pos]
+            for slot in range(offsetA[pos], offsetA[pos+1]):
+                other = edgesA[targetA[slot]]
+                dist = (impA[edge.id]*lengthA[edge.id] + impA[other.id]*lengthA[other.id])/2
+                if dist <= radius or radius == 0.0: edge.neighA.append([other, dist])
+        feedback.pushInfo(f'Network Cache: {len(targetA)//2} Connections Read')
+    elif netKey != None:
+        offsetA = array('q', [0])
+        for neighL in adjL: offsetA.append(offsetA[-1] + len(neighL))
+        saveNetwork(netKey, [array('q', [edge.id for edge in edgesA]), offsetA, array('q', [pos for neighL in adjL for pos in neighL]), baseA])
+        feedback.pushInfo(f'Network Cache: {offsetA[-1]//2} Connections Stored')
+    del adjL
 
-    #compute shortest paths (djikstra algorithm with binary heap as priority queue)
-    #step 1: heap cretation
-    if metricsL != [7]:
-        for source in edgesA:
+    #source edges of the shortest paths
+    if sourceIds == None: sourcesA = edgesA
+    else:
+        sourcesA = [edge for edge in edgesA if edge.id in sourceIds]
+        feedback.pushInfo(f'{len(sourcesA)} of {len(edgesA)} Edges Used as Sources')
+        if sourcesA == []: feedback.pushWarning('No edge matches the source features option, no shortest path will be computed')
+
+    compsA = buildComponents()
+    isolated = len([compA for compA in compsA if len(compA) == 1])
+    sizesA = [str(len(compA)) for compA in compsA if len(compA) > 1]
+    feedback.pushInfo(f'{len(sizesA)} Connected Components (Sizes: ' + ', '.join(sizesA[:10]) + (', ...' if len(sizesA) > 10 else '') + f'), {isolated} Isolated Edges')
+
+    if contract and doSearches:
+        keptA, chainOfA, chainPosA, chainsA, superA, compChainsA = buildChains()
+        feedback.pushInfo(f'Chain Contraction: {edgesCount - keptA.count(True)} Edges Contracted in {len([chain for chain in chainsA if chain[1] != []])} Chains')
+
+    #betweenness computed from the biconnected components, which requires all pairs to be considered
+    btwBlocks = blocks and 1 in metricsL and radius == 0.0
+    if blocks and 1 in metricsL and radius != 0.0: feedback.pushWarning('Biconnected components are only used in global analysis, betweenness will be computed from the shortest paths')
+    if btwBlocks:
+        isSourceA = [0]*edgesCount #indexed by the edge id
+        for edge in edgesA:
+            if sourceIds == None or edge.id in sourceIds: isSourceA[edge.id] = 1
+        feedback.pushInfo(f'Biconnected Components: Betweenness Computed in {blockBetweenness(isSourceA)} Blocks')
+
+    #Compute Shortest Paths
+    if doSearches:
+        if odPath != "": odFile = openOD(edgesCount)
+        skippedSearches, distSearches, prunedAcc = 0, 0, 0 #work avoided by the weight-aware pruning
+        for source in sorted(sourcesA, key = lambda edge: edge.comp): #largest components first
+            compA = compsA[source.comp]
             if source.id % 50 == 0: feedback.pushInfo(f'Shortest Paths Edge {source.id}')
-            finitePos = 0
-            costA = [99999999999999 for i in range(edgesCount)]
-            costA[source.id] = 0 #distance from the source edge to itself is zero
-            for ind in range(len(source.neighA)): costA[source.neighA[ind][0].id] = source.neighA[ind][1]
-            heap = [edgesA[0] for i in range(len(source.neighA) + 1)]
-            for destin in edgesA:
-                if costA[destin.id] == 99999999999999:
-                    heap.append(destin)
-                    destin.heapPos = len(heap) - 1
-                else:
-                    heap[finitePos] = destin
-                    destin.heapPos = finitePos
-                    n = finitePos
-                    finitePos += 1
-                    parent = int((n-1)/2)
-                    while n !=0 and costA[heap[n].id] < costA[heap[parent].id]:
-                        heap[n].heapPos, heap[parent].heapPos = parent, n
-                        heap[n], heap[parent] = heap[parent], heap[n]
-                        n = parent
-                        parent = int((n-1)/2)
-    #step 2 heapsort
-            pivotA = [[] for i in range(edgesCount)] #array of pivot edges in shortest paths
-            level = [99999999999999 for i in range(edgesCount)]
-            sortedA = []
-            numSP = [0 for i in range(edgesCount)]
-            numSP[source.id], level[source.id] = 1,0
-            for ind in range(len(source.neighA)):
-                numSP[source.neighA[ind][0].id] = 1
-                level[source.neighA[ind][0].id] = 1
-            while heap != []:
-                closest = heap[0]
-                if costA[closest.id] <= radius or radius == 0.0: sortedA.append(closest)
-                if finitePos > 0:
-                    heap[0].heapPos, heap[finitePos-1].heapPos = finitePos-1, 0
-                    heap[0], heap[finitePos-1] = heap[finitePos-1], heap[0]
-                    heap[finitePos-1].heapPos, heap[-1].heapPos = len(heap)-1, finitePos-1
-                    heap[finitePos-1], heap[-1] = heap[-1], heap[finitePos-1]
-                    finitePos -= 1
-                heap.pop(len(heap)-1)
-            
-                n = 0
-                lh = finitePos
-                posChild1, posChild2 = n*2+1, n*2+2
-                if posChild2 <= lh-1:
-                    costChild1, costChild2 = costA[heap[n*2+1].id], costA[heap[n*2+2].id]
-                    if any(x < costA[heap[n].id] for x in [costChild1,costChild2]):
-                        if costChild1 <= costChild2: sc = posChild1
-                        else: sc = posChild2
-                    else: sc = -1
-                elif posChild2 == lh:
-                    if costA[heap[n*2+1].id] < costA[heap[n].id]: sc = posChild1
-                    else: sc = -1
-                else: sc = -1
-                
-                while sc >= 0:
-                    heap[n].heapPos, heap[sc].heapPos = sc, n
-                    heap[n], heap[sc] = heap[sc], heap[n]
-                    n = sc
-                    lh = len(heap)
-                    posChild1, posChild2 = n*2+1, n*2+2
-                    if posChild2 <= lh-1:
-                        costChild1, costChild2 = costA[heap[n*2+1].id], costA[heap[n*2+2].id]
-                        if any(x < costA[heap[n].id] for x in [costChild1,costChild2]):
-                            if costChild1 <= costChild2: sc = posChild1
-                            else: sc = posChild2
-                        else: sc = -1
-                    elif posChild2 == lh:
-                        if costA[heap[n*2+1].id] < costA[heap[n].id]: sc = posChild1
-                        else: sc = -1
-                    else: sc = -1
-                
-                for ind in range(len(closest.neighA)):
-                    if closest.neighA[ind][0].heapPos < len(heap):
-                        cost = costA[closest.id] + closest.neighA[ind][1]
-                        prevCost = costA[closest.neighA[ind][0].id]
-                        if prevCost > cost and (radius == 0.0 or cost <= radius):
-                            costA[closest.neighA[ind][0].id], level[closest.neighA[ind][0].id] = cost, level[closest.id] + 1
-                            pivotA[closest.neighA[ind][0].id] = []
-                            pivotA[closest.neighA[ind][0].id].append(closest)
-                            numSP[closest.neighA[ind][0].id] += numSP[closest.id]
-                        
-                            n = closest.neighA[ind][0].heapPos
-                            if prevCost == 99999999999999: 
-                                heap[finitePos].heapPos, closest.neighA[ind][0].heapPos = n, finitePos
-                                heap[n], heap[finitePos] = heap[finitePos], closest.neighA[ind][0]
-                                n = finitePos
-                                finitePos += 1
-                            parent = int((n-1)/2)
-                            while n !=0 and costA[heap[n].id] < costA[heap[parent].id]:
-                                heap[n].heapPos, heap[parent].heapPos = parent, n
-                                heap[n], heap[parent] = heap[parent], heap[n]
-                                n = parent
-                                parent = int((n-1)/2)
-
-                        elif source.id != closest.id and costA[closest.neighA[ind][0].id] == cost and (radius == 0.0 or cost <= radius):
-                            pivotA[closest.neighA[ind][0].id].append(closest)
-                            numSP[closest.neighA[ind][0].id] += numSP[closest.id]
+            #metrics whose contributions from this source are provably zero are not computed
+            doCent = 2 in metricsL and loadA[source.id] != 0
+            doCvg = (4 in metricsL or 5 in metricsL) and supplyA[source.id] != 0
+            doBtw = 1 in metricsL and not btwBlocks
+            doPath = doBtw or doCent or doCvg
+            if not doPath and odPath == "" and not distStats and 0 not in metricsL and 6 not in metricsL and (3 not in metricsL or demandA[source.id] <= 0):
+                skippedSearches += 1
+                continue
+            if not doPath: distSearches += 1 #only distances are needed, shortest paths are not recorded
+            if len(compA) == 1: costA, sortedA, pivotA, numSP, level = [0], [source], [[]], [1], [0] #isolated edge, no search is needed
+            elif contract: costA, sortedA, pivotA, numSP, level = searchContracted(source, doPath, compA)
+            else: costA, sortedA, pivotA, numSP, level = searchFrom(source, doPath, compA)
+            if odPath != "": writeODRow(odFile, edgesCount, source.id, [(edge.id, costA[edge.pos]) for edge in sortedA])
+            if distStats:
+                for col, value in enumerate(distanceStats([(costA[edge.pos], loadA[edge.id]) for edge in sortedA if edge != source and (radius == 0.0 or costA[edge.pos] <= radius)])): statsA[col][source.id] = value
         #step 3 metrics update
-            if 1 in metricsL: btwTemp = [0 for i in range(edgesCount)]
-            if 2 in metricsL: centTemp = [0 for i in range(edgesCount)]
-            if 4 in metricsL or 5 in metricsL: cvgTemp = [0 for i in range(edgesCount)]
+            if doBtw: btwTemp = [0 for i in range(len(compA))]
+            if doCent: centTemp = [0 for i in range(len(compA))]
+            if doCvg: cvgTemp = [0 for i in range(len(compA))]
             while sortedA != []:
                 farest = sortedA[-1]
-                cost = costA[farest.id]
+                cost = costA[farest.pos]
                 if (radius == 0.0 or cost <= radius): 
-                    if 0 in metricsL and farest.id != source.id: source.access += farest.load/cost
-                    if 3 in metricsL and source.demand > 0: source.opport += farest.supply/(cost+1)
-                    if 6 in metricsL: source.reach += farest.load
+                    if 0 in metricsL and farest.id != source.id: accessA[source.id] += loadA[farest.id]/cost
+                    if 3 in metricsL and demandA[source.id] > 0: opportA[source.id] += supplyA[farest.id]/(cost+1)
+                    if 6 in metricsL: reachA[source.id] += loadA[farest.id]
                 sortedA.pop(len(sortedA)-1)
-                pot = farest.load * source.load
-                tension = source.supply * farest.demand 
+                pot = loadA[farest.id] * loadA[source.id]
+                tension = supplyA[source.id] * demandA[farest.id] 
                 
-                for neigh in pivotA[farest.id]:
-                    if numSP[farest.id] > 0 and (radius == 0.0 or cost <= radius):
-                        if 1 in metricsL: btwTemp[neigh.id] += (numSP[neigh.id]/numSP[farest.id])*(1 + btwTemp[farest.id])
-                        if 2 in metricsL: centTemp[neigh.id] += (numSP[neigh.id]/numSP[farest.id])*((pot/(level[farest.id] + 1)) + centTemp[farest.id])
-                        if 4 in metricsL or 5 in metricsL: cvgTemp[neigh.id] += (numSP[neigh.id]/numSP[farest.id])*((tension/(level[farest.id]+1))+cvgTemp[farest.id])
+                #paths with zero weight that do not carry any accumulated value add nothing to their pivots
+                propCent = doCent and (pot != 0 or centTemp[farest.pos] != 0)
+                propCvg = doCvg and (tension != 0 or cvgTemp[farest.pos] != 0)
+                if doBtw or propCent or propCvg:
+                    for neigh in pivotA[farest.pos]:
+                        if numSP[farest.pos] > 0 and (radius == 0.0 or cost <= radius):
+                            if doBtw: btwTemp[neigh.pos] += (numSP[neigh.pos]/numSP[farest.pos])*(1 + btwTemp[farest.pos])
+                            if propCent: centTemp[neigh.pos] += (numSP[neigh.pos]/numSP[farest.pos])*((pot/(level[farest.pos] + 1)) + centTemp[farest.pos])
+                            if propCvg: cvgTemp[neigh.pos] += (numSP[neigh.pos]/numSP[farest.pos])*((tension/(level[farest.pos]+1))+cvgTemp[farest.pos])
+                elif pivotA[farest.pos] != []: prunedAcc += 1
                 
-                if pivotA[farest.id] == [] and level[farest.id] == 1 and (radius == 0.0 or cost <= radius): 
-                    if 2 in metricsL: centTemp[source.id] += (pot/2) + centTemp[farest.id]
-                    if 4 in metricsL or 5 in metricsL: cvgTemp[source.id] += (numSP[neigh.id]/numSP[farest.id])*((tension/(level[farest.id]+1))+cvgTemp[farest.id])
+                if pivotA[farest.pos] == [] and level[farest.pos] == 1 and (radius == 0.0 or cost <= radius): 
+                    if doCent: centTemp[source.pos] += (pot/2) + centTemp[farest.pos]
+                    if doCvg: cvgTemp[source.pos] += (numSP[source.pos]/numSP[farest.pos])*((tension/(level[farest.pos]+1))+cvgTemp[farest.pos])
                 
                 if farest.id != source.id and (radius == 0.0 or cost <= radius): 
-                    if 1 in metricsL: farest.btw += btwTemp[farest.id]/2
-                    if 2 in metricsL: centTemp[farest.id] += pot/(level[farest.id]+1)
-                if (4 in metricsL or 5 in metricsL) and (radius == 0.0 or cost <= radius): cvgTemp[farest.id] += tension/(level[farest.id]+1)
+                    if doBtw: btwA[farest.id] += btwTemp[farest.pos]/2
+                    if doCent: centTemp[farest.pos] += pot/(level[farest.pos]+1)
+                if doCvg and (radius == 0.0 or cost <= radius): cvgTemp[farest.pos] += tension/(level[farest.pos]+1)
                 
-                if 2 in metricsL: farest.cent += centTemp[farest.id]/2
-                if 4 in metricsL and farest.supply > 0: farest.converg += cvgTemp[farest.id]
-                if 5 in metricsL: farest.polarity += cvgTemp[farest.id]
+                if doCent: centA[farest.id] += centTemp[farest.pos]/2
+                if 4 in metricsL and doCvg and supplyA[farest.id] > 0: convergA[farest.id] += cvgTemp[farest.pos]
+                if 5 in metricsL and doCvg: polarityA[farest.id] += cvgTemp[farest.pos]
 
+        if odPath != "":
+            odFile.close()
+            feedback.pushInfo(f'Origin-Destination Costs Written to {odPath}')
+        feedback.pushInfo(f'Weight Pruning: {skippedSearches} of {len(sourcesA)} searches skipped, {distSearches} searches without shortest paths recording, {prunedAcc} zero contributions not propagated')
+    
     #update table of contents
     strBegin = "T" if analysisType == 0 else "G"
     strMid = "g" if radius == 0.0 else str(int(radius))
@@ -245,65 +896,84 @@ def computeMetrics(instance, parameters, context, feedback, inputs):
     else: strBegin += strMid
     
     if 0 in metricsL:
-        aux = 0
-        while inputEdges.fields().indexFromName(strBegin + "Acc" + str(aux)) != -1 and aux < 9: aux += 1
-        inputEdges.dataProvider().addAttributes([QgsField(strBegin + "Acc" + str(aux),QVariant.Double)])
+        name = fieldName(strBegin + "Acc")
+        inputEdges.dataProvider().addAttributes([QgsField(name,QVariant.Double)])
         inputEdges.updateFields()
-        accIndex = inputEdges.fields().indexFromName(strBegin + "Acc" + str(aux))
+        accIndex = inputEdges.fields().indexFromName(name)
     if 1 in metricsL:
-        aux = 0
-        while inputEdges.fields().indexFromName(strBegin + "Btw" + str(aux)) != -1 and aux < 9: aux += 1
-        inputEdges.dataProvider().addAttributes([QgsField(strBegin + "Btw" + str(aux),QVariant.Double)])
+        name = fieldName(strBegin + "Btw")
+        inputEdges.dataProvider().addAttributes([QgsField(name,QVariant.Double)])
         inputEdges.updateFields()
-        btwIndex = inputEdges.fields().indexFromName(strBegin + "Btw" + str(aux))
+        btwIndex = inputEdges.fields().indexFromName(name)
     if 2 in metricsL:
-        aux = 0
-        while inputEdges.fields().indexFromName(strBegin + "Cen" + str(aux)) != -1 and aux < 9: aux += 1
-        inputEdges.dataProvider().addAttributes([QgsField(strBegin + "Cen" + str(aux),QVariant.Double)])
+        name = fieldName(strBegin + "Cen")
+        inputEdges.dataProvider().addAttributes([QgsField(name,QVariant.Double)])
         inputEdges.updateFields()
-        centIndex = inputEdges.fields().indexFromName(strBegin + "Cen" + str(aux))
+        centIndex = inputEdges.fields().indexFromName(name)
     if 3 in metricsL:
-        aux = 0
-        while inputEdges.fields().indexFromName(strBegin + "Opp" + str(aux)) != -1 and aux < 9: aux += 1
-        inputEdges.dataProvider().addAttributes([QgsField(strBegin + "Opp" + str(aux),QVariant.Double)])
+        name = fieldName(strBegin + "Opp")
+        inputEdges.dataProvider().addAttributes([QgsField(name,QVariant.Double)])
         inputEdges.updateFields()
-        oppIndex = inputEdges.fields().indexFromName(strBegin + "Opp" + str(aux))
+        oppIndex = inputEdges.fields().indexFromName(name)
     if 4 in metricsL:
-        aux = 0
-        while inputEdges.fields().indexFromName(strBegin + "Cvg" + str(aux)) != -1 and aux < 9: aux += 1
-        inputEdges.dataProvider().addAttributes([QgsField(strBegin + "Cvg" + str(aux),QVariant.Double)])
+        name = fieldName(strBegin + "Cvg")
+        inputEdges.dataProvider().addAttributes([QgsField(name,QVariant.Double)])
         inputEdges.updateFields()
-        cvgIndex = inputEdges.fields().indexFromName(strBegin + "Cvg" + str(aux))
+        cvgIndex = inputEdges.fields().indexFromName(name)
     if 5 in metricsL:
-        aux = 0
-        while inputEdges.fields().indexFromName(strBegin + "Pol" + str(aux)) != -1 and aux < 9: aux += 1
-        inputEdges.dataProvider().addAttributes([QgsField(strBegin + "Pol" + str(aux),QVariant.Double)])
+        name = fieldName(strBegin + "Pol")
+        inputEdges.dataProvider().addAttributes([QgsField(name,QVariant.Double)])
         inputEdges.updateFields()
-        polIndex = inputEdges.fields().indexFromName(strBegin + "Pol" + str(aux))
+        polIndex = inputEdges.fields().indexFromName(name)
     if 6 in metricsL:
-        aux = 0
-        while inputEdges.fields().indexFromName(strBegin + "Rea" + str(aux)) != -1 and aux < 9: aux += 1
-        inputEdges.dataProvider().addAttributes([QgsField(strBegin + "Rea" + str(aux),QVariant.Double)])
+        name = fieldName(strBegin + "Rea")
+        inputEdges.dataProvider().addAttributes([QgsField(name,QVariant.Double)])
         inputEdges.updateFields()
-        reachIndex = inputEdges.fields().indexFromName(strBegin + "Rea" + str(aux))
+        reachIndex = inputEdges.fields().indexFromName(name)
     if 7 in metricsL:
-        aux = 0
-        while inputEdges.fields().indexFromName(strBegin + "Cnc" + str(aux)) != -1 and aux < 9: aux += 1
-        inputEdges.dataProvider().addAttributes([QgsField(strBegin + "Cnc" + str(aux),QVariant.Double)])
+        name = fieldName(strBegin + "Cnc")
+        inputEdges.dataProvider().addAttributes([QgsField(name,QVariant.Double)])
+        inputEdges.updateFields()
+        cncIndex = inputEdges.fields().indexFromName(name)
+    statsIndex = []
+    for code in (statsCodes if distStats else []):
+        name = fieldName(strBegin + code)
+        inputEdges.dataProvider().addAttributes([QgsField(name,QVariant.Double)])
         inputEdges.updateFields()
-        cncIndex = inputEdges.fields().indexFromName(strBegin + "Cnc" + str(aux))
+        statsIndex.append(inputEdges.fields().indexFromName(name))
+        if code[:2] == "Bd": inputEdges.setFieldAlias(statsIndex[-1], name + f" (load within {bandsL[int(code[2:])-1]:g})")
     
+    #path based metrics computed from part of the sources are flagged in the fields' aliases
+    if sourceIds != None:
+        if 1 in metricsL: inputEdges.setFieldAlias(btwIndex, inputEdges.fields()[btwIndex].name() + " (sources subset)")
+        if 2 in metricsL: inputEdges.setFieldAlias(centIndex, inputEdges.fields()[centIndex].name() + " (sources subset)")
+        if 4 in metricsL: inputEdges.setFieldAlias(cvgIndex, inputEdges.fields()[cvgIndex].name() + " (sources subset)")
+        if 5 in metricsL: inputEdges.setFieldAlias(polIndex, inputEdges.fields()[polIndex].name() + " (sources subset)")
+
     for edge in edgesA:
         metricsD = {}
-        if 0 in metricsL: metricsD[accIndex] = edge.access
-        if 1 in metricsL: metricsD[btwIndex] = edge.btw
-        if 2 in metricsL: metricsD[centIndex] = edge.cent
-        if 3 in metricsL: metricsD[oppIndex] = edge.opport
-        if 4 in metricsL: metricsD[cvgIndex] = edge.converg
-        if 5 in metricsL: metricsD[polIndex] = edge.polarity
-        if 6 in metricsL: metricsD[reachIndex] = edge.reach
-        if 7 in metricsL: metricsD[cncIndex] = len(edge.neighA)
-        inputEdges.dataProvider().changeAttributeValues({edge.id : metricsD})
+        isSource = sourceIds == None or edge.id in sourceIds
+        if 0 in metricsL and isSource: metricsD[accIndex] = accessA[edge.id]
+        if 1 in metricsL: metricsD[btwIndex] = btwA[edge.id]
+        if 2 in metricsL: metricsD[centIndex] = centA[edge.id]
+        if 3 in metricsL and isSource: metricsD[oppIndex] = opportA[edge.id]
+        if 4 in metricsL: metricsD[cvgIndex] = convergA[edge.id]
+        if 5 in metricsL: metricsD[polIndex] = polarityA[edge.id]
+        if 6 in metricsL and isSource: metricsD[reachIndex] = reachA[edge.id]
+        if 7 in metricsL and isSource: metricsD[cncIndex] = len(edge.neighA)
+        if isSource:
+            for col in range(len(statsIndex)): metricsD[statsIndex[col]] = None if math.isnan(statsA[col][edge.id]) else statsA[col][edge.id]
+        if metricsD != {}: inputEdges.dataProvider().changeAttributeValues({edge.id : metricsD})
+
+    #results stored in the cache, NaN for the features without value
+    if cacheFolder != "":
+        valuesD = {}
+        for metric in metricsL:
+            valuesD[codesL[metric]] = array('d', [float('nan')])*edgesCount
+            for edge in edgesA:
+                if metric in [1, 2, 4, 5] or sourceIds == None or edge.id in sourceIds: valuesD[codesL[metric]][edge.id] = len(edge.neighA) if metric == 7 else metricA[metric][edge.id]
+        for col in range(len(statsA)): valuesD[statsCodes[col]] = statsA[col]
+        writeCache(valuesD)
     
     if outPath != "":
         crs = QgsProject.instance().crs()
@@ -321,7 +991,11 @@ def computeMetrics(instance, parameters, context, feedback, inputs):
         if 5 in metricsL: metricsOut.append(polIndex)
         if 6 in metricsL: metricsOut.append(reachIndex)
         if 7 in metricsL: metricsOut.append(cncIndex)
+        metricsOut += statsIndex
         inputEdges.dataProvider().deleteAttributes(metricsOut)
         inputEdges.updateFields()
 
+    #connections of the network kept for the next analyses of the same files
+    if netKey != None: renewNetwork(netKey)
+
     
\ No newline at end of file
@@ -0,0 +1,464 @@
+from array import array
+import mmap
+import multiprocessing
+import os
+import tempfile
+from queue import Empty
+from qgis import processing
+from qgis.processing import alg
+from qgis.PyQt.QtCore import QVariant
+from qgis.core import (NULL, QgsProject, QgsVectorFileWriter, QgsSpatialIndex, QgsDistanceArea, QgsField)
+
+#ui input parameters
+@alg(name='GAUS_lr11', label='GAUS Link Ranking 1.1', group='GAUS v1.1', group_label='GAUS v1.1')
+@alg.input(type=alg.VECTOR_LAYER, name='inpLines', label='Lines', types=[1])
+@alg.input(type=alg.VECTOR_LAYER, name='inpPoints', label='Points', types=[0])
+@alg.input(type=alg.VECTOR_LAYER, name='inpCandidates', label='Candidate Links', types=[1])
+@alg.input(type=alg.ENUM, name='analysis', label='Analysis Type', options=['Topological','Geodetic'], default = 0)
+@alg.input(type=alg.ENUM, name='metrics', label='Metrics to be Evaluated', options=['Accessibility','Betweenness','Freeman-Krafta Centrality','Opportunity','Convergence','Polarity','Reach'], allowMultiple=True)
+@alg.input(type=alg.ENUM, name='rankby', label='Rank Candidates by', options=['Accessibility','Betweenness','Freeman-Krafta Centrality','Opportunity','Convergence','Polarity','Reach'], default = 0)
+@alg.input(type=alg.NUMBER, name='radius', label='Analysis Radius (0.0 = Global Analysis)')
+@alg.input(type=alg.FIELD, name='impedance',label='Impedance of Lines',parentLayerParameterName = 'inpLines',allowMultiple=True,optional = True)
+@alg.input(type=alg.FIELD, name='candimpedance',label='Impedance of Candidate Links',parentLayerParameterName = 'inpCandidates',allowMultiple=True,optional = True)
+@alg.input(type=alg.FIELD, name='load',label='Load of Points',parentLayerParameterName = 'inpPoints',allowMultiple=True,optional = True)
+@alg.input(type=alg.FIELD, name='supply',label='Supply in Points',parentLayerParameterName = 'inpPoints',allowMultiple=True,optional = True)
+@alg.input(type=alg.FIELD, name='demand',label='Demand in Points',parentLayerParameterName = 'inpPoints',allowMultiple=True,optional = True)
+@alg.input(type=alg.VECTOR_LAYER_DEST, name='dest', label='Create New Shapefiles for Results? [optional]', optional = True, createByDefault = False)
+@alg.input(type=alg.NUMBER, name='precision', label='Distance Precision', default=0.00015)
+@alg.input(type=alg.NUMBER, name='workers', label='Worker Processes', default=1)
+@alg.input(type=alg.FILE, name='basefolder', label='Baseline Folder (Memory-Mapped Files) [optional]', behavior=1, optional = True)
+
+#ui output definition (does nothing, it is here because qgis requires the declaration of at least one output)
+@alg.output(type=alg.NUMBER, name='numoffeat', label='Number of Features Processed')
+
+def computeMetrics(instance, parameters, context, feedback, inputs):
+    """
+    Ranks candidate links by their effect on the configurational metrics of a network composed of points whose connections are indicated by lines.
+
+    Fields Description:
+    Points: vector layer of the network's nodes.
+    Lines: vector layer of the network's lines.
+    Candidate Links: vector layer of the lines being evaluated. Each candidate is evaluated alone against the existing network, its ends are connected to the points in the same way as the network's lines.
+    Analysis: in topological analysis, the distance between connected nodes is equal to 1. In geodetic analysis, the geodetic distance between them is considered. Lengths are planar, in the units of the layer, for projected coordinate systems, and ellipsoidal, in meters, for geographic coordinate systems, with the ellipsoid of the project.
+    Metrics to be Evaluated: for Accessibility, Opportunity and Reach the result is the gain in the sum of the metric over all nodes. For Betweenness, Freeman-Krafta Centrality, Convergence and Polarity the result is the variation of the Gini coefficient of the metric over all nodes (negative values mean a less concentrated distribution).
+    Rank Candidates by: metric used to order the candidates. Rank 1 is the highest gain or the highest reduction of concentration. Besides the rank, the number of source nodes whose shortest paths are changed by each candidate is also written in the results.
+    Analysis Radius: only the pairs of nodes whose distance is within the defined radius will be considered for the analysis. Zero means that all pairs of nodes are considered.
+    Impedance: field of the lines vector layer containing the impedance of each line.
+    Impedance of Candidate Links: field of the candidate links vector layer containing the impedance of each candidate.
+    Load: field of the points vector layer containing the load of each node.
+    Supply: field of the points vector layer containing the supply of each node.
+    Demand: field of the points vector layer containing the demand of each node.
+    Distance Precision: maximum distance between point and line vertex that will be considered as a connection between them.
+    Worker Processes: number of processes among which the candidates are distributed. Values higher than 1 are only used on systems that are able to fork the QGIS process.
+    Baseline Folder: folder where the distances and path contributions of the network without candidates are kept, one row per node, in memory-mapped files shared by every candidate. They take 8 bytes per pair of nodes for the distances and as much for each path based metric, and are removed at the end. If it is left blank, the temporary folder of the system is used.
+    Create New Shapefile for Results?: if it is left blank, the results will be inserted in the existing candidate links vector layer. Otherwise, a copy of the vector layer will be created containing the results.
+    """
+
+    #Nodes of the network
+    #weights are kept in typed arrays indexed by the node id, the objects only hold the graph structure
+    class NodeObj:
+        __slots__ = ('id', 'heapPos', 'neighA')
+        def __init__(self, feat):
+            self.id = feat.id()
+            self.heapPos = -1 #current position of the node inside the heap
+            self.neighA = []  #list of connected nodes
+
+    #sum of the selected fields of a feature, NULL values are ignored and no selected field means 1
+    def fieldsSum(feat, fieldsF):
+        if fieldsF == []: return 1
+        value = 0
+        for i in range(len(fieldsF)):
+            if feat.attribute(fieldsF[i]) != NULL: value += feat.attribute(fieldsF[i])
+        return value
+
+    #verifies if highest id number is lower than number of features
+    #in order to avoid potential conflicts with matrices' size
+    def verifyFeatCount(inputFeat):
+        featCount = inputFeat.featureCount()
+        for feat in inputFeat.getFeatures(): featCount = max(featCount, feat.id()+1)
+        return featCount
+
+    #Length Calculator
+    #a single calculator for every line: planar lengths in the units of the layer for projected systems, ellipsoidal lengths in meters for geographic systems
+    def lengthCalculator(layer):
+        distArea = QgsDistanceArea()
+        if layer.crs().isGeographic():
+            distArea.setSourceCrs(layer.crs(), context.transformContext())
+            distArea.setEllipsoid(context.ellipsoid() if context.ellipsoid() not in ('', 'NONE') else layer.crs().ellipsoidAcronym())
+        return distArea
+
+    def defineDistance(edge,analysisType,impField,edgeA,edgeB):
+        if impField == []: imp = 1
+        else:
+            imp = 0
+            for i in range(len(impField)):
+                if edge.attribute(impField[i]) != NULL: imp += edge.attribute(impField[i])
+
+        dist = imp if analysisType == 0 else imp*distArea.measureLine(edgeA,edgeB)
+        return dist
+
+    #connects both ends of a line to the nearest points within the distance precision
+    def snapEdge(edge, impF):
+        edgesVertices = edge.geometry().asMultiPolyline()
+        vert1 = nodesSpaceIndex.nearestNeighbor(edgesVertices[0][0], 1, prec)
+        vert2 = nodesSpaceIndex.nearestNeighbor(edgesVertices[0][-1], 1, prec)
+        if vert1 == [] or vert2 == []: return None
+        return [vert1[0], vert2[0], defineDistance(edge,analysisType,impF,edgesVertices[0][0],edgesVertices[0][-1])]
+
+    #Compute Shortest Paths (Djikstra Algorithm with Binary Heap as Priority Queue)
+    #same search used by GAUS Points+Lines, so each candidate is evaluated as if it had been added to the lines layer
+    #the number of shortest paths is restarted whenever a shorter path is found, otherwise candidates outside the zone of influence could change the counts
+    def shortestPaths(source):
+    #1-Heap cretation
+        finitePos = 0
+        costA = [99999999999999 for i in range(nodesCount)]
+        costA[source.id] = 0 #distance from the source edge to itself is zero
+        for ind in range(len(source.neighA)): costA[source.neighA[ind][0].id] = min(costA[source.neighA[ind][0].id], source.neighA[ind][1]) #shortest of parallel connections, loops are ignored
+        heap = [nodesA[0] for i in range(len(set(neigh[0].id for neigh in source.neighA) | {source.id}))]
+        for destin in nodesA:
+            if costA[destin.id] == 99999999999999:
+                heap.append(destin)
+                destin.heapPos = len(heap) - 1
+            else:
+                heap[finitePos] = destin
+                destin.heapPos = finitePos
+                n = finitePos
+                finitePos += 1
+                parent = int((n-1)/2)
+                while n !=0 and costA[heap[n].id] < costA[heap[parent].id]:
+                    heap[n].heapPos, heap[parent].heapPos = parent, n
+                    heap[n], heap[parent] = heap[parent], heap[n]
+                    n = parent
+                    parent = int((n-1)/2)
+    #2-Heap sorting
+        pivotA = [[] for i in range(nodesCount)]
+        level = [0 for i in range(nodesCount)]
+        numSP = [0 for i in range(nodesCount)]
+        sortedA = []
+        numSP[source.id], level[source.id] = 1,0
+        for ind in range(len(source.neighA)):
+            if source.neighA[ind][0] != source and source.neighA[ind][1] == costA[source.neighA[ind][0].id]:
+                numSP[source.neighA[ind][0].id] += 1 #each parallel connection of minimum cost is a shortest path
+                level[source.neighA[ind][0].id] = 1
+        while heap != []:
+            closest = heap[0]
+            if costA[closest.id] == 99999999999999: break #remaining elements are not connected to the source
+            if costA[closest.id] <= radius or radius == 0.0: sortedA.append(closest)
+            if finitePos > 0:
+                heap[0].heapPos, heap[finitePos-1].heapPos = finitePos-1, 0
+                heap[0], heap[finitePos-1] = heap[finitePos-1], heap[0]
+                heap[finitePos-1].heapPos, heap[-1].heapPos = len(heap)-1, finitePos-1
+                heap[finitePos-1], heap[-1] = heap[-1], heap[finitePos-1]
+                finitePos -= 1
+            heap.pop(len(heap)-1)
+
+            n = 0
+            lh = finitePos
+            posChild1, posChild2 = n*2+1, n*2+2
+            if posChild2 <= lh-1:
+                costChild1, costChild2 = costA[heap[n*2+1].id], costA[heap[n*2+2].id]
+                if any(x < costA[heap[n].id] for x in [costChild1,costChild2]):
+                    if costChild1 <= costChild2: sc = posChild1
+                    else: sc = posChild2
+                else: sc = -1
+            elif posChild2 == lh:
+                if costA[heap[n*2+1].id] < costA[heap[n].id]: sc = posChild1
+                else: sc = -1
+            else: sc = -1
+
+            while sc >= 0:
+                heap[n].heapPos, heap[sc].heapPos = sc, n
+                heap[n], heap[sc] = heap[sc], heap[n]
+                n = sc
+                lh = len(heap)
+                posChild1, posChild2 = n*2+1, n*2+2
+                if posChild2 <= lh-1:
+                    costChild1, costChild2 = costA[heap[n*2+1].id], costA[heap[n*2+2].id]
+                    if any(x < costA[heap[n].id] for x in [costChild1,costChild2]):
+                        if costChild1 <= costChild2: sc = posChild1
+                        else: sc = posChild2
+                    else: sc = -1
+                elif posChild2 == lh:
+                    if costA[heap[n*2+1].id] < costA[heap[n].id]: sc = posChild1
+                    else: sc = -1
+                else: sc = -1
+
+            for ind in range(len(closest.neighA)):
+                if closest.neighA[ind][0].heapPos < len(heap):
+                    cost = costA[closest.id] + closest.neighA[ind][1]
+                    prevCost = costA[closest.neighA[ind][0].id]
+                    if prevCost > cost and (radius == 0.0 or cost <= radius):
+                        costA[closest.neighA[ind][0].id], level[closest.neighA[ind][0].id] = cost, level[closest.id] + 1
+                        pivotA[closest.neighA[ind][0].id] = []
+                        pivotA[closest.neighA[ind][0].id].append(closest)
+                        numSP[closest.neighA[ind][0].id] = numSP[closest.id] #paths counted through a previous pivot are no longer shortest
+
+                        n = closest.neighA[ind][0].heapPos
+                        if prevCost == 99999999999999:
+                            heap[finitePos].heapPos, closest.neighA[ind][0].heapPos = n, finitePos
+                            heap[n], heap[finitePos] = heap[finitePos], closest.neighA[ind][0]
+                            n = finitePos
+                            finitePos += 1
+                        parent = int((n-1)/2)
+                        while n !=0 and costA[heap[n].id] < costA[heap[parent].id]:
+                            heap[n].heapPos, heap[parent].heapPos = parent, n
+                            heap[n], heap[parent] = heap[parent], heap[n]
+                            n = parent
+                            parent = int((n-1)/2)
+
+                    elif source.id != closest.id and costA[closest.neighA[ind][0].id] == cost and (radius == 0.0 or cost <= radius):
+                        pivotA[closest.neighA[ind][0].id].append(closest)
+                        numSP[closest.neighA[ind][0].id] += numSP[closest.id]
+                        level[closest.neighA[ind][0].id] = min(level[closest.neighA[ind][0].id], level[closest.id] + 1) #fewest steps among the shortest paths, regardless of heap order
+        return costA, sortedA, pivotA, numSP, level
+
+    #3-Metrics update
+    #returns the contribution of the source to the path based metrics of every node
+    def pathContrib(source, costA, sortedA, pivotA, numSP, level):
+        contribD = {}
+        for m in pathL: contribD[m] = array('d', bytes(8*nodesCount))
+        if 1 in metricsL: btwTemp = [0 for i in range(nodesCount)]
+        if 2 in metricsL: fkcTemp = [0 for i in range(nodesCount)]
+        if 4 in metricsL or 5 in metricsL: cvgTemp = [0 for i in range(nodesCount)]
+        while sortedA != []:
+            farest = sortedA[-1]
+            cost = costA[farest.id]
+            sortedA.pop(len(sortedA)-1)
+            pot = loadA[farest.id] * loadA[source.id]
+            tension = supplyA[source.id]*demandA[farest.id]
+
+            for neigh in pivotA[farest.id]:
+                if radius == 0.0 or cost <= radius:
+                    if 1 in metricsL: btwTemp[neigh.id] += (numSP[neigh.id]/numSP[farest.id])*(1 + btwTemp[farest.id])
+                    if 2 in metricsL: fkcTemp[neigh.id] += (numSP[neigh.id]/numSP[farest.id])*((pot/(level[farest.id]+1))+fkcTemp[farest.id])
+                    if 4 in metricsL or 5 in metricsL: cvgTemp[neigh.id] += (numSP[neigh.id]/numSP[farest.id])*((tension/(level[farest.id]+1))+cvgTemp[farest.id])
+
+            if pivotA[farest.id] == [] and level[farest.id] == 1 and (radius == 0.0 or cost <= radius):
+                if 2 in metricsL: fkcTemp[source.id] += (pot/2)+fkcTemp[farest.id]
+                if 4 in metricsL or 5 in metricsL: cvgTemp[source.id] += (numSP[source.id]/numSP[farest.id])*((tension/(level[farest.id]+1))+cvgTemp[farest.id])
+
+            if farest.id != source.id and (radius == 0.0 or cost <= radius):
+                if 1 in metricsL: contribD[1][farest.id] += btwTemp[farest.id]/2
+                if 2 in metricsL: fkcTemp[farest.id] += pot/(level[farest.id]+1)
+            if (4 in metricsL or 5 in metricsL) and (radius == 0.0 or cost <= radius): cvgTemp[farest.id] += tension/(level[farest.id]+1)
+
+            if 2 in metricsL: contribD[2][farest.id] += fkcTemp[farest.id]/2
+            if 4 in metricsL and supplyA[farest.id] > 0: contribD[4][farest.id] += cvgTemp[farest.id]
+            if 5 in metricsL: contribD[5][farest.id] += cvgTemp[farest.id]
+        return contribD
+
+    #concentration of a metric among the nodes (0 = evenly distributed, 1 = concentrated in a single node)
+    def gini(valuesA):
+        valuesA = sorted(valuesA[node.id] for node in nodesA)
+        total = sum(valuesA)
+        if total == 0: return 0
+        return sum((2*(i+1) - len(valuesA) - 1)*valuesA[i] for i in range(len(valuesA)))/(len(valuesA)*total)
+
+    #Baseline Rows
+    #one row per source in a memory-mapped file, shared by the candidates and by the forked processes
+    def mapRows(name):
+        file = open(os.path.join(baseFolder, name), 'w+b')
+        file.truncate(max(1, nodesCount*nodesCount)*8)
+        mapped = mmap.mmap(file.fileno(), 0)
+        file.close()
+        mapsA.append([mapped, memoryview(mapped).cast('d')])
+        return mapsA[-1][1]
+
+    def rowOf(rowsA, ident):
+        return rowsA[ident*nodesCount:(ident+1)*nodesCount]
+
+    #memory-mapped files removed once the candidates are evaluated
+    def removeRows():
+        for mapped, view in mapsA:
+            view.release()
+            mapped.close()
+        for name in os.listdir(baseFolder): os.remove(os.path.join(baseFolder, name))
+        os.rmdir(baseFolder)
+
+    #evaluates one candidate link against the baseline network
+    #only sources whose distance to one end of the candidate plus the candidate's cost does not exceed the distance to the other end can have their metrics changed (zone of influence)
+    #the distances from every source to the ends of the candidate are read from the baseline rows of the ends, as the lines have no direction
+    def evaluateCandidate(cand):
+        vertA, vertB, dist = nodesA[cand[0]], nodesA[cand[1]], cand[2]
+        deltaD = {}
+        for m in metricsL: deltaD[m] = 0
+        newValD = {}
+        for m in pathL: newValD[m] = array('d', baseValD[m])
+        fromA, fromB = rowOf(baseCostA, vertA.id), rowOf(baseCostA, vertB.id)
+        affectedA = []
+        for source in nodesA:
+            viaA, viaB = fromA[source.id] + dist, fromB[source.id] + dist
+            if radius != 0.0 and min(viaA, viaB) > radius: continue
+            if viaA > fromB[source.id] and viaB > fromA[source.id]: continue
+            affectedA.append(source)
+
+            #baseline path contributions of the source, replaced by the ones with the candidate
+            for m in pathL:
+                contribA = rowOf(baseContribD[m], source.id)
+                for node in nodesA: newValD[m][node.id] -= contribA[node.id]
+            if viaA >= fromB[source.id] and viaB >= fromA[source.id]: continue #equal costs only add paths, the distances are unchanged
+
+            #distance based metrics, computed from the baseline distances of the source and of the ends of the candidate
+            costA = rowOf(baseCostA, source.id)
+            for destin in nodesA:
+                oldCost = costA[destin.id]
+                newCost = min(oldCost, viaA + fromB[destin.id], viaB + fromA[destin.id])
+                if newCost == oldCost or (radius != 0.0 and newCost > radius): continue
+                inside = radius == 0.0 or oldCost <= radius
+                if 0 in metricsL and destin.id != source.id: deltaD[0] += loadA[destin.id]/newCost - (loadA[destin.id]/oldCost if inside else 0)
+                if 3 in metricsL and demandA[source.id] > 0: deltaD[3] += supplyA[destin.id]/(newCost+1) - (supplyA[destin.id]/(oldCost+1) if inside else 0)
+                if 6 in metricsL and (not inside or oldCost == 99999999999999): deltaD[6] += loadA[destin.id]
+
+        #path based metrics, recomputed only for the sources inside the zone of influence
+        if pathL != []:
+            if affectedA != []:
+                vertA.neighA.append([vertB, dist])
+                vertB.neighA.append([vertA, dist])
+                for source in affectedA:
+                    contribD = pathContrib(source, *shortestPaths(source))
+                    for m in pathL:
+                        for node in nodesA: newValD[m][node.id] += contribD[m][node.id]
+                vertA.neighA.pop(len(vertA.neighA)-1)
+                vertB.neighA.pop(len(vertB.neighA)-1)
+            for m in pathL: deltaD[m] = gini(newValD[m]) - baseGiniD[m]
+        return deltaD, len(affectedA)
+
+    #evaluates a share of the candidates inside a forked process
+    def evaluateShare(candidatesL, queue):
+        try:
+            for candIndex in candidatesL: queue.put((candIndex,) + evaluateCandidate(candidatesA[candIndex][1]))
+        except Exception as error: queue.put(f'{type(error).__name__}: {error}') #failure of the share, reported by the main process
+        finally: queue.put(None)
+
+    #import user input parameters
+    inputNodes = instance.parameterAsVectorLayer(parameters, 'inpPoints', context)
+    inputEdges = instance.parameterAsVectorLayer(parameters, 'inpLines', context)
+    distArea = lengthCalculator(inputEdges) #single calculator of the lengths of the lines
+    inputCand = instance.parameterAsVectorLayer(parameters, 'inpCandidates', context)
+    metricsL = instance.parameterAsEnums(parameters, 'metrics', context)
+    rankBy = instance.parameterAsEnum(parameters, 'rankby', context)
+    impField = instance.parameterAsFields(parameters, 'impedance', context)
+    candImpField = instance.parameterAsFields(parameters, 'candimpedance', context)
+    loadField = instance.parameterAsFields(parameters, 'load', context)
+    supplyField = instance.parameterAsFields(parameters, 'supply', context)
+    demandField = instance.parameterAsFields(parameters, 'demand', context)
+    analysisType = instance.parameterAsEnum(parameters, 'analysis', context)
+    radius = instance.parameterAsDouble(parameters, 'radius', context)
+    outPath = instance.parameterAsOutputLayer(parameters, 'dest', context)
+    prec = instance.parameterAsDouble(parameters, 'precision', context)
+    workers = max(1, instance.parameterAsInt(parameters, 'workers', context))
+    baseFolder = instance.parameterAsFile(parameters, 'basefolder', context) #folder of the baseline rows, empty for the temporary folder
+    if rankBy not in metricsL: metricsL.append(rankBy)
+    pathL = [m for m in [1,2,4,5] if m in metricsL] #metrics that depend on the shortest paths and not only on distances
+
+    #nodes initialization
+    nodesCount = verifyFeatCount(inputNodes)
+    nodesA = [0 for i in range(nodesCount)] #array that stores network nodes
+    loadA, supplyA, demandA = [array('d', [0])*nodesCount for i in range(3)] #load, supply and demand of each node, indexed by its id
+    for node in inputNodes.getFeatures():
+        nodesA[node.id()] = NodeObj(node)
+        loadA[node.id()], supplyA[node.id()], demandA[node.id()] = fieldsSum(node, loadField), fieldsSum(node, supplyField), fieldsSum(node, demandField)
+        if node.id() % 100 == 0: feedback.pushInfo(f'Initializing Node {node.id()}')
+
+    #Initialize Edges
+    feedback.pushInfo("Initialize Edges")
+    nodesSpaceIndex = QgsSpatialIndex(inputNodes.getFeatures())
+    for edge in inputEdges.getFeatures():
+        snapped = snapEdge(edge, impField)
+        if snapped != None and (snapped[2] <= radius or radius == 0.0):
+            nodesA[snapped[0]].neighA.append([nodesA[snapped[1]],snapped[2]])
+            nodesA[snapped[1]].neighA.append([nodesA[snapped[0]],snapped[2]])
+
+    #Initialize Candidates
+    candidatesA = [] #pairs of candidate feature id and [end node, end node, distance]
+    unsnapped = []
+    for cand in inputCand.getFeatures():
+        snapped = snapEdge(cand, candImpField)
+        if snapped == None or snapped[0] == snapped[1]: unsnapped.append(cand.id())
+        else: candidatesA.append([cand.id(), snapped])
+    if unsnapped != []: feedback.pushWarning(f'{len(unsnapped)} candidate links do not connect two different points and were not evaluated')
+
+    #baseline: one search from every node, its distances and path contributions are kept in rows reused by every candidate
+    baseFolder = tempfile.mkdtemp(prefix='gaus_lr_', dir=baseFolder if baseFolder != "" else None)
+    mapsA = [] #memory maps of the baseline rows and their typed views
+    baseCostA = mapRows('cost')
+    baseValD, baseContribD, baseGiniD = {}, {}, {}
+    for m in pathL:
+        baseValD[m] = array('d', bytes(8*nodesCount))
+        baseContribD[m] = mapRows(f'path{m}')
+    for source in nodesA:
+        if source.id % 50 == 0: feedback.pushInfo(f'Baseline Shortest Path {source.id}')
+        costA, sortedA, pivotA, numSP, level = shortestPaths(source)
+        rowOf(baseCostA, source.id)[:] = array('d', costA)
+        if pathL != []:
+            contribD = pathContrib(source, costA, sortedA, pivotA, numSP, level)
+            for m in pathL:
+                rowOf(baseContribD[m], source.id)[:] = contribD[m]
+                for node in nodesA: baseValD[m][node.id] += contribD[m][node.id]
+    for m in pathL: baseGiniD[m] = gini(baseValD[m])
+
+    #candidates evaluation
+    resultsD = {} #candidate index: (metric deltas, number of affected sources)
+    if workers > 1 and 'fork' in multiprocessing.get_all_start_methods() and len(candidatesA) > 1:
+        feedback.pushInfo(f'Evaluating {len(candidatesA)} Candidates in {workers} Processes')
+        ctx = multiprocessing.get_context('fork')
+        queue = ctx.Queue()
+        procL = [ctx.Process(target=evaluateShare, args=(list(range(w, len(candidatesA), workers)), queue)) for w in range(workers)]
+        for proc in procL: proc.start()
+        finished, failedL = 0, []
+        while finished < len(procL):
+            try: item = queue.get(timeout=1)
+            except Empty:
+                if any(proc.exitcode not in (None, 0) for proc in procL): break #a process ended without finishing its share
+                continue
+            if item == None: finished += 1
+            elif isinstance(item, str): failedL.append(item)
+            else:
+                resultsD[item[0]] = item[1:]
+                if len(resultsD) % 10 == 0: feedback.pushInfo(f'Candidates Evaluated {len(resultsD)}')
+        if failedL != [] or finished < len(procL):
+            for proc in procL: proc.terminate()
+        for proc in procL: proc.join()
+        if failedL != [] or any(proc.exitcode != 0 for proc in procL):
+            removeRows()
+            feedback.reportError('Evaluation failed in a worker process, no ranking was written: ' + (failedL[0] if failedL != [] else f'exit code {[proc.exitcode for proc in procL]}'))
+            return
+    else:
+        if workers > 1: feedback.pushWarning('Forking processes is not available in this system, candidates will be evaluated in a single process')
+        for candIndex in range(len(candidatesA)):
+            if candIndex % 10 == 0: feedback.pushInfo(f'Evaluating Candidate {candidatesA[candIndex][0]}')
+            resultsD[candIndex] = evaluateCandidate(candidatesA[candIndex][1])
+    removeRows()
+
+    #ranking: gains for distance based metrics and reduction of concentration for path based metrics
+    sign = -1 if rankBy in pathL else 1
+    rankA = sorted(range(len(candidatesA)), key = lambda c: -sign*resultsD[c][0][rankBy])
+
+    #update table of contents
+    strBegin = "T" if analysisType == 0 else "G"
+    strMid = "g" if radius == 0.0 else str(int(radius))
+    if len(strMid) > 5: strBegin += strMid[0:5]
+    else: strBegin += strMid
+
+    codesD = {0:"dAc", 1:"dBt", 2:"dCe", 3:"dOp", 4:"dCv", 5:"dPo", 6:"dRe", 7:"Rnk", 8:"Src"}
+    indexD = {}
+    for m in sorted(metricsL) + [7, 8]:
+        aux = 0
+        while inputCand.fields().indexFromName(strBegin + codesD[m] + str(aux)) != -1: aux += 1
+        inputCand.dataProvider().addAttributes([QgsField(strBegin + codesD[m] + str(aux),QVariant.Double)])
+        inputCand.updateFields()
+        indexD[m] = inputCand.fields().indexFromName(strBegin + codesD[m] + str(aux))
+
+    feedback.pushInfo("Candidate Ranking")
+    for pos in range(len(rankA)):
+        deltaD, affected = resultsD[rankA[pos]]
+        metricsD = {indexD[7]: pos+1, indexD[8]: affected}
+        for m in metricsL: metricsD[indexD[m]] = deltaD[m]
+        inputCand.dataProvider().changeAttributeValues({candidatesA[rankA[pos]][0] : metricsD})
+        if pos < 20: feedback.pushInfo(f'{pos+1}: Candidate {candidatesA[rankA[pos]][0]} ' + ' '.join(f'{codesD[m]}={deltaD[m]:.6g}' for m in sorted(metricsL)))
+
+    if outPath != "":
+        crs = QgsProject.instance().crs()
+        writer = QgsVectorFileWriter.writeAsVectorFormat(inputCand, outPath, "System", crs, "ESRI Shapefile")
+        inputCand.dataProvider().deleteAttributes(list(indexD.values()))
+        inputCand.updateFields()
@@ -0,0 +1,238 @@
+import math
+import heapq
+from array import array
+from qgis import processing
+from qgis.processing import alg
+from qgis.PyQt.QtCore import QVariant
+from qgis.core import (NULL, QgsSpatialIndex, QgsDistanceArea, QgsGeometry, QgsField, QgsFeatureRequest)
+
+#ui input parameters
+@alg(name='GAUS_nf11', label='GAUS Nearest Facility 1.1', group='GAUS v1.1', group_label='GAUS v1.1')
+@alg.input(type=alg.ENUM, name='network', label='Network Type', options=['Points+Lines','Lines'], default = 0)
+@alg.input(type=alg.VECTOR_LAYER, name='inpLines', label='Lines', types=[1])
+@alg.input(type=alg.VECTOR_LAYER, name='inpPoints', label='Points (Points+Lines networks)', types=[0], optional = True)
+@alg.input(type=alg.ENUM, name='analysis', label='Analysis Type', options=['Topological','Geodetic'], default = 1)
+@alg.input(type=alg.ENUM, name='geomrule', label='Rule for Connecting Lines (Lines networks)', options=['Overlapping Vertices','Crossing Lines', 'Overlapping Vertices + Crossing Lines'], default = 0)
+@alg.input(type=alg.NUMBER, name='vertextol', label='Tolerance of Overlapping Vertices (Lines networks, 0.0 = Exact Coordinates)', default=0.0)
+@alg.input(type=alg.BOOL, name='exactcheck', label='Verify Overlapping Vertices with the Exact Geometric Test (Lines networks)', default = True)
+@alg.input(type=alg.FIELD, name='impedance',label='Impedance of Lines',parentLayerParameterName = 'inpLines',allowMultiple=True,optional = True)
+@alg.input(type=alg.STRING, name='load',label='Load Fields (comma separated)', optional = True)
+@alg.input(type=alg.ENUM, name='facilities', label='Facility Features', options=['Selected Features','Features Matching Expression'], default = 1)
+@alg.input(type=alg.EXPRESSION, name='facexpr', label='Facility Filter Expression', optional = True)
+@alg.input(type=alg.NUMBER, name='nearest', label='Number of Nearest Facilities', default=1)
+@alg.input(type=alg.NUMBER, name='maxcost', label='Maximum Cost (0.0 = No Limit)', default=0.0)
+@alg.input(type=alg.NUMBER, name='precision', label='Distance Precision', default=0.00015)
+
+#ui output definition (does nothing, it is here because qgis requires the declaration of at least one output)
+@alg.output(type=alg.NUMBER, name='numoffeat', label='Number of Features Processed')
+
+def computeMetrics(instance, parameters, context, feedback, inputs):
+    """
+    Finds the nearest facilities of every feature of a network with a single shortest path search started from all facilities.
+
+    Fields Description:
+    Network Type: the network is built as in GAUS Points+Lines 1.1 (points connected by lines) or as in GAUS Lines 1.1 (lines connected to each other).
+    Lines: vector layer of the network's lines.
+    Points: vector layer of the network's nodes, only used for Points+Lines networks.
+    Analysis, Rule for Connecting Lines, Tolerance of Overlapping Vertices, Verify Overlapping Vertices with the Exact Geometric Test, Impedance and Distance Precision: the same as in the analysis of the whole network.
+    Load Fields: names of the fields of the points (or lines, in Lines networks) containing the load of each feature, separated by commas. Without fields, every feature has load 1.
+    Facility Features: features of the network that are facilities, which can be the features currently selected or the features matching the filter expression.
+    Number of Nearest Facilities: number of facilities found for each feature, up to 9. The nearest facility of each feature is written in the Fc1 field and its cost in the Cs1 field, the second nearest in Fc2 and Cs2 and so on. Features with fewer facilities within the maximum cost have NULL values.
+    Maximum Cost: facilities farther than this cost are not considered. Zero means no limit.
+    The catchment load of each facility, the sum of the loads of the features whose nearest facility is it, is written in the Ctl field of the facilities. Ties between facilities are broken by the lowest feature id.
+    """
+
+    #Nodes of the network
+    class NodeObj:
+        __slots__ = ('id', 'neighA')
+        def __init__(self, feat):
+            self.id = feat.id()
+            self.neighA = []  #list of connected nodes
+
+    #verifies if highest id number is lower than number of features
+    #in order to avoid potential conflicts with matrices' size
+    def verifyFeatCount(inputFeat):
+        featCount = inputFeat.featureCount()
+        for feat in inputFeat.getFeatures(): featCount = max(featCount, feat.id()+1)
+        return featCount
+
+    #Length Calculator
+    #a single calculator for every line: planar lengths in the units of the layer for projected systems, ellipsoidal lengths in meters for geographic systems
+    def lengthCalculator(layer):
+        distArea = QgsDistanceArea()
+        if layer.crs().isGeographic():
+            distArea.setSourceCrs(layer.crs(), context.transformContext())
+            distArea.setEllipsoid(context.ellipsoid() if context.ellipsoid() not in ('', 'NONE') else layer.crs().ellipsoidAcronym())
+        return distArea
+
+    def defineDistance(edge,analysisType,impField,edgeA,edgeB):
+        if impField == []: imp = 1
+        else:
+            imp = 0
+            for i in range(len(impField)):
+                if edge.attribute(impField[i]) != NULL: imp += edge.attribute(impField[i])
+
+        dist = imp if analysisType == 0 else imp*distArea.measureLine(edgeA,edgeB)
+        return dist
+
+    #sum of the selected fields of a feature, NULL values are ignored and no selected field means 1
+    def fieldsSum(feat, fieldsF):
+        if fieldsF == []: return 1
+        value = 0
+        for i in range(len(fieldsF)):
+            if feat.attribute(fieldsF[i]) != NULL: value += feat.attribute(fieldsF[i])
+        return value
+
+    #points connected by the lines whose ends are within the distance precision, as in GAUS Points+Lines 1.1
+    def buildPointsLines():
+        nodesSpaceIndex = QgsSpatialIndex(inputNodes.getFeatures())
+        for edge in inputEdges.getFeatures():
+            edgesVertices = edge.geometry().asMultiPolyline()
+            vert1 = nodesSpaceIndex.nearestNeighbor(edgesVertices[0][0], 1, prec)
+            vert2 = nodesSpaceIndex.nearestNeighbor(edgesVertices[0][-1], 1, prec)
+            if vert1 != [] and vert2 != []:
+                dist = defineDistance(edge,analysisType,impField,edgesVertices[0][0],edgesVertices[0][-1])
+                nodesA[vert1[0]].neighA.append([nodesA[vert2[0]],dist])
+                nodesA[vert2[0]].neighA.append([nodesA[vert1[0]],dist])
+
+    #lines connected by the chosen geometric rule, at half of the sum of their lengths, as in GAUS Lines 1.1
+    def buildLines():
+        featsA, geomsA, halfA = [], [], []
+        for edge in inputEdges.getFeatures():
+            featsA.append(nodesA[edge.id()])
+            geomsA.append(edge.geometry())
+            imp = 1 if impField == [] else sum(edge.attribute(name) for name in impField if edge.attribute(name) != NULL)
+            halfA.append(imp*(distArea.measureLength(edge.geometry()) if analysisType == 1 else 1))
+        for pos1, pos2 in sorted(vertexPairs(geomsA) if geomR == 0 else crossingPairs(geomsA)):
+            dist = (halfA[pos1] + halfA[pos2])/2
+            featsA[pos1].neighA.append([featsA[pos2], dist])
+            featsA[pos2].neighA.append([featsA[pos1], dist])
+
+    #Overlapping Vertices by Hashing, as in GAUS Lines 1.1
+    #the vertices are bucketed by their coordinates (cells of the tolerance size), and an end of a line can only touch the lines with a vertex in its cell or in the cells around it
+    def vertexPairs(geomsA):
+        def cellOf(vertex):
+            return (vertex.x(), vertex.y()) if vertexTol == 0.0 else (math.floor(vertex.x()/vertexTol), math.floor(vertex.y()/vertexTol))
+
+        cellsD = {} #lines with a vertex in each cell and the coordinates of the vertex
+        endsD = {} #ends of the parts of each line
+        for pos in range(len(geomsA)):
+            partsA = geomsA[pos].asMultiPolyline() if geomsA[pos].isMultipart() else [geomsA[pos].asPolyline()]
+            for part in partsA:
+                for vertex in part: cellsD.setdefault(cellOf(vertex), []).append((pos, vertex.x(), vertex.y()))
+            endsD[pos] = [vertex for part in partsA if part != [] for vertex in [part[0], part[-1]]]
+        pairsS = set()
+        for pos in range(len(geomsA)):
+            for vertex in endsD[pos]:
+                cellX, cellY = cellOf(vertex)
+                for cell in ([(cellX, cellY)] if vertexTol == 0.0 else [(cellX + dx, cellY + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]):
+                    for other, x, y in cellsD.get(cell, []):
+                        if other != pos and (vertexTol == 0.0 or (x - vertex.x())**2 + (y - vertex.y())**2 <= vertexTol**2): pairsS.add((min(pos, other), max(pos, other)))
+        if exactCheck: pairsS = set(pair for pair in pairsS if geomsA[pair[1]].touches(geomsA[pair[0]]))
+        return pairsS
+
+    #Crossing Lines by Spatial Index, as in GAUS Lines 1.1
+    #only the lines with intersecting bounding boxes are candidates, tested by a prepared geometry of each line
+    #one relate gives the DE-9IM matrix of both rules: crossing lines meet at points of their interiors, touching lines only meet at their boundaries
+    def crossingPairs(geomsA):
+        linesIndex = QgsSpatialIndex()
+        for pos in range(len(geomsA)):
+            if not geomsA[pos].isEmpty(): linesIndex.addFeature(pos, geomsA[pos].boundingBox())
+        pairsS = set()
+        for pos in range(len(geomsA)):
+            if geomsA[pos].isEmpty(): continue
+            engine = QgsGeometry.createGeometryEngine(geomsA[pos].constGet())
+            engine.prepareGeometry()
+            for other in linesIndex.intersects(geomsA[pos].boundingBox()):
+                if other <= pos or not engine.intersects(geomsA[other].constGet()): continue
+                matrix = engine.relate(geomsA[other].constGet())
+                if matrix[0] == '0' or (geomR == 2 and matrix[0] == 'F' and matrix[1] + matrix[3] + matrix[4] != 'FFF'): pairsS.add((pos, other))
+        return pairsS
+
+    #Multi-Source Shortest Paths (Djikstra Algorithm with heapq as Priority Queue)
+    #every node keeps the first k different facilities that reach it, a facility rejected by a node cannot be among the k nearest of the nodes reached through it
+    def searchFacilities():
+        labelsA = [[] for i in range(featCount)] #[facility id, cost] of the nearest facilities of each node
+        heap = [(0, facId, facId) for facId in facilitiesL]
+        heapq.heapify(heap)
+        while heap != []:
+            cost, facId, nodeId = heapq.heappop(heap)
+            labels = labelsA[nodeId]
+            if len(labels) == nearest or any(label[0] == facId for label in labels): continue
+            labels.append([facId, cost])
+            for neigh, dist in nodesA[nodeId].neighA:
+                newCost = cost + dist
+                if len(labelsA[neigh.id]) < nearest and (maxCost == 0.0 or newCost <= maxCost): heapq.heappush(heap, (newCost, facId, neigh.id))
+        return labelsA
+
+    #import user input parameters
+    network = instance.parameterAsEnum(parameters, 'network', context)
+    inputEdges = instance.parameterAsVectorLayer(parameters, 'inpLines', context)
+    distArea = lengthCalculator(inputEdges) #single calculator of the lengths of the lines
+    inputNodes = instance.parameterAsVectorLayer(parameters, 'inpPoints', context)
+    analysisType = instance.parameterAsEnum(parameters, 'analysis', context)
+    geomR = instance.parameterAsEnum(parameters, 'geomrule', context)
+    vertexTol = instance.parameterAsDouble(parameters, 'vertextol', context) #tolerance of the overlapping vertices
+    exactCheck = instance.parameterAsBool(parameters, 'exactcheck', context) #touches test of the lines with overlapping vertices
+    impField = instance.parameterAsFields(parameters, 'impedance', context)
+    loadField = [name.strip() for name in instance.parameterAsString(parameters, 'load', context).split(',') if name.strip() != '']
+    facSet = instance.parameterAsEnum(parameters, 'facilities', context)
+    facExpr = instance.parameterAsExpression(parameters, 'facexpr', context)
+    nearest = min(max(1, instance.parameterAsInt(parameters, 'nearest', context)), 9)
+    maxCost = instance.parameterAsDouble(parameters, 'maxcost', context)
+    prec = instance.parameterAsDouble(parameters, 'precision', context)
+
+    if network == 0 and inputNodes == None:
+        feedback.reportError('Points+Lines networks require the points vector layer')
+        return {'numoffeat': 0}
+    resLayer = inputNodes if network == 0 else inputEdges #layer whose features are the nodes of the network
+
+    #nodes initialization
+    featCount = verifyFeatCount(resLayer)
+    nodesA = [0 for i in range(featCount)] #array that stores network nodes
+    loadA = array('d', [0])*featCount #load of each node, indexed by its id
+    for feat in resLayer.getFeatures():
+        nodesA[feat.id()] = NodeObj(feat)
+        loadA[feat.id()] = fieldsSum(feat, [name for name in loadField if resLayer.fields().indexFromName(name) != -1])
+    feedback.pushInfo("Initialize Edges")
+    if network == 0: buildPointsLines()
+    else: buildLines()
+
+    #facilities
+    if facSet == 0: facilitiesL = sorted(resLayer.selectedFeatureIds())
+    else: facilitiesL = sorted(feat.id() for feat in resLayer.getFeatures(QgsFeatureRequest().setFilterExpression(facExpr))) if facExpr != "" else []
+    if facilitiesL == []:
+        feedback.reportError('No feature matches the facility features option')
+        return {'numoffeat': 0}
+    feedback.pushInfo(f'{len(facilitiesL)} Facilities, {nearest} Nearest Facilities per Feature')
+
+    labelsA = searchFacilities()
+    catchD = {facId: 0 for facId in facilitiesL} #catchment load of each facility
+    for node in nodesA:
+        if node != 0 and labelsA[node.id] != []: catchD[labelsA[node.id][0][0]] += loadA[node.id]
+    feedback.pushInfo(f'{len([node for node in nodesA if node != 0 and labelsA[node.id] == []])} Features without Facilities within the Maximum Cost')
+
+    #update table of contents
+    strBegin = "T" if analysisType == 0 else "G"
+    strMid = "g" if maxCost == 0.0 else str(int(maxCost))
+    if len(strMid) > 5: strBegin += strMid[0:5]
+    else: strBegin += strMid
+    indexD = {}
+    for code in [prefix + str(rank+1) for rank in range(nearest) for prefix in ["Fc", "Cs"]] + ["Ctl"]:
+        aux = 0
+        while resLayer.fields().indexFromName(strBegin + code + str(aux)) != -1: aux += 1
+        resLayer.dataProvider().addAttributes([QgsField(strBegin + code + str(aux),QVariant.Double)])
+        resLayer.updateFields()
+        indexD[code] = resLayer.fields().indexFromName(strBegin + code + str(aux))
+
+    changesD = {}
+    for node in nodesA:
+        if node == 0: continue
+        metricsD = {}
+        for rank in range(len(labelsA[node.id])):
+            metricsD[indexD["Fc" + str(rank+1)]], metricsD[indexD["Cs" + str(rank+1)]] = labelsA[node.id][rank]
+        if node.id in catchD: metricsD[indexD["Ctl"]] = catchD[node.id]
+        if metricsD != {}: changesD[node.id] = metricsD
+    resLayer.dataProvider().changeAttributeValues(changesD)
+
+    return {'numoffeat': len(changesD)}
@@ -0,0 +1,200 @@
+import math
+from qgis.processing import alg
+from qgis.PyQt.QtCore import QVariant
+from qgis.core import (QgsVectorLayer, QgsVectorFileWriter, QgsFeature, QgsField, QgsGeometry, QgsPointXY, QgsRectangle, QgsSpatialIndex)
+
+#ui input parameters
+@alg(name='GAUS_noding11', label='GAUS Noding 1.1', group='GAUS v1.1', group_label='GAUS v1.1')
+@alg.input(type=alg.VECTOR_LAYER, name='inpLines', label='Lines', types=[1])
+@alg.input(type=alg.NUMBER, name='tolerance', label='Snapping Tolerance (0.0 = Exact Intersections)', default=0.0)
+@alg.input(type=alg.VECTOR_LAYER_DEST, name='dest', label='Noded Lines')
+@alg.input(type=alg.VECTOR_LAYER_DEST, name='nodesdest', label='Nodes of the Noded Lines [optional]', optional = True, createByDefault = False)
+
+#ui output definition (does nothing, it is here because qgis requires the declaration of at least one output)
+@alg.output(type=alg.NUMBER, name='numoffeat', label='Number of Segments Created')
+
+def computeMetrics(instance, parameters, context, feedback, inputs):
+    """
+    Splits the lines of a network at their intersections and T-junctions, so every connection of the network is at the ends of the segments.
+
+    Fields Description:
+    Lines: vector layer of the network's lines.
+    Snapping Tolerance: ends of lines closer than it to another line are moved to it and split it there, and ends closer than it to each other are joined in a single node. Zero only splits the lines where they cross or touch each other. The tolerance is in the units of the layer.
+    Noded Lines: shapefile with the segments of the lines between their nodes. The segments keep the fields of their lines, and the fields gausOrig (id of the original line), gausFrom and gausTo (ids of the nodes at their ends) are added. The ends of the segments at the same node have the same coordinates.
+    Nodes of the Noded Lines: shapefile with a point per node, whose ids are the ones in gausFrom and gausTo, and the number of segments at each node in the field gausDeg.
+    The noded lines are meant to be analysed many times without finding their crossings again: by GAUS Lines 1.1 with the Overlapping Vertices rule, without the exact geometric test, or by GAUS Points+Lines 1.1 with the nodes and a distance precision of zero.
+    Lines crossing themselves are not split at their own crossings. Overlapping lines are split at the ends of the overlaps and each of them keeps its segments.
+    """
+
+    #Intersections of Segments
+    #orientations of the ends of each segment to the other one, an end on the other segment gives its own coordinates, so both lines share them exactly
+    #returns the positions (0 to 1) of the intersections along each segment and their coordinates
+    def segmentCuts(a0, a1, b0, b1):
+        dax, day, dbx, dby = a1[0] - a0[0], a1[1] - a0[1], b1[0] - b0[0], b1[1] - b0[1]
+        orientA0, orientA1 = dbx*(a0[1] - b0[1]) - dby*(a0[0] - b0[0]), dbx*(a1[1] - b0[1]) - dby*(a1[0] - b0[0])
+        orientB0, orientB1 = dax*(b0[1] - a0[1]) - day*(b0[0] - a0[0]), dax*(b1[1] - a0[1]) - day*(b1[0] - a0[0])
+        cutsL = []
+        for orient, point in [(orientA0, a0), (orientA1, a1), (orientB0, b0), (orientB1, b1)]:
+            if orient != 0: continue
+            t, u = positionOn(point, a0, dax, day), positionOn(point, b0, dbx, dby)
+            if 0 <= t <= 1 and 0 <= u <= 1: cutsL.append((t, u, point))
+        if cutsL == [] and (orientA0 > 0) != (orientA1 > 0) and (orientB0 > 0) != (orientB1 > 0):
+            t = orientA0/(orientA0 - orientA1)
+            cutsL.append((t, orientB0/(orientB0 - orientB1), (a0[0] + t*dax, a0[1] + t*day)))
+        return cutsL
+
+    #position (0 to 1) of a point along a segment, -1 for segments without length
+    def positionOn(point, p0, dx, dy):
+        length = dx*dx + dy*dy
+        return ((point[0] - p0[0])*dx + (point[1] - p0[1])*dy)/length if length > 0 else -1
+
+    #nearest point of a segment to a point, with its position along the segment and its distance
+    def projectPoint(point, b0, b1):
+        dbx, dby = b1[0] - b0[0], b1[1] - b0[1]
+        lenB = dbx*dbx + dby*dby
+        u = min(1, max(0, ((point[0] - b0[0])*dbx + (point[1] - b0[1])*dby)/lenB)) if lenB > 0 else 0
+        near = b0 if u == 0 else (b1 if u == 1 else (b0[0] + u*dbx, b0[1] + u*dby))
+        return u, near, math.hypot(point[0] - near[0], point[1] - near[1])
+
+    #cuts of a pair of parts, and ends of each part moved to the other one within the tolerance
+    def nodePair(i, j):
+        ptsI, ptsJ = partsL[i][1], partsL[j][1]
+        for a in range(len(ptsI) - 1):
+            boxA = segmentBox(ptsI[a], ptsI[a+1])
+            for b in range(len(ptsJ) - 1):
+                if not boxesOverlap(boxA, segmentBox(ptsJ[b], ptsJ[b+1])): continue
+                for t, u, point in segmentCuts(ptsI[a], ptsI[a+1], ptsJ[b], ptsJ[b+1]):
+                    cutsD.setdefault(i, []).append((a, t, point))
+                    cutsD.setdefault(j, []).append((b, u, point))
+        if tolerance <= 0.0: return
+        for part, other in [(i, j), (j, i)]:
+            ptsP, ptsO = partsL[part][1], partsL[other][1]
+            for end in [0, len(ptsP) - 1]:
+                u, near, dist, seg = min((projectPoint(ptsP[end], ptsO[b], ptsO[b+1]) + (b,) for b in range(len(ptsO) - 1)), key = lambda proj: proj[2]) #nearest segment of the other part
+                if 0 < dist <= tolerance and dist < snapsD.get((part, end), (math.inf,))[0]: snapsD[(part, end)] = (dist, near, other, seg, u)
+
+    def segmentBox(p0, p1):
+        return (min(p0[0], p1[0]) - tolerance, min(p0[1], p1[1]) - tolerance, max(p0[0], p1[0]) + tolerance, max(p0[1], p1[1]) + tolerance)
+
+    def boxesOverlap(boxA, boxB):
+        return boxA[0] <= boxB[2] and boxB[0] <= boxA[2] and boxA[1] <= boxB[3] and boxB[1] <= boxA[3]
+
+    #segments of a part between its cuts, the cut points are the ends of the segments at both sides
+    def splitPart(pts, cutsL):
+        piecesL, current = [], [pts[0]]
+        cutsL = sorted(cutsL)
+        ind = 0
+        for seg in range(len(pts) - 1):
+            while ind < len(cutsL) and cutsL[ind][0] == seg:
+                point = cutsL[ind][2]
+                ind += 1
+                if point != current[-1]: current.append(point)
+                if len(current) > 1 and point not in (pts[0], pts[-1]):
+                    piecesL.append(current)
+                    current = [point]
+            if pts[seg+1] != current[-1]: current.append(pts[seg+1])
+        if len(current) > 1: piecesL.append(current)
+        return piecesL
+
+    #Nodes of the Segments
+    #ends of the segments are joined when they are closer than the tolerance, the first end found gives the coordinates of the node
+    def nodeOf(point):
+        if tolerance <= 0.0: cellsL = [point]
+        else:
+            cellX, cellY = math.floor(point[0]/tolerance), math.floor(point[1]/tolerance)
+            cellsL = [(cellX + dx, cellY + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+        for cell in cellsL:
+            for node in nodeCellsD.get(cell, []):
+                if math.hypot(point[0] - nodesL[node][0], point[1] - nodesL[node][1]) <= tolerance: return node
+        nodesL.append(point)
+        nodeCellsD.setdefault(cellsL[0] if tolerance <= 0.0 else cellsL[4], []).append(len(nodesL) - 1)
+        return len(nodesL) - 1
+
+    #import user input parameters
+    inputEdges = instance.parameterAsVectorLayer(parameters, 'inpLines', context)
+    tolerance = max(0.0, instance.parameterAsDouble(parameters, 'tolerance', context))
+    outPath = instance.parameterAsOutputLayer(parameters, 'dest', context)
+    nodesPath = instance.parameterAsOutputLayer(parameters, 'nodesdest', context)
+
+    #parts of the lines, with the id of their line
+    partsL = []
+    keptL = [ind for ind in range(len(inputEdges.fields())) if inputEdges.fields()[ind].name() not in ["gausOrig", "gausFrom", "gausTo"]] #fields copied to the segments
+    attrsD = {} #values of the copied fields of each line
+    for feat in inputEdges.getFeatures():
+        attrsD[feat.id()] = [feat.attributes()[ind] for ind in keptL]
+        geom = feat.geometry()
+        for part in (geom.asMultiPolyline() if geom.isMultipart() else [geom.asPolyline()]):
+            pts = [(vertex.x(), vertex.y()) for vertex in part]
+            pts = [pts[ind] for ind in range(len(pts)) if ind == 0 or pts[ind] != pts[ind-1]] #repeated vertices
+            if len(pts) > 1: partsL.append((feat.id(), pts))
+    feedback.pushInfo(f'{len(partsL)} Parts of {inputEdges.featureCount()} Lines')
+
+    #pairs of parts with overlapping bounding boxes (grown by the tolerance), found in a spatial index
+    spaceIndex = QgsSpatialIndex()
+    boxesA = []
+    for ind in range(len(partsL)):
+        xsL, ysL = [pt[0] for pt in partsL[ind][1]], [pt[1] for pt in partsL[ind][1]]
+        boxesA.append(QgsRectangle(min(xsL) - tolerance, min(ysL) - tolerance, max(xsL) + tolerance, max(ysL) + tolerance))
+        spaceIndex.addFeature(ind, boxesA[-1])
+    cutsD = {} #cuts of each part: segment, position along it and coordinates
+    snapsD = {} #ends moved within the tolerance: distance and new coordinates
+    for i in range(len(partsL)):
+        if feedback.isCanceled(): return {'numoffeat': 0}
+        if i % 1000 == 0: feedback.pushInfo(f'Noding Part {i}')
+        for j in spaceIndex.intersects(boxesA[i]):
+            if j > i: nodePair(i, j)
+        feedback.setProgress(90*(i+1)/len(partsL))
+    del spaceIndex, boxesA
+    for dist, near, other, seg, u in snapsD.values(): cutsD.setdefault(other, []).append((seg, u, near)) #only the nearest line of each end is split
+
+    #segments between the cuts, their ends joined in nodes
+    nodesL, nodeCellsD = [], {} #coordinates of the nodes and nodes of each cell
+    segmentsL = [] #original line, node ids and vertices of each segment
+    for i in range(len(partsL)):
+        pts = list(partsL[i][1])
+        for end in [0, len(pts) - 1]:
+            if (i, end) in snapsD: pts[end] = snapsD[(i, end)][1]
+        for piece in splitPart(pts, cutsD.get(i, [])):
+            fromNode, toNode = nodeOf(piece[0]), nodeOf(piece[-1])
+            piece[0], piece[-1] = nodesL[fromNode], nodesL[toNode]
+            piece = [piece[ind] for ind in range(len(piece)) if ind == 0 or piece[ind] != piece[ind-1]]
+            length = sum(math.hypot(piece[ind+1][0] - piece[ind][0], piece[ind+1][1] - piece[ind][1]) for ind in range(len(piece) - 1))
+            if length == 0 or (fromNode == toNode and length <= 2*tolerance): continue #segments collapsed by the tolerance
+            segmentsL.append((partsL[i][0], fromNode, toNode, piece))
+    del partsL, cutsD, snapsD
+    feedback.pushInfo(f'{len(segmentsL)} Segments and {len(nodesL)} Nodes Created')
+
+    #noded lines, with the fields of their original lines
+    crs = inputEdges.crs()
+    memLayer = QgsVectorLayer("LineString?crs=" + crs.authid(), "noded", "memory")
+    memLayer.dataProvider().addAttributes([inputEdges.fields()[ind] for ind in keptL] + [QgsField("gausOrig", QVariant.Int), QgsField("gausFrom", QVariant.Int), QgsField("gausTo", QVariant.Int)])
+    memLayer.updateFields()
+    featsA = []
+    for origId, fromNode, toNode, piece in segmentsL:
+        segFeat = QgsFeature(memLayer.fields())
+        segFeat.setGeometry(QgsGeometry.fromPolylineXY([QgsPointXY(x, y) for x, y in piece]))
+        segFeat.setAttributes(attrsD[origId] + [origId, fromNode, toNode])
+        featsA.append(segFeat)
+    memLayer.dataProvider().addFeatures(featsA)
+    QgsVectorFileWriter.writeAsVectorFormat(memLayer, outPath, "System", crs, "ESRI Shapefile")
+
+    #nodes, with the number of segments at each one
+    if nodesPath != "":
+        degreeA = [0]*len(nodesL)
+        for origId, fromNode, toNode, piece in segmentsL:
+            degreeA[fromNode] += 1
+            degreeA[toNode] += 1
+        nodesLayer = QgsVectorLayer("Point?crs=" + crs.authid(), "nodes", "memory")
+        nodesLayer.dataProvider().addAttributes([QgsField("gausDeg", QVariant.Int)])
+        nodesLayer.updateFields()
+        featsA = []
+        for node in range(len(nodesL)):
+            nodeFeat = QgsFeature(nodesLayer.fields())
+            nodeFeat.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(nodesL[node][0], nodesL[node][1])))
+            nodeFeat.setAttributes([degreeA[node]])
+            featsA.append(nodeFeat)
+        nodesLayer.dataProvider().addFeatures(featsA)
+        QgsVectorFileWriter.writeAsVectorFormat(nodesLayer, nodesPath, "System", crs, "ESRI Shapefile")
+    feedback.setProgress(100)
+
+    return {'numoffeat': len(segmentsL)}
@@ -0,0 +1,264 @@
+import csv
+import heapq
+import multiprocessing
+from array import array
+from queue import Empty
+from qgis import processing
+from qgis.processing import alg
+from qgis.PyQt.QtCore import QVariant
+from qgis.core import (NULL, QgsSpatialIndex, QgsDistanceArea, QgsField, QgsFeatureRequest)
+
+#ui input parameters
+@alg(name='GAUS_od11', label='GAUS OD Assignment 1.1', group='GAUS v1.1', group_label='GAUS v1.1')
+@alg.input(type=alg.VECTOR_LAYER, name='inpLines', label='Lines', types=[1])
+@alg.input(type=alg.VECTOR_LAYER, name='inpPoints', label='Points', types=[0])
+@alg.input(type=alg.ENUM, name='analysis', label='Analysis Type', options=['Topological','Geodetic'], default = 1)
+@alg.input(type=alg.FIELD, name='impedance',label='Impedance of Lines',parentLayerParameterName = 'inpLines',allowMultiple=True,optional = True)
+@alg.input(type=alg.FIELD, name='pointid',label='Identifier of Points (empty = Feature Id)',parentLayerParameterName = 'inpPoints',optional = True)
+@alg.input(type=alg.VECTOR_LAYER, name='inpOD', label='OD Table (Layer)', types=[5], optional = True)
+@alg.input(type=alg.FILE, name='odcsv', label='OD Table (CSV File)', extension='csv', optional = True)
+@alg.input(type=alg.STRING, name='origin', label='Origin Column', default='origin')
+@alg.input(type=alg.STRING, name='destination', label='Destination Column', default='destination')
+@alg.input(type=alg.STRING, name='flow', label='Flow Column', default='flow')
+@alg.input(type=alg.NUMBER, name='precision', label='Distance Precision', default=0.00015)
+@alg.input(type=alg.NUMBER, name='workers', label='Worker Processes', default=1)
+
+#ui output definition (does nothing, it is here because qgis requires the declaration of at least one output)
+@alg.output(type=alg.NUMBER, name='numoffeat', label='Number of Features Processed')
+
+def computeMetrics(instance, parameters, context, feedback, inputs):
+    """
+    Assigns the flows of an origin-destination table to the shortest paths of a network composed of points whose connections are indicated by lines.
+
+    Fields Description:
+    Points: vector layer of the network's nodes.
+    Lines: vector layer of the network's lines.
+    Analysis: in topological analysis, the distance between connected nodes is equal to 1. In geodetic analysis, the geodetic distance between them is considered. Lengths are planar, in the units of the layer, for projected coordinate systems, and ellipsoidal, in meters, for geographic coordinate systems, with the ellipsoid of the project.
+    Impedance: field of the lines vector layer containing the impedance of each line.
+    Identifier of Points: field of the points vector layer with the identifiers used in the OD table. If it is left blank, the feature ids are used. Whole numbers match regardless of being stored in integer or real fields (12 and 12.0 are the same point).
+    OD Table (Layer) and OD Table (CSV File): table with one row per origin-destination pair, informed as a layer or as a CSV file with a header. When both are informed, the layer is used.
+    Origin, Destination and Flow Columns: names of the columns of the OD table with the identifiers of the origin and destination points and the flow between them. Rows of the same pair are added.
+    Distance Precision: maximum distance between point and line vertex that will be considered as a connection between them.
+    Worker Processes: number of processes among which the origins are distributed. Values higher than 1 are only used on systems that are able to fork the QGIS process.
+    The flows are grouped by origin, so each origin needs a single shortest path search and a single backward accumulation, whatever the number of its destinations. The flow between two points is split equally among their shortest paths, as in the betweenness, parallel lines of the same cost being different paths. The flow of each point (all the flow that starts, ends or passes through it) is written in the points vector layer and the flow of each line is written in the lines vector layer. Pairs whose points are not connected and pairs with the same origin and destination are not assigned.
+    """
+
+    #Nodes of the network
+    class NodeObj:
+        __slots__ = ('id', 'neighA')
+        def __init__(self, feat):
+            self.id = feat.id()
+            self.neighA = []  #list of connected nodes, with the distance and the id of the line
+
+    #verifies if highest id number is lower than number of features
+    #in order to avoid potential conflicts with matrices' size
+    def verifyFeatCount(inputFeat):
+        featCount = inputFeat.featureCount()
+        for feat in inputFeat.getFeatures(): featCount = max(featCount, feat.id()+1)
+        return featCount
+
+    #Length Calculator
+    #a single calculator for every line: planar lengths in the units of the layer for projected systems, ellipsoidal lengths in meters for geographic systems
+    def lengthCalculator(layer):
+        distArea = QgsDistanceArea()
+        if layer.crs().isGeographic():
+            distArea.setSourceCrs(layer.crs(), context.transformContext())
+            distArea.setEllipsoid(context.ellipsoid() if context.ellipsoid() not in ('', 'NONE') else layer.crs().ellipsoidAcronym())
+        return distArea
+
+    def defineDistance(edge,analysisType,impField,edgeA,edgeB):
+        if impField == []: imp = 1
+        else:
+            imp = 0
+            for i in range(len(impField)):
+                if edge.attribute(impField[i]) != NULL: imp += edge.attribute(impField[i])
+
+        dist = imp if analysisType == 0 else imp*distArea.measureLine(edgeA,edgeB)
+        return dist
+
+    #identifiers are compared as text, whole numbers of real fields (12.0) are written as integers (12)
+    def idText(value):
+        if isinstance(value, float) and value.is_integer(): value = int(value)
+        value = str(value).strip()
+        if value.endswith('.0') and value[:-2].lstrip('-').isdigit(): value = value[:-2]
+        return value
+
+    #names of the columns of the OD table, from the fields of the layer or from the header of the CSV file
+    def tableColumns():
+        if inputOD != None: return inputOD.fields().names()
+        with open(odPath, newline='') as odFile: return next(csv.reader(odFile), [])
+
+    #rows of the OD table as (origin, destination, flow), from the layer or from the CSV file
+    def readTable():
+        if inputOD != None:
+            for feat in inputOD.getFeatures(QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry)):
+                yield feat.attribute(originCol), feat.attribute(destinCol), feat.attribute(flowCol)
+        else:
+            with open(odPath, newline='') as odFile:
+                for row in csv.DictReader(odFile): yield row[originCol], row[destinCol], row[flowCol]
+
+    #Compute Shortest Paths (Djikstra Algorithm with heapq as Priority Queue)
+    #the lines of minimum cost that reach each node are kept, each one is a different shortest path
+    def searchFrom(source):
+        costD, numSP, linksD = {source.id: 0}, {source.id: 1}, {source.id: []}
+        heap, sortedA, doneS = [(0, source.id, source)], [], set()
+        while heap != []:
+            cost, closestId, closest = heapq.heappop(heap)
+            if closestId in doneS: continue
+            doneS.add(closestId)
+            sortedA.append(closest)
+            for neigh, dist, lineId in closest.neighA:
+                if neigh.id in doneS: continue
+                newCost = cost + dist
+                prevCost = costD.get(neigh.id, 99999999999999)
+                if prevCost > newCost:
+                    costD[neigh.id], numSP[neigh.id], linksD[neigh.id] = newCost, numSP[closestId], [(closest, lineId)]
+                    heapq.heappush(heap, (newCost, neigh.id, neigh))
+                elif prevCost == newCost:
+                    numSP[neigh.id] += numSP[closestId]
+                    linksD[neigh.id].append((closest, lineId))
+        return sortedA, numSP, linksD
+
+    #backward accumulation of the flows of an origin over its shortest paths
+    def assignOrigin(source, nodeFlowA, lineFlowA):
+        flowD = {}
+        for destinId, flow in zip(*originsD[source.id]): flowD[destinId] = flowD.get(destinId, 0) + flow
+        sortedA, numSP, linksD = searchFrom(source)
+        unassigned = sum(flow for destinId, flow in flowD.items() if destinId not in numSP)
+        if source.id in flowD: unassigned += flowD.pop(source.id)
+        for node in reversed(sortedA):
+            flow = flowD.get(node.id, 0)
+            if flow == 0: continue
+            nodeFlowA[node.id] += flow
+            for pivot, lineId in linksD[node.id]:
+                share = (numSP[pivot.id]/numSP[node.id])*flow
+                lineFlowA[lineId] += share
+                flowD[pivot.id] = flowD.get(pivot.id, 0) + share
+        return unassigned
+
+    #assigns a share of the origins inside a forked process
+    def assignShare(originsL, queue):
+        try:
+            nodeFlowA, lineFlowA = array('d', [0])*nodesCount, array('d', [0])*linesCount
+            unassigned = sum(assignOrigin(nodesA[originId], nodeFlowA, lineFlowA) for originId in originsL)
+            queue.put((nodeFlowA, lineFlowA, unassigned))
+        except Exception as error: queue.put(f'{type(error).__name__}: {error}') #failure of the share, reported by the main process
+        finally: queue.put(None)
+
+    #import user input parameters
+    inputNodes = instance.parameterAsVectorLayer(parameters, 'inpPoints', context)
+    inputEdges = instance.parameterAsVectorLayer(parameters, 'inpLines', context)
+    distArea = lengthCalculator(inputEdges) #single calculator of the lengths of the lines
+    inputOD = instance.parameterAsVectorLayer(parameters, 'inpOD', context)
+    odPath = instance.parameterAsFile(parameters, 'odcsv', context)
+    impField = instance.parameterAsFields(parameters, 'impedance', context)
+    idField = instance.parameterAsFields(parameters, 'pointid', context)
+    originCol = instance.parameterAsString(parameters, 'origin', context)
+    destinCol = instance.parameterAsString(parameters, 'destination', context)
+    flowCol = instance.parameterAsString(parameters, 'flow', context)
+    analysisType = instance.parameterAsEnum(parameters, 'analysis', context)
+    prec = instance.parameterAsDouble(parameters, 'precision', context)
+    workers = max(1, instance.parameterAsInt(parameters, 'workers', context))
+
+    if inputOD == None and odPath == "":
+        feedback.reportError('An OD table must be informed as a layer or as a CSV file')
+        return {'numoffeat': 0}
+    columnsL = tableColumns()
+    missingL = [col for col in [originCol, destinCol, flowCol] if col not in columnsL]
+    if missingL != []:
+        feedback.reportError(f'Columns not found in the OD table: {", ".join(missingL)}. Available columns: {", ".join(columnsL)}')
+        return {'numoffeat': 0}
+
+    #nodes initialization
+    nodesCount = verifyFeatCount(inputNodes)
+    nodesA = [0 for i in range(nodesCount)] #array that stores network nodes
+    idsD = {} #identifiers of the OD table and their nodes
+    for node in inputNodes.getFeatures():
+        nodesA[node.id()] = NodeObj(node)
+        idsD[idText(node.attribute(idField[0])) if idField != [] else str(node.id())] = node.id()
+
+    #Initialize Edges
+    feedback.pushInfo("Initialize Edges")
+    linesCount = verifyFeatCount(inputEdges)
+    nodesSpaceIndex = QgsSpatialIndex(inputNodes.getFeatures())
+    linesS = set() #lines connected to the points
+    for edge in inputEdges.getFeatures():
+        edgesVertices = edge.geometry().asMultiPolyline()
+        vert1 = nodesSpaceIndex.nearestNeighbor(edgesVertices[0][0], 1, prec)
+        vert2 = nodesSpaceIndex.nearestNeighbor(edgesVertices[0][-1], 1, prec)
+        if vert1 != [] and vert2 != []:
+            dist = defineDistance(edge,analysisType,impField,edgesVertices[0][0],edgesVertices[0][-1])
+            nodesA[vert1[0]].neighA.append([nodesA[vert2[0]],dist,edge.id()])
+            nodesA[vert2[0]].neighA.append([nodesA[vert1[0]],dist,edge.id()])
+            linesS.add(edge.id())
+
+    #OD table grouped by origin: destinations and flows of each origin in typed arrays
+    feedback.pushInfo("Reading OD Table")
+    originsD, rows, unknown = {}, 0, 0
+    for origin, destin, flow in readTable():
+        rows += 1
+        originId, destinId = idsD.get(idText(origin)), idsD.get(idText(destin))
+        try: flow = float(flow)
+        except (TypeError, ValueError): flow = None
+        if originId == None or destinId == None or flow == None:
+            unknown += 1
+            continue
+        if originId not in originsD: originsD[originId] = [array('q'), array('d')]
+        originsD[originId][0].append(destinId)
+        originsD[originId][1].append(flow)
+        if rows % 1000000 == 0: feedback.pushInfo(f'{rows} OD Pairs Read')
+    feedback.pushInfo(f'{rows} OD Pairs from {len(originsD)} Origins')
+    if unknown > 0: feedback.pushWarning(f'{unknown} rows of the OD table have unknown points or invalid flows and were not assigned')
+
+    #flows assignment, one search per origin
+    nodeFlowA, lineFlowA = array('d', [0])*nodesCount, array('d', [0])*linesCount
+    unassigned = 0
+    originsL = sorted(originsD)
+    if workers > 1 and 'fork' in multiprocessing.get_all_start_methods() and len(originsL) > 1:
+        feedback.pushInfo(f'Assigning {len(originsL)} Origins in {workers} Processes')
+        ctx = multiprocessing.get_context('fork')
+        queue = ctx.Queue()
+        procL = [ctx.Process(target=assignShare, args=(originsL[w::workers], queue)) for w in range(workers)]
+        for proc in procL: proc.start()
+        finished, failedL = 0, []
+        while finished < len(procL):
+            try: item = queue.get(timeout=1)
+            except Empty:
+                if feedback.isCanceled() or any(proc.exitcode not in (None, 0) for proc in procL): break #canceled, or a process ended without finishing its share
+                continue
+            if item == None: finished += 1
+            elif isinstance(item, str): failedL.append(item)
+            else:
+                for ind in range(nodesCount): nodeFlowA[ind] += item[0][ind]
+                for ind in range(linesCount): lineFlowA[ind] += item[1][ind]
+                unassigned += item[2]
+        if failedL != [] or finished < len(procL):
+            for proc in procL: proc.terminate()
+        for proc in procL: proc.join()
+        if not feedback.isCanceled() and (failedL != [] or any(proc.exitcode != 0 for proc in procL)): #processes terminated by the cancellation are not failures
+            feedback.reportError('Assignment failed in a worker process, no flows were written: ' + (failedL[0] if failedL != [] else f'exit code {[proc.exitcode for proc in procL]}'))
+            return {'numoffeat': 0}
+    else:
+        if workers > 1: feedback.pushWarning('Forking processes is not available in this system, origins will be assigned in a single process')
+        for count in range(len(originsL)):
+            if feedback.isCanceled(): break
+            if count % 50 == 0: feedback.pushInfo(f'Assigning Origin {originsL[count]}')
+            unassigned += assignOrigin(nodesA[originsL[count]], nodeFlowA, lineFlowA)
+            feedback.setProgress(100*(count+1)/len(originsL))
+    if feedback.isCanceled():
+        feedback.pushWarning('Assignment canceled, no flows were written')
+        return {'numoffeat': 0}
+    if unassigned != 0: feedback.pushWarning(f'Flow of {unassigned:g} between points not connected or equal was not assigned')
+
+    #update table of contents
+    strBegin = "T" if analysisType == 0 else "G"
+    strBegin += "g"
+    for layer, valuesA, idsL in [(inputNodes, nodeFlowA, [node.id for node in nodesA if node != 0]), (inputEdges, lineFlowA, sorted(linesS))]:
+        aux = 0
+        while layer.fields().indexFromName(strBegin + "Flw" + str(aux)) != -1: aux += 1
+        layer.dataProvider().addAttributes([QgsField(strBegin + "Flw" + str(aux),QVariant.Double)])
+        layer.updateFields()
+        flowIndex = layer.fields().indexFromName(strBegin + "Flw" + str(aux))
+        layer.dataProvider().changeAttributeValues({featId: {flowIndex: valuesA[featId]} for featId in idsL})
+
+    return {'numoffeat': len(originsL)}
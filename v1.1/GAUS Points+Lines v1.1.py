@@ -1,8 +1,20 @@
+import os
+import mmap
+import math
+import zlib
+import heapq
+import hashlib
+import struct
+import tempfile
+from array import array
 from decimal import Decimal
+from collections import OrderedDict
 from qgis import processing
 from qgis.processing import alg
 from qgis.PyQt.QtCore import QVariant
-from qgis.core import (NULL, QgsProject, QgsGeometry, QgsVectorFileWriter, QgsSpatialIndex, QgsDistanceArea, QgsPointXY, QgsField, QgsFields, QgsVectorDataProvider)
+from qgis.core import (NULL, QgsProject, QgsGeometry, QgsVectorFileWriter, QgsSpatialIndex, QgsDistanceArea, QgsPointXY, QgsField, QgsFields, QgsVectorDataProvider, QgsFeatureRequest)
+
+networksD = OrderedDict() #networks built by the last runs, kept while QGIS is open
 
 #ui input parameters
 @alg(name='GAUS_pl11', label='GAUS Points+Lines 1.1', group='GAUS v1.1', group_label='GAUS v1.1')
@@ -15,6 +27,20 @@ from qgis.core import (NULL, QgsProject, QgsGeometry, QgsVectorFileWriter, QgsSp
 @alg.input(type=alg.FIELD, name='load',label='Load of Points',parentLayerParameterName = 'inpPoints',allowMultiple=True,optional = True)
 @alg.input(type=alg.FIELD, name='supply',label='Supply in Points',parentLayerParameterName = 'inpPoints',allowMultiple=True,optional = True)
 @alg.input(type=alg.FIELD, name='demand',label='Demand in Points',parentLayerParameterName = 'inpPoints',allowMultiple=True,optional = True)
+@alg.input(type=alg.ENUM, name='sources', label='Source Features', options=['All Features','Selected Features','Features Matching Expression'], default = 0)
+@alg.input(type=alg.EXPRESSION, name='sourceexpr', label='Source Filter Expression', parentLayerParameterName = 'inpPoints', optional = True)
+@alg.input(type=alg.BOOL, name='contract', label='Contract Degree-2 Chains', default = False)
+@alg.input(type=alg.BOOL, name='blocks', label='Betweenness by Biconnected Components', default = False)
+@alg.input(type=alg.BOOL, name='twins', label='Share Searches of Structurally Equivalent Nodes', default = False)
+@alg.input(type=alg.BOOL, name='lineflows', label='Betweenness and Centrality of Lines', default = False)
+@alg.input(type=alg.FILE, name='oocfolder', label='Out-of-Core Folder (Memory-Mapped Files) [optional]', behavior=1, optional = True)
+@alg.input(type=alg.NUMBER, name='memcap', label='Memory Cap in Out-of-Core Mode (MB, 0.0 = No Cap)', default=0.0)
+@alg.input(type=alg.FILE, name='cachefolder', label='Cache Folder (Results and Networks) [optional]', behavior=1, optional = True)
+@alg.input(type=alg.NUMBER, name='cachesize', label='Cache Size (MB)', default=1000.0)
+@alg.input(type=alg.BOOL, name='diststats', label='Distance Distribution of Sources', default = False)
+@alg.input(type=alg.STRING, name='bands', label='Distance Bands (comma separated limits) [optional]', optional = True)
+@alg.input(type=alg.FILE_DEST, name='odfile', label='Export Origin-Destination Costs [optional]', optional = True, createByDefault = False)
+@alg.input(type=alg.ENUM, name='odformat', label='Origin-Destination Costs Format', options=['Dense Float32 Matrix','Compressed Blocks per Source'], default = 0)
 @alg.input(type=alg.VECTOR_LAYER_DEST, name='dest', label='Create New Shapefiles for Results? [optional]', optional = True, createByDefault = False)
 @alg.input(type=alg.NUMBER, name='precision', label='Distance Precision', default=0.00015)
 
@@ -28,55 +54,92 @@ def computeMetrics(instance, parameters, context, feedback, inputs):
     Fields Description:
     Points: vector layer of the network's nodes.
     Lines: vector layer of the network's lines.
-    Analysis: in topological analysis, the distance between connected nodes is equal to 1. In geodetic analysis, the geodetic distance between them is considered.
+    Analysis: in topological analysis, the distance between connected nodes is equal to 1. In geodetic analysis, the geodetic distance between them is considered. Lengths are planar, in the units of the layer, for projected coordinate systems, and ellipsoidal, in meters, for geographic coordinate systems, with the ellipsoid of the project.
     Metrics to be calculated: the selected metrics will be the ones whose result will be displayed in the attributes table.
     Analysis Radius: only the pairs of nodes whose distance is within the defined radius will be considered for the analysis. Zero means that all pairs of nodes are considered.
     Impedance: field of the lines vector layer containing the impedance of each line.
     Load: field of the points vector layer containing the load of each node.
     Supply: field of the points vector layer containing the supply of each node.
     Demand: field of the points vector layer containing the demand of each node.
-    Distance Precision: maximum distance between point and line vertex that will be considered as a connection between them.
+    Distance Precision: maximum distance between point and line vertex that will be considered as a connection between them. The points are grouped in cells of this size, and each end of a line is connected to the nearest point of its cell and of the cells around it. Zero connects each end to the nearest point at any distance. The ends without a point are counted in a warning.
+    Contract Degree-2 Chains: nodes connected to exactly two others are removed from the priority queue of the shortest paths and their distances are obtained along the chains that join the remaining nodes. The results are the same, with fewer operations in networks with many curve vertices or split nodes.
+    Betweenness by Biconnected Components: in global analysis, the betweenness is computed inside each biconnected component of the network, the parts joined by a single node being accounted for without searching them. The results are the same, with fewer operations in networks with many dead ends and tree-like branches, apart from paths of equal length that differ only by rounding. It has no effect on the other metrics or when a radius is defined.
+    Share Searches of Structurally Equivalent Nodes: nodes connected to the same nodes with the same distances, such as duplicated points attached to the same vertices, have the same shortest paths apart from the exchange between them. A single search is computed for each group of equivalent source nodes and the metrics of every node are accumulated from it. The results are the same.
+    Betweenness and Centrality of Lines: the Betweenness and Freeman-Krafta Centrality selected in the metrics are also computed for the lines, from the same shortest paths, and written in the lines vector layer. The shortest paths that reach a node through parallel lines of the same cost are split among them as different paths. Biconnected components are not used for the betweenness when this option is selected, and the option is not available in out-of-core mode.
+    Source Features: nodes from which the shortest paths are computed, which can be all nodes, the nodes currently selected or the nodes matching the filter expression. Accessibility, Opportunity, Reach and Connectivity are only written for the source nodes. Betweenness, Freeman-Krafta Centrality, Convergence and Polarity only consider the paths that start at the source nodes, and their fields are marked as restricted to the sources.
+    Out-of-Core Folder: for networks larger than the memory. If a folder is informed, the connections, distances, weights and metrics are stored in memory-mapped files inside it instead of node objects, and each shortest path search only keeps the nodes within the radius from its source. Chain contraction, biconnected components and shared searches are not used in this mode.
+    Memory Cap in Out-of-Core Mode: resident memory, in megabytes, above which the pages of the memory-mapped files are written to disk and released during the analysis. Zero means no cap.
+    Cache Folder: if a folder is informed, the results are stored in it, identified by a hash of the geometries of the points and lines, of the selected fields, of the source features and of the analysis type, radius and precision. When every requested field is found in the cache, the results are written without building the network, unless the origin-destination costs or the metrics of the lines are requested. The connections between points and lines are also stored, identified by the files of both layers, their modification times and the distance precision (the fields written by the analysis itself do not invalidate them), and the next runs with other metrics, radii, analysis types or impedances read them instead of snapping the lines again. The last networks read are also kept in memory while QGIS is open. Files are only used for layers stored in files without unsaved edits, and not in the out-of-core mode.
+    Cache Size: size of the cache folder, in megabytes, above which the least recently used results and networks are removed.
+    Distance Distribution of Sources: for each source node, the mean (Dav), the 25th, 50th (median), 75th and 90th percentiles (P25 to P90) of the shortest path costs to the other nodes within the radius, weighted by their load, and the load within each distance band (Bd1 to Bd9, the limit of each band being informed in the field alias). They are computed from the costs already found by the analysis.
+    Distance Bands: upper limits of the distance bands, separated by commas, up to 9 bands. The band fields hold the load of the nodes whose cost is not higher than the limit.
+    Export Origin-Destination Costs: file where the shortest path costs between each source and the features within the radius are written during the analysis, in native byte order. The dense matrix is a float32 matrix with one row and one column per feature id, which can be memory-mapped, with infinity for pairs that are not connected within the radius. The compressed blocks keep only the reached features of each source, for large networks: each block starts with the source id (int64), the number of destinations (int32) and the size of the compressed data (int32), followed by the destination ids (int64) and their costs (float32) compressed with zlib.
     Create New Shapefile for Results?: if it is left blank, the results will be inserted in the existing nodes vector layer. Otherwise, a copy of the vector layer will be created containing the results.
     """
 
     #Nodes of the network
+    #weights and metrics are kept in typed arrays indexed by the node id, the objects only hold the graph structure
     class NodeObj:
-        def __init__(self, featCount, feat, loadF, supplyF, demandF, metricsL):
+        __slots__ = ('id', 'heapPos', 'comp', 'pos', 'neighA')
+        def __init__(self, feat):
             self.id = feat.id()
             self.heapPos = -1 #current position of the node inside the heap
+            self.comp, self.pos = -1, -1 #connected component of the node and its position inside it
             self.neighA = []  #list of connected nodes
-            
-            #configurational metrics
-            if 0 in metricsL: self.access = 0
-            if 1 in metricsL: self.btw = 0
-            if 2 in metricsL: self.cent = 0
-            if 3 in metricsL: self.opport = 0
-            if 4 in metricsL: self.converg = 0
-            if 5 in metricsL: self.polarity = 0
-            if 6 in metricsL: self.reach = 0
-            
-            #calculation weightings
-            self.load, self.supply, self.demand = 0,0,0
-            if loadF == []: self.load = 1
-            else:
-                for i in range(len(loadF)): 
-                    if feat.attribute(loadF[i]) != NULL: self.load += feat.attribute(loadF[i])
-            if supplyF == []: self.supply = 1
-            else:
-                for i in range(len(supplyF)): 
-                    if feat.attribute(supplyF[i]) != NULL: self.supply += feat.attribute(supplyF[i])
-            if demandF == []: self.demand = 1
-            else:
-                for i in range(len(demandF)): 
-                    if feat.attribute(demandF[i]) != NULL: self.demand += feat.attribute(demandF[i])
-    
+
+    #sum of the selected fields of a feature, NULL values are ignored and no selected field means 1
+    def fieldsSum(feat, fieldsF):
+        if fieldsF == []: return 1
+        value = 0
+        for i in range(len(fieldsF)):
+            if feat.attribute(fieldsF[i]) != NULL: value += feat.attribute(fieldsF[i])
+        return value
+
     #verifies if highest id number is lower than number of features
     #in order to avoid potential conflicts with matrices' size
     def verifyFeatCount(inputFeat):
         featCount = inputFeat.featureCount()
         for feat in inputFeat.getFeatures(): featCount = max(featCount, feat.id()+1)
         return featCount
+
+    #Grid Snapping of the Line Ends
+    #the points are bucketed in cells of the precision size, so each end of a line is only compared with the points in its cell and in the cells around it
+    def cellOf(x, y):
+        return (x, y) if prec <= 0.0 else (math.floor(x/prec), math.floor(y/prec))
+
+    def pointCells():
+        cellsD = {} #points in each cell and their coordinates
+        for node in inputNodes.getFeatures(QgsFeatureRequest().setNoAttributes()):
+            point = node.geometry().asMultiPoint()[0] if node.geometry().isMultipart() else node.geometry().asPoint()
+            cellsD.setdefault(cellOf(point.x(), point.y()), []).append((node.id(), point.x(), point.y()))
+        return cellsD
+
+    #first and last vertices of the first part of a line, without converting every vertex
+    def lineEnds(geom):
+        part = geom.constGet().geometryN(0) if geom.isMultipart() else geom.constGet()
+        return QgsPointXY(part.startPoint()), QgsPointXY(part.endPoint())
+
+    #id of the nearest point within the precision, -1 when there is none
+    #a precision of zero only finds points at the same coordinates, then the nearest point at any distance, as the spatial index did
+    def snapEnd(vertex, cellsD, nodesSpaceIndex):
+        cellX, cellY = cellOf(vertex.x(), vertex.y())
+        nearest = (math.inf, -1)
+        for cell in ([(cellX, cellY)] if prec <= 0.0 else [(cellX + dx, cellY + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]):
+            for nodeId, x, y in cellsD.get(cell, []):
+                dist = math.sqrt((x - vertex.x())**2 + (y - vertex.y())**2)
+                if dist <= prec or prec <= 0.0: nearest = min(nearest, (dist, nodeId))
+        if nearest[1] == -1 and prec <= 0.0: return (nodesSpaceIndex.nearestNeighbor(vertex, 1, prec) + [-1])[0]
+        return nearest[1]
     
+    #Length Calculator
+    #a single calculator for every line: planar lengths in the units of the layer for projected systems, ellipsoidal lengths in meters for geographic systems
+    def lengthCalculator(layer):
+        distArea = QgsDistanceArea()
+        if layer.crs().isGeographic():
+            distArea.setSourceCrs(layer.crs(), context.transformContext())
+            distArea.setEllipsoid(context.ellipsoid() if context.ellipsoid() not in ('', 'NONE') else layer.crs().ellipsoidAcronym())
+        return distArea
+
     def defineDistance(edge,analysisType,impField,edgeA,edgeB):
         if impField == []: imp = 1
         else:
@@ -84,12 +147,746 @@ def computeMetrics(instance, parameters, context, feedback, inputs):
             for i in range(len(impField)): 
                 if edge.attribute(impField[i]) != NULL: imp += edge.attribute(impField[i])
             
-        dist = imp if analysisType == 0 else imp*QgsDistanceArea().measureLine(edgeA,edgeB)
+        dist = imp if analysisType == 0 else imp*distArea.measureLine(edgeA,edgeB)
         return dist
     
+    #Connected Components
+    #shortest paths never leave the component of the source, so each search only uses the nodes of that component
+    def buildComponents():
+        compsA = []
+        for root in nodesA:
+            if root.comp != -1: continue
+            root.comp = 0
+            compA, ind = [root], 0
+            while ind < len(compA):
+                for neigh in compA[ind].neighA:
+                    if neigh[0].comp == -1:
+                        neigh[0].comp = 0
+                        compA.append(neigh[0])
+                ind += 1
+            compsA.append(compA)
+        compsA.sort(key = len, reverse = True) #largest components first
+        for ind in range(len(compsA)):
+            for pos in range(len(compsA[ind])): compsA[ind][pos].comp, compsA[ind][pos].pos = ind, pos
+        return compsA
+
+    #Compute Shortest Paths (Djikstra Algorithm with Binary Heap as Priority Queue)
+    def searchFrom(source, doPath, compA):
+    #1-Heap cretation
+        finitePos = 0
+        costA = [99999999999999 for i in range(len(compA))]
+        costA[source.pos] = 0 #distance from the source edge to itself is zero
+        for ind in range(len(source.neighA)): costA[source.neighA[ind][0].pos] = min(costA[source.neighA[ind][0].pos], source.neighA[ind][1]) #shortest of parallel connections, loops are ignored
+        heap = [compA[0] for i in range(len(set(neigh[0].id for neigh in source.neighA) | {source.id}))]
+        for destin in compA:
+            if costA[destin.pos] == 99999999999999:
+                heap.append(destin)
+                destin.heapPos = len(heap) - 1
+            else:
+                heap[finitePos] = destin
+                destin.heapPos = finitePos
+                n = finitePos
+                finitePos += 1
+                parent = int((n-1)/2)
+                while n !=0 and costA[heap[n].pos] < costA[heap[parent].pos]:
+                    heap[n].heapPos, heap[parent].heapPos = parent, n
+                    heap[n], heap[parent] = heap[parent], heap[n]
+                    n = parent
+                    parent = int((n-1)/2)
+    #2-Heap sorting
+        pivotA = [[] for i in range(len(compA))]
+        level = [0 for i in range(len(compA))]
+        numSP = [0 for i in range(len(compA))]
+        sortedA = [] 
+        numSP[source.pos], level[source.pos] = 1,0
+        for ind in range(len(source.neighA)): 
+            if source.neighA[ind][0] != source and source.neighA[ind][1] == costA[source.neighA[ind][0].pos]:
+                numSP[source.neighA[ind][0].pos] += 1 #each parallel connection of minimum cost is a shortest path
+                level[source.neighA[ind][0].pos] = 1
+        while heap != []:
+            closest = heap[0]
+            if costA[closest.pos] == 99999999999999: break #remaining elements are not connected to the source
+            if costA[closest.pos] <= radius or radius == 0.0: sortedA.append(closest)
+            if finitePos > 0:
+                heap[0].heapPos, heap[finitePos-1].heapPos = finitePos-1, 0
+                heap[0], heap[finitePos-1] = heap[finitePos-1], heap[0]
+                heap[finitePos-1].heapPos, heap[-1].heapPos = len(heap)-1, finitePos-1
+                heap[finitePos-1], heap[-1] = heap[-1], heap[finitePos-1]
+                finitePos -= 1
+            heap.pop(len(heap)-1)
+        
+            n = 0
+            lh = finitePos
+            posChild1, posChild2 = n*2+1, n*2+2
+            if posChild2 <= lh-1:
+                costChild1, costChild2 = costA[heap[n*2+1].pos], costA[heap[n*2+2].pos]
+                if any(x < costA[heap[n].pos] for x in [costChild1,costChild2]):
+                    if costChild1 <= costChild2: sc = posChild1
+                    else: sc = posChild2
+                else: sc = -1
+            elif posChild2 == lh:
+                if costA[heap[n*2+1].pos] < costA[heap[n].pos]: sc = posChild1
+                else: sc = -1
+            else: sc = -1
+            
+            while sc >= 0:
+                heap[n].heapPos, heap[sc].heapPos = sc, n
+                heap[n], heap[sc] = heap[sc], heap[n]
+                n = sc
+                lh = len(heap)
+                posChild1, posChild2 = n*2+1, n*2+2
+                if posChild2 <= lh-1:
+                    costChild1, costChild2 = costA[heap[n*2+1].pos], costA[heap[n*2+2].pos]
+                    if any(x < costA[heap[n].pos] for x in [costChild1,costChild2]):
+                        if costChild1 <= costChild2: sc = posChild1
+                        else: sc = posChild2
+                    else: sc = -1
+                elif posChild2 == lh:
+                    if costA[heap[n*2+1].pos] < costA[heap[n].pos]: sc = posChild1
+                    else: sc = -1
+                else: sc = -1
+        
+            for ind in range(len(closest.neighA)):
+                if closest.neighA[ind][0].heapPos < len(heap):
+                    cost = costA[closest.pos] + closest.neighA[ind][1]
+                    prevCost = costA[closest.neighA[ind][0].pos]
+                    if prevCost > cost and (radius == 0.0 or cost <= radius):
+                        costA[closest.neighA[ind][0].pos], level[closest.neighA[ind][0].pos] = cost, level[closest.pos] + 1
+                        if doPath:
+                            pivotA[closest.neighA[ind][0].pos] = []
+                            pivotA[closest.neighA[ind][0].pos].append(closest)
+                            numSP[closest.neighA[ind][0].pos] = numSP[closest.pos] #paths counted through a previous pivot are no longer shortest
+                    
+                        n = closest.neighA[ind][0].heapPos
+                        if prevCost == 99999999999999: 
+                            heap[finitePos].heapPos, closest.neighA[ind][0].heapPos = n, finitePos
+                            heap[n], heap[finitePos] = heap[finitePos], closest.neighA[ind][0]
+                            n = finitePos
+                            finitePos += 1
+                        parent = int((n-1)/2)
+                        while n !=0 and costA[heap[n].pos] < costA[heap[parent].pos]:
+                            heap[n].heapPos, heap[parent].heapPos = parent, n
+                            heap[n], heap[parent] = heap[parent], heap[n]
+                            n = parent
+                            parent = int((n-1)/2)
+
+                    elif doPath and source.id != closest.id and costA[closest.neighA[ind][0].pos] == cost and (radius == 0.0 or cost <= radius):
+                        pivotA[closest.neighA[ind][0].pos].append(closest)
+                        numSP[closest.neighA[ind][0].pos] += numSP[closest.pos]
+                        level[closest.neighA[ind][0].pos] = min(level[closest.neighA[ind][0].pos], level[closest.pos] + 1) #fewest steps among the shortest paths, regardless of heap order
+        return costA, sortedA, pivotA, numSP, level
+
+    #Degree-2 Chains Contraction
+    #nodes with exactly two connections (curve vertices, splits of lines) are not inserted in the priority queue
+    #their distances are obtained by walking along the chains that link the remaining nodes
+    def buildChains():
+        keptA = [True for i in range(nodesCount)]
+        for node in nodesA: keptA[node.id] = len(node.neighA) != 2 or node.neighA[0][0] == node.neighA[1][0]
+        chainOfA = [-1 for i in range(nodesCount)] #chain and position inside the chain of each contracted node
+        chainPosA = [0 for i in range(nodesCount)]
+        chainsA = [] #[first kept node, contracted nodes, distances between consecutive nodes, last kept node]
+        superA = [[] for i in range(nodesCount)] #connections of the kept nodes: [kept node, -1, distance] or [kept node, chain, walking forward]
+        
+        def chainFrom(node):
+            for neigh in node.neighA:
+                if keptA[neigh[0].id]: superA[node.id].append([neigh[0], -1, neigh[1]])
+                elif chainOfA[neigh[0].id] == -1:
+                    interiorA, distA = [], [neigh[1]]
+                    prev, cur = node, neigh[0]
+                    while not keptA[cur.id]:
+                        chainOfA[cur.id], chainPosA[cur.id] = len(chainsA), len(interiorA)
+                        interiorA.append(cur)
+                        nextN = cur.neighA[1] if cur.neighA[0][0] == prev else cur.neighA[0]
+                        distA.append(nextN[1])
+                        prev, cur = cur, nextN[0]
+                    superA[node.id].append([cur, len(chainsA), True])
+                    superA[cur.id].append([node, len(chainsA), False])
+                    chainsA.append([node, interiorA, distA, cur])
+        
+        for node in nodesA:
+            if keptA[node.id]: chainFrom(node)
+        for node in nodesA: #rings without any kept node
+            if not keptA[node.id] and chainOfA[node.id] == -1:
+                keptA[node.id] = True
+                chainFrom(node)
+        compChainsA = [[] for compA in compsA] #chains of each connected component
+        for chain in chainsA: compChainsA[chain[0].comp].append(chain)
+        return keptA, chainOfA, chainPosA, chainsA, superA, compChainsA
+    
+    #same results as searchFrom, with the priority queue restricted to the kept nodes
+    def searchContracted(source, doPath, compA):
+        costA = [99999999999999 for i in range(len(compA))]
+        costA[source.pos] = 0
+        queue = []
+        if keptA[source.id]: queue.append((0, source.pos, source))
+        else: #source inside a chain: its ends are reached by walking from the source
+            first, interiorA, distA, last = chainsA[chainOfA[source.id]]
+            cost = 0
+            for i in range(chainPosA[source.id], -1, -1):
+                cost += distA[i]
+                if radius != 0.0 and cost > radius: break
+                node = interiorA[i-1] if i > 0 else first
+                if cost < costA[node.pos]: costA[node.pos] = cost
+            cost = 0
+            for i in range(chainPosA[source.id]+1, len(distA)):
+                cost += distA[i]
+                if radius != 0.0 and cost > radius: break
+                node = interiorA[i] if i < len(interiorA) else last
+                if cost < costA[node.pos]: costA[node.pos] = cost
+            for node in [first, last]:
+                if costA[node.pos] != 99999999999999: queue.append((costA[node.pos], node.pos, node))
+            heapq.heapify(queue)
+        
+        #shortest paths between kept nodes, chains are walked so the sums are the same of the full search
+        while queue != []:
+            cost, pos, closest = heapq.heappop(queue)
+            if cost > costA[pos]: continue #outdated entry
+            for neigh in superA[closest.id]:
+                if neigh[1] == -1: newCost = cost + neigh[2]
+                else:
+                    newCost = cost
+                    for dist in (chainsA[neigh[1]][2] if neigh[2] else reversed(chainsA[neigh[1]][2])): newCost += dist
+                if newCost < costA[neigh[0].pos] and (radius == 0.0 or newCost <= radius):
+                    costA[neigh[0].pos] = newCost
+                    heapq.heappush(queue, (newCost, neigh[0].pos, neigh[0]))
+        
+        #contracted nodes: shortest of the walks from both ends of their chains
+        for first, interiorA, distA, last in compChainsA[source.comp]:
+            cost = costA[first.pos]
+            if cost != 99999999999999:
+                for i in range(len(interiorA)):
+                    cost += distA[i]
+                    if radius != 0.0 and cost > radius: break
+                    if cost < costA[interiorA[i].pos]: costA[interiorA[i].pos] = cost
+            cost = costA[last.pos]
+            if cost != 99999999999999:
+                for i in range(len(interiorA)-1, -1, -1):
+                    cost += distA[i+1]
+                    if radius != 0.0 and cost > radius: break
+                    if cost < costA[interiorA[i].pos]: costA[interiorA[i].pos] = cost
+        
+        #expansion of the shortest paths to all nodes
+        sortedA = [node for node in compA if costA[node.pos] != 99999999999999 and (radius == 0.0 or costA[node.pos] <= radius)]
+        sortedA.sort(key = lambda node: (costA[node.pos], node != source))
+        pivotA = [[] for i in range(len(compA))]
+        level = [0 for i in range(len(compA))]
+        numSP = [0 for i in range(len(compA))]
+        numSP[source.pos] = 1
+        if doPath:
+            orderA = [-1 for i in range(len(compA))]
+            for pos in range(len(sortedA)): orderA[sortedA[pos].pos] = pos
+            for node in sortedA[1:]:
+                direct, firstPivot = 0, None
+                for neigh in node.neighA:
+                    if neigh[0] == source:
+                        if neigh[1] == costA[node.pos]: direct += 1 #parallel connections of minimum cost
+                    elif 0 <= orderA[neigh[0].pos] < orderA[node.pos] and costA[neigh[0].pos] + neigh[1] == costA[node.pos]:
+                        pivotA[node.pos].append(neigh[0])
+                        numSP[node.pos] += numSP[neigh[0].pos]
+                        if firstPivot == None or level[neigh[0].pos] < level[firstPivot.pos]: firstPivot = neigh[0]
+                if direct > 0: numSP[node.pos], level[node.pos] = numSP[node.pos] + direct, 1
+                elif firstPivot != None: level[node.pos] = level[firstPivot.pos] + 1
+        return costA, sortedA, pivotA, numSP, level
+
+    #Structurally Equivalent Nodes
+    #nodes with the same connections (same nodes and distances) are never in the shortest paths of each other
+    #the search of one of them is the search of the others once the two nodes are exchanged
+    def findTwins():
+        classesD = {}
+        for node in sourcesA:
+            if node.neighA == [] or any(neigh[0] == node or neigh[1] <= 0 for neigh in node.neighA): continue
+            classesD.setdefault(tuple(sorted((neigh[0].id, neigh[1]) for neigh in node.neighA)), []).append(node)
+        twinOf, twinsD = {}, {} #representative node of each equivalent node, equivalent nodes of each representative
+        for classA in classesD.values():
+            if len(classA) > 1:
+                for node in classA: twinOf[node.id] = classA[0]
+                twinsD[classA[0].id] = classA
+        return twinOf, twinsD
+
+    #Biconnected Components Decomposition (Puzis et al.)
+    #shortest paths between two nodes of a block never leave it, and a cut node lies on every path between the parts it separates
+    #the betweenness is obtained inside each block, weighting its nodes by the number of nodes that reach it through them
+    def buildBlocks(isSourceA):
+        disc = [-1 for i in range(nodesCount)] #discovery order of the depth-first search
+        low = [0 for i in range(nodesCount)] #lowest discovery order reachable through the subtree
+        sizeA = [1 for i in range(nodesCount)] #nodes in the subtree
+        sizeSA = [isSourceA[i] for i in range(nodesCount)] #source nodes in the subtree
+        hangA = [[] for i in range(nodesCount)] #[nodes, source nodes] of the subtrees separated by each node
+        blocksA = [] #[nodes of the block, weights as target, weights as source]
+        sepA = [0 for i in range(nodesCount)] #pairs separated by each cut node
+        order = 0
+        for root in nodesA:
+            if disc[root.id] != -1: continue
+            disc[root.id], low[root.id] = order, order
+            order += 1
+            stack, nodeStack, compBlocksA, compA = [[root, 0]], [root], [], [root]
+            while stack != []:
+                node, ind = stack[-1]
+                if ind < len(node.neighA):
+                    stack[-1][1] += 1
+                    neigh = node.neighA[ind][0]
+                    if disc[neigh.id] == -1:
+                        disc[neigh.id], low[neigh.id] = order, order
+                        order += 1
+                        stack.append([neigh, 0])
+                        nodeStack.append(neigh)
+                        compA.append(neigh)
+                    elif disc[neigh.id] < low[node.id]: low[node.id] = disc[neigh.id]
+                else:
+                    stack.pop(len(stack)-1)
+                    if stack == []: break
+                    parent = stack[-1][0]
+                    if low[node.id] < low[parent.id]: low[parent.id] = low[node.id]
+                    sizeA[parent.id] += sizeA[node.id]
+                    sizeSA[parent.id] += sizeSA[node.id]
+                    if low[node.id] >= disc[parent.id]: #parent separates the subtree of node from the rest of the network
+                        hangA[parent.id].append([sizeA[node.id], sizeSA[node.id]])
+                        blockA = [parent]
+                        while blockA[-1] != node: blockA.append(nodeStack.pop(len(nodeStack)-1))
+                        compBlocksA.append([blockA, sizeA[node.id], sizeSA[node.id]])
+            n, nS = sizeA[root.id], sizeSA[root.id]
+            for node in compA:
+                partsA = hangA[node.id] + [[n - 1 - sum(part[0] for part in hangA[node.id]), nS - isSourceA[node.id] - sum(part[1] for part in hangA[node.id])]]
+                sepA[node.id] = ((nS - isSourceA[node.id])*(n - 1) - sum(part[0]*part[1] for part in partsA))/2
+            for blockA, sizeC, sizeSC in compBlocksA:
+                if len(blockA) < 3: continue #a single connection has no intermediate node
+                weightA = [n - sizeC] + [1 + sum(part[0] for part in hangA[node.id]) for node in blockA[1:]]
+                weightSA = [nS - sizeSC] + [isSourceA[node.id] + sum(part[1] for part in hangA[node.id]) for node in blockA[1:]]
+                blocksA.append([blockA, weightA, weightSA])
+        return blocksA, sepA
+
+    def blockBetweenness(isSourceA):
+        blocksA, sepA = buildBlocks(isSourceA)
+        for node in nodesA: btwA[node.id] += sepA[node.id]
+        blockOf = [-1 for i in range(nodesCount)]
+        weightOf = [0 for i in range(nodesCount)]
+        for bInd in range(len(blocksA)):
+            blockA, weightA, weightSA = blocksA[bInd]
+            for ind in range(len(blockA)): blockOf[blockA[ind].id], weightOf[blockA[ind].id] = bInd, weightA[ind]
+            for ind in range(len(blockA)):
+                if weightSA[ind] == 0: continue
+                source = blockA[ind]
+                costA, numSP, pivotA = {source.id: 0}, {source.id: 1}, {source.id: []}
+                sortedA, heap, done = [], [(0, source.id, source)], set()
+                while heap != []:
+                    cost, nid, closest = heapq.heappop(heap)
+                    if nid in done: continue
+                    done.add(nid)
+                    sortedA.append(closest)
+                    for neigh, dist in closest.neighA:
+                        if blockOf[neigh.id] != bInd or neigh.id in done: continue
+                        newCost = cost + dist
+                        if neigh.id not in costA or newCost < costA[neigh.id]:
+                            costA[neigh.id], numSP[neigh.id], pivotA[neigh.id] = newCost, numSP[nid], [closest]
+                            heapq.heappush(heap, (newCost, neigh.id, neigh))
+                        elif newCost == costA[neigh.id]:
+                            numSP[neigh.id] += numSP[nid]
+                            pivotA[neigh.id].append(closest)
+                btwTemp = {}
+                for farest in reversed(sortedA):
+                    acc = btwTemp.get(farest.id, 0)
+                    for neigh in pivotA[farest.id]: btwTemp[neigh.id] = btwTemp.get(neigh.id, 0) + (numSP[neigh.id]/numSP[farest.id])*(weightOf[farest.id] + acc)
+                    if farest != source: btwA[farest.id] += weightSA[ind]*acc/2
+        return len(blocksA)
+
+    #load-weighted distribution of the costs from a source: mean, percentiles and load within each distance band
+    #pairsA holds the cost and the load of each destination, sources without load around them have no mean or percentiles
+    def distanceStats(pairsA):
+        pairsA = sorted(pair for pair in pairsA if pair[1] != 0)
+        total = sum(pair[1] for pair in pairsA)
+        if total <= 0: return [float('nan') for perc in percL] + [float('nan')] + [0 for band in bandsL]
+        percA, cumul = [], 0
+        for cost, weight in pairsA:
+            cumul += weight
+            while len(percA) < len(percL) and cumul >= percL[len(percA)]*total/100: percA.append(cost)
+        percA += [pairsA[-1][0] for perc in percL[len(percA):]] #rounding of the cumulative load
+        return [sum(cost*weight for cost, weight in pairsA)/total] + percA + [sum(weight for cost, weight in pairsA if cost <= band) for band in bandsL]
+
+    #Origin-Destination Costs Export
+    #dense matrix: float32 costs in rows and columns ordered by feature id, infinity for pairs not connected within the radius
+    #compressed blocks: for each source, its id (int64), number of destinations (int32), size of the block (int32) and a zlib block with the destination ids (int64) followed by their costs (float32)
+    def openOD(rowSize):
+        odFile = open(odPath, 'w+b')
+        if odFormat == 0:
+            if rowSize > 20000: feedback.pushWarning(f'The dense matrix will take {rowSize*rowSize*4/1073741824:.1f} GB, compressed blocks are recommended for large networks')
+            noPathA = array('f', [float('inf')])*rowSize
+            for ind in range(rowSize): noPathA.tofile(odFile)
+        return odFile
+
+    #costs of one source, streamed while the analysis runs
+    def writeODRow(odFile, rowSize, sourceId, pairsA):
+        pairsA = [pair for pair in pairsA if radius == 0.0 or pair[1] <= radius]
+        if odFormat == 0:
+            rowA = array('f', [float('inf')])*rowSize
+            for destin, cost in pairsA: rowA[destin] = cost
+            odFile.seek(sourceId*rowSize*rowA.itemsize)
+            rowA.tofile(odFile)
+        else:
+            block = zlib.compress(array('q', [pair[0] for pair in pairsA]).tobytes() + array('f', [pair[1] for pair in pairsA]).tobytes())
+            odFile.write(struct.pack('=qii', sourceId, len(pairsA), len(block)) + block)
+
+    #Results Cache
+    #each file holds the values of one field indexed by the feature id, NaN for the features without value
+    #files are named by a hash of everything the results depend on, their modification time marks their last use
+    def cacheKey():
+        digest = hashlib.sha256(repr(["GAUS_pl11", analysisType, radius, prec, distArea.ellipsoid(), impField, loadField, supplyField, demandField, sorted(sourceIds) if sourceIds != None else None]).encode())
+        for layer, fieldsF in [(inputNodes, loadField + supplyField + demandField), (inputEdges, impField)]:
+            for feat in layer.getFeatures():
+                digest.update(repr([feat.id()] + [feat.attribute(name) for name in fieldsF]).encode())
+                digest.update(bytes(feat.geometry().asWkb()))
+        return digest.hexdigest()
+
+    def cachePath(code):
+        return os.path.join(cacheFolder, f'{cacheHash}_{code if code[:2] != "Bd" else "Bd" + repr(bandsL[int(code[2:])-1])}.bin')
+
+    #values of the requested fields, None if any of them is not in the cache
+    def readCache():
+        if any(not os.path.isfile(cachePath(code)) for code in fieldCodesL): return None
+        valuesD = {}
+        for code in fieldCodesL:
+            valuesD[code] = array('d')
+            with open(cachePath(code), 'rb') as cacheFile: valuesD[code].frombytes(cacheFile.read())
+            os.utime(cachePath(code))
+        return valuesD
+
+    def writeCache(valuesD):
+        for code, valueA in valuesD.items():
+            with open(cachePath(code), 'wb') as cacheFile: valueA.tofile(cacheFile)
+        evictCache(cacheHash)
+
+    #least recently used files removed while the folder is larger than the cache size, except the ones just written
+    def evictCache(keptPrefix):
+        filesA = sorted([os.path.getmtime(path), os.path.getsize(path), path] for path in [os.path.join(cacheFolder, name) for name in os.listdir(cacheFolder) if name.endswith('.bin')])
+        total = sum(fileA[1] for fileA in filesA)
+        for mtime, size, path in filesA:
+            if total <= cacheSize*1048576: break
+            if os.path.basename(path).startswith(keptPrefix): continue
+            os.remove(path)
+            total -= size
+
+    #Network Build Cache
+    #the connections found by snapping the lines to the points only depend on their geometries and on the precision
+    #they are kept as adjacency arrays (CSR): offsets by node id, and for each connection the other node, the line id and the base length of the line
+    #connections keep the order of the lines, so the searches find the same paths as in a network built from the layers
+    def networkKey():
+        keyL = ["GAUS_pl11", prec, distArea.ellipsoid()]
+        for layer in [inputNodes, inputEdges]:
+            path = layer.source().split('|')[0]
+            if not os.path.isfile(path) or layer.isModified(): return None #unsaved edits are not in the file
+            keyL += [layer.source(), os.path.getmtime(path), layer.featureCount()] #the full source tells apart the layers and subsets of a file
+        return hashlib.sha256(repr(keyL).encode()).hexdigest()
+
+    def keepNetwork(key, arraysL):
+        networksD[key] = arraysL
+        networksD.move_to_end(key)
+        while len(networksD) > 4: networksD.popitem(last = False)
+
+    #arrays of a network from the memory or from the cache folder, None if it was not stored
+    def loadNetwork(key):
+        if key in networksD:
+            networksD.move_to_end(key)
+            return networksD[key]
+        path = os.path.join(cacheFolder, f'net_{key}.bin')
+        if not os.path.isfile(path): return None
+        arraysL = []
+        with open(path, 'rb') as netFile:
+            header = netFile.read(9)
+            while header != b'':
+                typecode, count = struct.unpack('=cq', header)
+                arraysL.append(array(typecode.decode()))
+                arraysL[-1].fromfile(netFile, count)
+                header = netFile.read(9)
+        os.utime(path)
+        keepNetwork(key, arraysL)
+        return arraysL
+
+    #each array is written after its type and size
+    def saveNetwork(key, arraysL):
+        with open(os.path.join(cacheFolder, f'net_{key}.bin'), 'wb') as netFile:
+            for valueA in arraysL:
+                netFile.write(struct.pack('=cq', valueA.typecode.encode(), len(valueA)))
+                valueA.tofile(netFile)
+        keepNetwork(key, arraysL)
+        evictCache(f'net_{key}')
+
+    #the fields written by an analysis do not change its connections, which are kept under the key of the files after the writing
+    def renewNetwork(key):
+        newKey = networkKey()
+        if newKey == None or newKey == key: return
+        path = os.path.join(cacheFolder, f'net_{key}.bin')
+        if os.path.isfile(path): os.replace(path, os.path.join(cacheFolder, f'net_{newKey}.bin'))
+        if key in networksD: keepNetwork(newKey, networksD.pop(key))
+
+    #results served from the cache, written in new fields as in the analysis
+    def writeCached(valuesD):
+        strBegin = "T" if analysisType == 0 else "G"
+        strMid = "g" if radius == 0.0 else str(int(radius))
+        if len(strMid) > 5: strBegin += strMid[0:5]
+        else: strBegin += strMid
+        indexD = {}
+        for code in fieldCodesL:
+            aux = 0
+            while inputNodes.fields().indexFromName(strBegin + code + str(aux)) != -1: aux += 1
+            inputNodes.dataProvider().addAttributes([QgsField(strBegin + code + str(aux),QVariant.Double)])
+            inputNodes.updateFields()
+            indexD[code] = inputNodes.fields().indexFromName(strBegin + code + str(aux))
+            if code[:2] == "Bd": inputNodes.setFieldAlias(indexD[code], strBegin + code + str(aux) + f" (load within {bandsL[int(code[2:])-1]:g})")
+            if sourceIds != None and code in ["Btw", "Cen", "Cvg", "Pol"]: inputNodes.setFieldAlias(indexD[code], inputNodes.fields()[indexD[code]].name() + " (sources subset)")
+        changesD = {}
+        for feat in inputNodes.getFeatures():
+            metricsD = {indexD[code]: valuesD[code][feat.id()] for code in fieldCodesL if feat.id() < len(valuesD[code]) and not math.isnan(valuesD[code][feat.id()])}
+            if metricsD != {}: changesD[feat.id()] = metricsD
+        inputNodes.dataProvider().changeAttributeValues(changesD)
+        feedback.pushInfo(f'Results Cache: {len(fieldCodesL)} Fields Read for {len(changesD)} Nodes')
+
+        if outPath != "":
+            crs = QgsProject.instance().crs()
+            writer = QgsVectorFileWriter.writeAsVectorFormat(inputNodes, outPath, "System", crs, "ESRI Shapefile")
+            inputNodes.dataProvider().deleteAttributes(list(indexD.values()))
+            inputNodes.updateFields()
+
+    #Out-of-Core Mode
+    #adjacency, weights and metrics are stored in memory-mapped files and each search only keeps the nodes it reaches
+    def mapArray(folder, name, typecode, count):
+        file = open(os.path.join(folder, name), 'w+b')
+        file.truncate(max(1, count)*array(typecode).itemsize)
+        mapped = mmap.mmap(file.fileno(), 0)
+        file.close()
+        mapsA.append([mapped, memoryview(mapped).cast(typecode)])
+        return mapsA[-1][1]
+
+    def residentMB():
+        try:
+            with open('/proc/self/statm') as statm: return int(statm.read().split()[1])*mmap.PAGESIZE/1048576
+        except (OSError, ValueError, IndexError): return 0 #resident memory unknown in this system
+
+    #mapped pages are written to their files and released when the resident memory exceeds the cap
+    def releasePages():
+        for mapped, view in mapsA:
+            mapped.flush()
+            if hasattr(mapped, 'madvise'): mapped.madvise(mmap.MADV_DONTNEED)
+
+    #memory-mapped files removed at the end
+    def removeMaps(folder):
+        for mapped, view in mapsA:
+            view.release()
+            mapped.close()
+        for name in os.listdir(folder): os.remove(os.path.join(folder, name))
+        os.rmdir(folder)
+
+    def searchOutOfCore(source, doPath, offsetA, targetA, weightA):
+        costD, numSP, level, pivotD = {source: 0}, {source: 1}, {source: 0}, {source: []}
+        for ind in range(offsetA[source], offsetA[source+1]): #shortest of parallel connections, loops are ignored
+            if targetA[ind] != source: costD[targetA[ind]] = min(costD.get(targetA[ind], 99999999999999), weightA[ind])
+        for ind in range(offsetA[source], offsetA[source+1]):
+            if targetA[ind] != source and costD[targetA[ind]] == weightA[ind]: #every parallel connection of minimum cost is a shortest path
+                numSP[targetA[ind]], level[targetA[ind]], pivotD[targetA[ind]] = numSP.get(targetA[ind], 0) + 1, 1, []
+        heap = [(cost, node) for node, cost in costD.items()]
+        heapq.heapify(heap)
+        sortedA, doneS = [], set()
+        while heap != []:
+            cost, closest = heapq.heappop(heap)
+            if closest in doneS: continue
+            doneS.add(closest)
+            sortedA.append(closest)
+            for ind in range(offsetA[closest], offsetA[closest+1]):
+                neigh = targetA[ind]
+                if neigh in doneS: continue
+                newCost = cost + weightA[ind]
+                prevCost = costD.get(neigh, 99999999999999)
+                if radius != 0.0 and newCost > radius: continue #the search never leaves the radius
+                if prevCost > newCost:
+                    costD[neigh], level[neigh] = newCost, level[closest] + 1
+                    if doPath: pivotD[neigh], numSP[neigh] = [closest], numSP[closest]
+                    heapq.heappush(heap, (newCost, neigh))
+                elif doPath and prevCost == newCost and closest != source:
+                    pivotD[neigh].append(closest)
+                    numSP[neigh] += numSP[closest]
+                    level[neigh] = min(level[neigh], level[closest] + 1)
+        return costD, sortedA, pivotD, numSP, level
+
+    def outOfCore():
+        folder = tempfile.mkdtemp(prefix='gaus_ooc_', dir=oocFolder)
+        feedback.pushInfo(f'Out-of-Core Mode: Memory-Mapped Files in {folder}')
+        if contract or blocks or twins: feedback.pushWarning('Chain contraction, biconnected components and shared searches are not used in out-of-core mode')
+        if lineFlows: feedback.pushWarning('The metrics of the lines are not computed in out-of-core mode')
+        if memCap > 0 and residentMB() == 0: feedback.pushWarning('The resident memory cannot be read in this system, the memory cap will not be applied')
+
+        #per-node weights, without node objects
+        nodesCount = verifyFeatCount(inputNodes)
+        validA, loadA, supplyA, demandA = mapArray(folder, 'valid', 'b', nodesCount), mapArray(folder, 'load', 'd', nodesCount), mapArray(folder, 'supply', 'd', nodesCount), mapArray(folder, 'demand', 'd', nodesCount)
+        for feat in inputNodes.getFeatures():
+            validA[feat.id()] = 1
+            for valueA, fieldsF in [(loadA, loadField), (supplyA, supplyField), (demandA, demandField)]:
+                valueA[feat.id()] = fieldsSum(feat, fieldsF)
+
+        #edges streamed to a file, then arranged by node (compressed sparse rows)
+        feedback.pushInfo("Initialize Edges")
+        degreeA = mapArray(folder, 'degree', 'q', nodesCount)
+        edgesCount = 0
+        cellsD = pointCells()
+        nodesSpaceIndex = QgsSpatialIndex(inputNodes.getFeatures()) if prec <= 0.0 else None
+        unsnapped = 0 #line ends without a point within the precision
+        with open(os.path.join(folder, 'edges'), 'wb') as edgesFile:
+            for edge in inputEdges.getFeatures():
+                end1, end2 = lineEnds(edge.geometry())
+                vert1, vert2 = snapEnd(end1, cellsD, nodesSpaceIndex), snapEnd(end2, cellsD, nodesSpaceIndex)
+                unsnapped += (vert1 == -1) + (vert2 == -1)
+                if vert1 != -1 and vert2 != -1:
+                    dist = defineDistance(edge,analysisType,impField,end1,end2)
+                    if dist <= radius or radius == 0.0:
+                        array('d', [vert1, vert2, dist]).tofile(edgesFile)
+                        degreeA[vert1] += 1
+                        degreeA[vert2] += 1
+                        edgesCount += 1
+        del cellsD, nodesSpaceIndex
+        if unsnapped > 0: feedback.pushWarning(f'Grid Snapping: {unsnapped} Line Ends Without a Point Within the Distance Precision, Their Lines Were Not Used')
+        offsetA, nextA = mapArray(folder, 'offset', 'q', nodesCount+1), mapArray(folder, 'next', 'q', nodesCount)
+        for ind in range(nodesCount): offsetA[ind+1], nextA[ind] = offsetA[ind] + degreeA[ind], offsetA[ind]
+        targetA, weightA = mapArray(folder, 'target', 'q', 2*edgesCount), mapArray(folder, 'weight', 'd', 2*edgesCount)
+        with open(os.path.join(folder, 'edges'), 'rb') as edgesFile:
+            while True:
+                chunk = array('d')
+                try: chunk.fromfile(edgesFile, 3*4096)
+                except EOFError: pass
+                if len(chunk) == 0: break
+                for ind in range(0, len(chunk), 3):
+                    vert1, vert2 = int(chunk[ind]), int(chunk[ind+1])
+                    targetA[nextA[vert1]], weightA[nextA[vert1]] = vert2, chunk[ind+2]
+                    nextA[vert1] += 1
+                    targetA[nextA[vert2]], weightA[nextA[vert2]] = vert1, chunk[ind+2]
+                    nextA[vert2] += 1
+        os.remove(os.path.join(folder, 'edges'))
+        feedback.pushInfo(f'{edgesCount} Edges Stored for {nodesCount} Nodes')
+
+        #source nodes of the shortest paths
+        sourcesA = [ind for ind in range(nodesCount) if validA[ind] == 1 and (sourceIds == None or ind in sourceIds)]
+        if sourceIds != None: feedback.pushInfo(f'{len(sourcesA)} of {inputNodes.featureCount()} Nodes Used as Sources')
+
+        #one memory-mapped accumulator per metric
+        metricA = [mapArray(folder, codesL[metric], 'd', nodesCount) if metric in metricsL else None for metric in range(7)]
+        access, btw, cent, opport, converg, polarity, reach = metricA
+        statsA = [mapArray(folder, code, 'd', nodesCount) for code in statsCodes] if distStats else []
+        for valueA in statsA: valueA[:] = array('d', [float('nan')])*nodesCount
+
+        #Compute Shortest Paths
+        if doSearches:
+            if odPath != "": odFile = openOD(nodesCount)
+            releases = 0
+            for count in range(len(sourcesA)):
+                source = sourcesA[count]
+                if count % 50 == 0: feedback.pushInfo(f'Shortest Path {source}')
+                if feedback.isCanceled(): break
+                doCent = 2 in metricsL and loadA[source] != 0
+                doCvg = (4 in metricsL or 5 in metricsL) and supplyA[source] != 0
+                doPath = 1 in metricsL or doCent or doCvg
+                if not doPath and odPath == "" and not distStats and 0 not in metricsL and 6 not in metricsL and (3 not in metricsL or demandA[source] <= 0): continue
+                costD, sortedA, pivotD, numSP, level = searchOutOfCore(source, doPath, offsetA, targetA, weightA)
+                if odPath != "": writeODRow(odFile, nodesCount, source, [(node, costD[node]) for node in sortedA])
+                if distStats:
+                    for col, value in enumerate(distanceStats([(costD[node], loadA[node]) for node in sortedA if node != source])): statsA[col][source] = value
+                #3-Metrics update
+                btwTemp, fkcTemp, cvgTemp = {}, {}, {}
+                while sortedA != []:
+                    farest = sortedA.pop()
+                    cost = costD[farest]
+                    if 0 in metricsL and farest != source: access[source] += loadA[farest]/cost
+                    if 3 in metricsL and demandA[source] > 0: opport[source] += supplyA[farest]/(cost+1)
+                    if 6 in metricsL: reach[source] += loadA[farest]
+                    pot = loadA[farest] * loadA[source]
+                    tension = supplyA[source]*demandA[farest]
+
+                    propCent = doCent and (pot != 0 or fkcTemp.get(farest, 0) != 0)
+                    propCvg = doCvg and (tension != 0 or cvgTemp.get(farest, 0) != 0)
+                    if 1 in metricsL or propCent or propCvg:
+                        for neigh in pivotD.get(farest, []):
+                            ratio = numSP[neigh]/numSP[farest]
+                            if 1 in metricsL: btwTemp[neigh] = btwTemp.get(neigh, 0) + ratio*(1 + btwTemp.get(farest, 0))
+                            if propCent: fkcTemp[neigh] = fkcTemp.get(neigh, 0) + ratio*((pot/(level[farest]+1)) + fkcTemp.get(farest, 0))
+                            if propCvg: cvgTemp[neigh] = cvgTemp.get(neigh, 0) + ratio*((tension/(level[farest]+1)) + cvgTemp.get(farest, 0))
+
+                    if pivotD.get(farest, []) == [] and level[farest] == 1:
+                        if doCent: fkcTemp[source] = fkcTemp.get(source, 0) + (pot/2) + fkcTemp.get(farest, 0)
+                        if doCvg: cvgTemp[source] = cvgTemp.get(source, 0) + (numSP[source]/numSP[farest])*((tension/(level[farest]+1)) + cvgTemp.get(farest, 0))
+
+                    if farest != source:
+                        if 1 in metricsL: btw[farest] += btwTemp.get(farest, 0)/2
+                        if doCent: fkcTemp[farest] = fkcTemp.get(farest, 0) + pot/(level[farest]+1)
+                    if doCvg: cvgTemp[farest] = cvgTemp.get(farest, 0) + tension/(level[farest]+1)
+
+                    if doCent: cent[farest] += fkcTemp.get(farest, 0)/2
+                    if 4 in metricsL and doCvg and supplyA[farest] > 0: converg[farest] += cvgTemp.get(farest, 0)
+                    if 5 in metricsL and doCvg: polarity[farest] += cvgTemp.get(farest, 0)
+                if memCap > 0 and count % 50 == 0 and residentMB() > memCap:
+                    releasePages()
+                    releases += 1
+            if memCap > 0: feedback.pushInfo(f'Memory Cap: Mapped Pages Released {releases} Times')
+            if odPath != "":
+                odFile.close()
+                feedback.pushInfo(f'Origin-Destination Costs Written to {odPath}')
+        if feedback.isCanceled(): #partial metrics are neither written nor stored in the results cache
+            feedback.pushWarning('Analysis canceled, no results were written')
+            removeMaps(folder)
+            return
+
+        #update table of contents
+        strBegin = "T" if analysisType == 0 else "G"
+        strMid = "g" if radius == 0.0 else str(int(radius))
+        if len(strMid) > 5: strBegin += strMid[0:5]
+        else: strBegin += strMid
+        indexD = {}
+        for metric in metricsL:
+            aux = 0
+            while inputNodes.fields().indexFromName(strBegin + codesL[metric] + str(aux)) != -1: aux += 1
+            inputNodes.dataProvider().addAttributes([QgsField(strBegin + codesL[metric] + str(aux),QVariant.Double)])
+            inputNodes.updateFields()
+            indexD[metric] = inputNodes.fields().indexFromName(strBegin + codesL[metric] + str(aux))
+            if sourceIds != None and metric in [1, 2, 4, 5]: inputNodes.setFieldAlias(indexD[metric], inputNodes.fields()[indexD[metric]].name() + " (sources subset)")
+        statsIndex = []
+        for code in (statsCodes if distStats else []):
+            aux = 0
+            while inputNodes.fields().indexFromName(strBegin + code + str(aux)) != -1: aux += 1
+            inputNodes.dataProvider().addAttributes([QgsField(strBegin + code + str(aux),QVariant.Double)])
+            inputNodes.updateFields()
+            statsIndex.append(inputNodes.fields().indexFromName(strBegin + code + str(aux)))
+            if code[:2] == "Bd": inputNodes.setFieldAlias(statsIndex[-1], strBegin + code + str(aux) + f" (load within {bandsL[int(code[2:])-1]:g})")
+
+        #results written in batches, reading the accumulators from their files
+        changesD = {}
+        for ind in range(nodesCount):
+            if validA[ind] == 0: continue
+            isSource = sourceIds == None or ind in sourceIds
+            metricsD = {indexD[metric]: metricA[metric][ind] for metric in metricsL if metric in [1, 2, 4, 5] or (isSource and metric != 7)}
+            if 7 in metricsL and isSource: metricsD[indexD[7]] = offsetA[ind+1] - offsetA[ind]
+            if isSource:
+                for col in range(len(statsIndex)): metricsD[statsIndex[col]] = None if math.isnan(statsA[col][ind]) else statsA[col][ind]
+            if metricsD != {}: changesD[ind] = metricsD
+            if len(changesD) == 10000:
+                inputNodes.dataProvider().changeAttributeValues(changesD)
+                changesD = {}
+        inputNodes.dataProvider().changeAttributeValues(changesD)
+
+        if outPath != "":
+            crs = QgsProject.instance().crs()
+            writer = QgsVectorFileWriter.writeAsVectorFormat(inputNodes, outPath, "System", crs, "ESRI Shapefile")
+            inputNodes.dataProvider().deleteAttributes([indexD[metric] for metric in metricsL] + statsIndex)
+            inputNodes.updateFields()
+
+        #results stored in the cache, NaN for the features without value
+        if cacheFolder != "":
+            valuesD = {}
+            for metric in metricsL:
+                valuesD[codesL[metric]] = array('d', [float('nan')])*nodesCount
+                for ind in range(nodesCount):
+                    if validA[ind] == 1 and (metric in [1, 2, 4, 5] or sourceIds == None or ind in sourceIds): valuesD[codesL[metric]][ind] = offsetA[ind+1] - offsetA[ind] if metric == 7 else metricA[metric][ind]
+            for col in range(len(statsA)): valuesD[statsCodes[col]] = array('d', statsA[col])
+            writeCache(valuesD)
+        removeMaps(folder)
+
     #import user input parameters
     inputNodes = instance.parameterAsVectorLayer(parameters, 'inpPoints', context)
     inputEdges = instance.parameterAsVectorLayer(parameters, 'inpLines', context)
+    distArea = lengthCalculator(inputEdges) #single calculator of the lengths of the lines
     metricsL = instance.parameterAsEnums(parameters, 'metrics', context)
     impField = instance.parameterAsFields(parameters, 'impedance', context)
     loadField = instance.parameterAsFields(parameters, 'load', context)
@@ -98,164 +895,242 @@ def computeMetrics(instance, parameters, context, feedback, inputs):
     analysisType = instance.parameterAsEnum(parameters, 'analysis', context)
     radius = instance.parameterAsDouble(parameters, 'radius', context)
     outPath = instance.parameterAsOutputLayer(parameters, 'dest', context)
+    sourceSet = instance.parameterAsEnum(parameters, 'sources', context) #all, selected or filtered features as sources
+    sourceExpr = instance.parameterAsExpression(parameters, 'sourceexpr', context)
+    contract = instance.parameterAsBool(parameters, 'contract', context) #contraction of degree-2 chains
+    blocks = instance.parameterAsBool(parameters, 'blocks', context) #betweenness by biconnected components
+    odPath = instance.parameterAsFileOutput(parameters, 'odfile', context) #export of the origin-destination costs
+    odFormat = instance.parameterAsEnum(parameters, 'odformat', context)
+    distStats = instance.parameterAsBool(parameters, 'diststats', context) #distribution of the distances from each source
+    try: bandsL = sorted(float(band) for band in instance.parameterAsString(parameters, 'bands', context).split(',') if band.strip() != '')
+    except ValueError:
+        feedback.reportError('The distance bands must be numbers separated by commas')
+        return
+    if len(bandsL) > 9:
+        feedback.pushWarning('Only the first 9 distance bands are used')
+        bandsL = bandsL[:9]
+    percL = [25, 50, 75, 90] #percentiles of the distance distribution
+    statsCodes = ["Dav"] + ["P" + str(perc) for perc in percL] + ["Bd" + str(ind+1) for ind in range(len(bandsL))]
+    doSearches = metricsL != [7] or odPath != "" or distStats #shortest paths are needed
+    twins = instance.parameterAsBool(parameters, 'twins', context) #shared searches of structurally equivalent nodes
+    lineFlows = instance.parameterAsBool(parameters, 'lineflows', context) and (1 in metricsL or 2 in metricsL) #metrics of the lines
     prec = instance.parameterAsDouble(parameters, 'precision', context)
+    oocFolder = instance.parameterAsFile(parameters, 'oocfolder', context) #folder of the memory-mapped files, empty for the in-memory analysis
+    memCap = instance.parameterAsDouble(parameters, 'memcap', context)
+    cacheFolder = instance.parameterAsFile(parameters, 'cachefolder', context) #folder of the results cache, empty when it is not used
+    cacheSize = instance.parameterAsDouble(parameters, 'cachesize', context)
+    codesL = ["Acc","Btw","Cen","Opp","Cvg","Pol","Rea","Cnc"]
+    fieldCodesL = [codesL[metric] for metric in metricsL] + (statsCodes if distStats else []) #codes of the result fields of the nodes
+
+    #source nodes of the shortest paths
+    sourceIds = None #None means that every node is a source
+    if sourceSet == 1: sourceIds = set(inputNodes.selectedFeatureIds())
+    elif sourceSet == 2 and sourceExpr != "": sourceIds = set(feat.id() for feat in inputNodes.getFeatures(QgsFeatureRequest().setFilterExpression(sourceExpr)))
+
+    #results served from the cache when every field is found, without building the network
+    if cacheFolder != "":
+        os.makedirs(cacheFolder, exist_ok = True)
+        cacheHash = cacheKey()
+        cachedD = readCache() if odPath == "" and not lineFlows else None
+        if cachedD != None:
+            netKey = networkKey()
+            writeCached(cachedD)
+            if netKey != None: renewNetwork(netKey)
+            return
+        feedback.pushInfo(f'Results Cache: Results Not Found, They Will Be Stored as {cacheHash[:12]}')
+
+    #out-of-core mode, the network is not kept in node objects
+    if oocFolder != "":
+        mapsA = [] #memory maps opened by the analysis and their typed views
+        outOfCore()
+        return
     
     #nodes initialization
     nodesCount = verifyFeatCount(inputNodes)
     nodesA = [0 for i in range(nodesCount)] #array that stores network nodes
+    loadA, supplyA, demandA = [array('d', [0])*nodesCount for i in range(3)] #load, supply and demand of each node, indexed by its id
+    metricA = [array('d', [0])*nodesCount if metric in metricsL else None for metric in range(7)] #one accumulator per metric, indexed by the node id
+    accessA, btwA, centA, opportA, convergA, polarityA, reachA = metricA
+    statsA = [array('d', [float('nan')])*nodesCount for code in statsCodes] if distStats else [] #distance distribution of each source
     for node in inputNodes.getFeatures(): 
-        nodesA[node.id()] = NodeObj(nodesCount, node, loadField, supplyField, demandField,metricsL)
+        nodesA[node.id()] = NodeObj(node)
+        loadA[node.id()], supplyA[node.id()], demandA[node.id()] = fieldsSum(node, loadField), fieldsSum(node, supplyField), fieldsSum(node, demandField)
         if node.id() % 100 == 0: feedback.pushInfo(f'Initializing Node {node.id()}')
     
     #Initialize Edges
     feedback.pushInfo("Initialize Edges")
-    nodesSpaceIndex = QgsSpatialIndex(inputNodes.getFeatures())
-    for edge in inputEdges.getFeatures():
-        edgesVertices = edge.geometry().asMultiPolyline()
-        vert1 = nodesSpaceIndex.nearestNeighbor(edgesVertices[0][0], 1, prec)
-        vert2 = nodesSpaceIndex.nearestNeighbor(edgesVertices[0][-1], 1, prec)
-        if vert1 != [] and vert2 != []:
-            dist = defineDistance(edge,analysisType,impField,edgesVertices[0][0],edgesVertices[0][-1])
-            if dist <= radius or radius == 0.0:
-                nodesA[vert1[0]].neighA.append([nodesA[vert2[0]],dist])
-                nodesA[vert2[0]].neighA.append([nodesA[vert1[0]],dist])
-    
-    #Compute Shortest Paths (Djikstra Algorithm with Binary Heap as Priority Queue)
-    #1-Heap cretation
-    if metricsL != [7]:
-        for source in nodesA:
+    linesD = {} #lines joining each pair of nodes, with their distances
+    netKey = networkKey() if cacheFolder != "" else None
+    networkA = loadNetwork(netKey) if netKey != None else None
+    if networkA != None and len(networkA[0]) == nodesCount + 1:
+        #connections read from the cache, with the impedances and the radius of this analysis
+        offsetA, targetA, lineA, baseA = networkA
+        impD = {edge.id(): fieldsSum(edge, impField) for edge in inputEdges.getFeatures(QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry))}
+        loopsS = set() #lines from a node to itself, which appear twice among its connections
+        for node in nodesA:
+            for slot in range(offsetA[node.id], offsetA[node.id+1]):
+                dist = impD[lineA[slot]] if analysisType == 0 else impD[lineA[slot]]*baseA[slot]
+                if dist <= radius or radius == 0.0:
+                    node.neighA.append([nodesA[targetA[slot]],dist])
+                    if lineFlows and (node.id < targetA[slot] or (node.id == targetA[slot] and lineA[slot] not in loopsS)):
+                        linesD.setdefault((node.id, targetA[slot]), []).append([lineA[slot], dist])
+                        if node.id == targetA[slot]: loopsS.add(lineA[slot])
+        feedback.pushInfo(f'Network Cache: {len(targetA)//2} Connections Read')
+    else:
+        cellsD = pointCells()
+        nodesSpaceIndex = QgsSpatialIndex(inputNodes.getFeatures()) if prec <= 0.0 else None
+        unsnapped = 0 #line ends without a point within the precision
+        builtL = [] #connections of the lines, stored in the cache
+        for edge in inputEdges.getFeatures():
+            end1, end2 = lineEnds(edge.geometry())
+            vert1, vert2 = snapEnd(end1, cellsD, nodesSpaceIndex), snapEnd(end2, cellsD, nodesSpaceIndex)
+            unsnapped += (vert1 == -1) + (vert2 == -1)
+            if vert1 != -1 and vert2 != -1:
+                dist = defineDistance(edge,analysisType,impField,end1,end2)
+                if netKey != None: builtL.append([vert1, vert2, edge.id(), distArea.measureLine(end1,end2)])
+                if dist <= radius or radius == 0.0:
+                    nodesA[vert1].neighA.append([nodesA[vert2],dist])
+                    nodesA[vert2].neighA.append([nodesA[vert1],dist])
+                    if lineFlows: linesD.setdefault((min(vert1, vert2), max(vert1, vert2)), []).append([edge.id(), dist])
+        del cellsD, nodesSpaceIndex
+        if unsnapped > 0: feedback.pushWarning(f'Grid Snapping: {unsnapped} Line Ends Without a Point Within the Distance Precision, Their Lines Were Not Used')
+        if netKey != None:
+            offsetA = array('q', [0])*(nodesCount + 1)
+            for vert1, vert2, lineId, base in builtL:
+                offsetA[vert1+1] += 1
+                offsetA[vert2+1] += 1
+            for ind in range(nodesCount): offsetA[ind+1] += offsetA[ind]
+            nextA = array('q', offsetA[:-1])
+            targetA, lineA, baseA = array('q', [0])*(2*len(builtL)), array('q', [0])*(2*len(builtL)), array('d', [0])*(2*len(builtL))
+            for vert1, vert2, lineId, base in builtL:
+                for vert, other in [(vert1, vert2), (vert2, vert1)]:
+                    targetA[nextA[vert]], lineA[nextA[vert]], baseA[nextA[vert]] = other, lineId, base
+                    nextA[vert] += 1
+            saveNetwork(netKey, [offsetA, targetA, lineA, baseA])
+            feedback.pushInfo(f'Network Cache: {len(builtL)} Connections Stored')
+            del builtL
+    if lineFlows:
+        linesCount = verifyFeatCount(inputEdges)
+        lineBtwA, lineCentA = array('d', [0])*linesCount, array('d', [0])*linesCount
+
+    #source nodes of the shortest paths
+    if sourceIds == None: sourcesA = nodesA
+    else:
+        sourcesA = [node for node in nodesA if node.id in sourceIds]
+        feedback.pushInfo(f'{len(sourcesA)} of {len(nodesA)} Nodes Used as Sources')
+        if sourcesA == []: feedback.pushWarning('No node matches the source features option, no shortest path will be computed')
+
+    compsA = buildComponents()
+    isolated = len([compA for compA in compsA if len(compA) == 1])
+    sizesA = [str(len(compA)) for compA in compsA if len(compA) > 1]
+    feedback.pushInfo(f'{len(sizesA)} Connected Components (Sizes: ' + ', '.join(sizesA[:10]) + (', ...' if len(sizesA) > 10 else '') + f'), {isolated} Isolated Nodes')
+
+    if contract and doSearches:
+        keptA, chainOfA, chainPosA, chainsA, superA, compChainsA = buildChains()
+        feedback.pushInfo(f'Chain Contraction: {nodesCount - keptA.count(True)} Nodes Contracted in {len([chain for chain in chainsA if chain[1] != []])} Chains')
+
+    twinOf, twinsD = findTwins() if twins and doSearches else ({}, {})
+    if twinsD != {}: feedback.pushInfo(f'Structural Equivalence: {len(twinOf)} Source Nodes in {len(twinsD)} Groups of Equivalent Nodes')
+
+    #betweenness computed from the biconnected components, which requires all pairs to be considered
+    btwBlocks = blocks and 1 in metricsL and radius == 0.0 and not lineFlows
+    if blocks and lineFlows: feedback.pushWarning('Biconnected components are not used when the metrics of the lines are computed')
+    if blocks and 1 in metricsL and radius != 0.0: feedback.pushWarning('Biconnected components are only used in global analysis, betweenness will be computed from the shortest paths')
+    if btwBlocks:
+        isSourceA = [1 if sourceIds == None or node.id in sourceIds else 0 for node in nodesA]
+        feedback.pushInfo(f'Biconnected Components: Betweenness Computed in {blockBetweenness(isSourceA)} Blocks')
+
+    #Compute Shortest Paths
+    if doSearches:
+        if odPath != "": odFile = openOD(nodesCount)
+        skippedSearches, distSearches, prunedAcc = 0, 0, 0 #work avoided by the weight-aware pruning
+        sharedSearches, twinSearch = 0, None #[representative, searched node, search results] of the last group of equivalent nodes
+        for source in sorted(sourcesA, key = lambda node: (node.comp, twinOf[node.id].id if node.id in twinOf else node.id, node.id)): #largest components first, equivalent nodes together
+            compA = compsA[source.comp]
             if source.id % 50 == 0: feedback.pushInfo(f'Shortest Path {source.id}')
-            finitePos = 0
-            costA = [99999999999999 for i in range(nodesCount)]
-            costA[source.id] = 0 #distance from the source edge to itself is zero
-            for ind in range(len(source.neighA)): costA[source.neighA[ind][0].id] = source.neighA[ind][1]
-            heap = [nodesA[0] for i in range(len(source.neighA) + 1)]
-            for destin in nodesA:
-                if costA[destin.id] == 99999999999999:
-                    heap.append(destin)
-                    destin.heapPos = len(heap) - 1
-                else:
-                    heap[finitePos] = destin
-                    destin.heapPos = finitePos
-                    n = finitePos
-                    finitePos += 1
-                    parent = int((n-1)/2)
-                    while n !=0 and costA[heap[n].id] < costA[heap[parent].id]:
-                        heap[n].heapPos, heap[parent].heapPos = parent, n
-                        heap[n], heap[parent] = heap[parent], heap[n]
-                        n = parent
-                        parent = int((n-1)/2)
-    #2-Heap sorting
-            pivotA = [[] for i in range(nodesCount)]
-            level = [0 for i in range(nodesCount)]
-            numSP = [0 for i in range(nodesCount)]
-            sortedA = [] 
-            numSP[source.id], level[source.id] = 1,0
-            for ind in range(len(source.neighA)): 
-                numSP[source.neighA[ind][0].id] = 1 
-                level[source.neighA[ind][0].id] = 1
-            while heap != []:
-                closest = heap[0]
-                if costA[closest.id] <= radius or radius == 0.0: sortedA.append(closest)
-                if finitePos > 0:
-                    heap[0].heapPos, heap[finitePos-1].heapPos = finitePos-1, 0
-                    heap[0], heap[finitePos-1] = heap[finitePos-1], heap[0]
-                    heap[finitePos-1].heapPos, heap[-1].heapPos = len(heap)-1, finitePos-1
-                    heap[finitePos-1], heap[-1] = heap[-1], heap[finitePos-1]
-                    finitePos -= 1
-                heap.pop(len(heap)-1)
-            
-                n = 0
-                lh = finitePos
-                posChild1, posChild2 = n*2+1, n*2+2
-                if posChild2 <= lh-1:
-                    costChild1, costChild2 = costA[heap[n*2+1].id], costA[heap[n*2+2].id]
-                    if any(x < costA[heap[n].id] for x in [costChild1,costChild2]):
-                        if costChild1 <= costChild2: sc = posChild1
-                        else: sc = posChild2
-                    else: sc = -1
-                elif posChild2 == lh:
-                    if costA[heap[n*2+1].id] < costA[heap[n].id]: sc = posChild1
-                    else: sc = -1
-                else: sc = -1
-                
-                while sc >= 0:
-                    heap[n].heapPos, heap[sc].heapPos = sc, n
-                    heap[n], heap[sc] = heap[sc], heap[n]
-                    n = sc
-                    lh = len(heap)
-                    posChild1, posChild2 = n*2+1, n*2+2
-                    if posChild2 <= lh-1:
-                        costChild1, costChild2 = costA[heap[n*2+1].id], costA[heap[n*2+2].id]
-                        if any(x < costA[heap[n].id] for x in [costChild1,costChild2]):
-                            if costChild1 <= costChild2: sc = posChild1
-                            else: sc = posChild2
-                        else: sc = -1
-                    elif posChild2 == lh:
-                        if costA[heap[n*2+1].id] < costA[heap[n].id]: sc = posChild1
-                        else: sc = -1
-                    else: sc = -1
-            
-                for ind in range(len(closest.neighA)):
-                    if closest.neighA[ind][0].heapPos < len(heap):
-                        cost = costA[closest.id] + closest.neighA[ind][1]
-                        prevCost = costA[closest.neighA[ind][0].id]
-                        if prevCost > cost and (radius == 0.0 or cost <= radius):
-                            costA[closest.neighA[ind][0].id], level[closest.neighA[ind][0].id] = cost, level[closest.id] + 1
-                            pivotA[closest.neighA[ind][0].id] = []
-                            pivotA[closest.neighA[ind][0].id].append(closest)
-                            numSP[closest.neighA[ind][0].id] += numSP[closest.id]
-                        
-                            n = closest.neighA[ind][0].heapPos
-                            if prevCost == 99999999999999: 
-                                heap[finitePos].heapPos, closest.neighA[ind][0].heapPos = n, finitePos
-                                heap[n], heap[finitePos] = heap[finitePos], closest.neighA[ind][0]
-                                n = finitePos
-                                finitePos += 1
-                            parent = int((n-1)/2)
-                            while n !=0 and costA[heap[n].id] < costA[heap[parent].id]:
-                                heap[n].heapPos, heap[parent].heapPos = parent, n
-                                heap[n], heap[parent] = heap[parent], heap[n]
-                                n = parent
-                                parent = int((n-1)/2)
-
-                        elif source.id != closest.id and costA[closest.neighA[ind][0].id] == cost and (radius == 0.0 or cost <= radius):
-                            pivotA[closest.neighA[ind][0].id].append(closest)
-                            numSP[closest.neighA[ind][0].id] += numSP[closest.id]
-                
+            if feedback.isCanceled(): break
+            #metrics whose contributions from this source are provably zero are not computed
+            doCent = 2 in metricsL and loadA[source.id] != 0
+            doCvg = (4 in metricsL or 5 in metricsL) and supplyA[source.id] != 0
+            doBtw = 1 in metricsL and not btwBlocks
+            doPath = doBtw or doCent or doCvg
+            if not doPath and odPath == "" and not distStats and 0 not in metricsL and 6 not in metricsL and (3 not in metricsL or demandA[source.id] <= 0):
+                skippedSearches += 1
+                continue
+            twin = twinOf.get(source.id)
+            if twin != None: doPath = doPath or any((2 in metricsL and loadA[node.id] != 0) or ((4 in metricsL or 5 in metricsL) and supplyA[node.id] != 0) for node in twinsD[twin.id]) #the search serves the whole group
+            if not doPath: distSearches += 1 #only distances are needed, shortest paths are not recorded
+            if len(compA) == 1: costA, sortedA, pivotA, numSP, level = [0], [source], [[]], [1], [0] #isolated node, no search is needed
+            elif twin != None and twinSearch != None and twinSearch[0] == twin: #search of an equivalent node, with both nodes exchanged
+                searched = twinSearch[1]
+                costA, pivotA, numSP, level = list(twinSearch[3]), list(twinSearch[4]), list(twinSearch[5]), list(twinSearch[6])
+                for arr in [costA, pivotA, numSP, level]: arr[source.pos], arr[searched.pos] = arr[searched.pos], arr[source.pos]
+                sortedA = [source if node == searched else (searched if node == source else node) for node in twinSearch[2]]
+                sharedSearches += 1
+            else:
+                if contract: costA, sortedA, pivotA, numSP, level = searchContracted(source, doPath, compA)
+                else: costA, sortedA, pivotA, numSP, level = searchFrom(source, doPath, compA)
+                if twin != None: twinSearch = [twin, source, sortedA[:], costA, pivotA, numSP, level]
+            if odPath != "": writeODRow(odFile, nodesCount, source.id, [(node.id, costA[node.pos]) for node in sortedA])
+            if distStats:
+                for col, value in enumerate(distanceStats([(costA[node.pos], loadA[node.id]) for node in sortedA if node != source and (radius == 0.0 or costA[node.pos] <= radius)])): statsA[col][source.id] = value
             #3-Metrics update
-            if 1 in metricsL: btwTemp = [0 for i in range(nodesCount)] 
-            if 2 in metricsL: fkcTemp = [0 for i in range(nodesCount)]
-            if 4 in metricsL or 5 in metricsL: cvgTemp = [0 for i in range(nodesCount)]
+            if doBtw: btwTemp = [0 for i in range(len(compA))] 
+            if doCent: fkcTemp = [0 for i in range(len(compA))]
+            if doCvg: cvgTemp = [0 for i in range(len(compA))]
             while sortedA != []:
                 farest = sortedA[-1]
-                cost = costA[farest.id]
+                cost = costA[farest.pos]
                 if radius == 0.0 or cost <= radius: 
-                    if 0 in metricsL and farest.id != source.id: source.access += farest.load/costA[farest.id]
-                    if 3 in metricsL and source.demand > 0: source.opport += farest.supply/(costA[farest.id]+1)
-                    if 6 in metricsL: source.reach += farest.load
+                    if 0 in metricsL and farest.id != source.id: accessA[source.id] += loadA[farest.id]/costA[farest.pos]
+                    if 3 in metricsL and demandA[source.id] > 0: opportA[source.id] += supplyA[farest.id]/(costA[farest.pos]+1)
+                    if 6 in metricsL: reachA[source.id] += loadA[farest.id]
                 sortedA.pop(len(sortedA)-1)
-                pot = farest.load * source.load
-                tension = source.supply*farest.demand
+                pot = loadA[farest.id] * loadA[source.id]
+                tension = supplyA[source.id]*demandA[farest.id]
                 
-                for neigh in pivotA[farest.id]:
-                    if radius == 0.0 or cost <= radius:
-                        if 1 in metricsL: btwTemp[neigh.id] += (numSP[neigh.id]/numSP[farest.id])*(1 + btwTemp[farest.id])
-                        if 2 in metricsL: fkcTemp[neigh.id] += (numSP[neigh.id]/numSP[farest.id])*((pot/(level[farest.id]+1))+fkcTemp[farest.id])
-                        if 4 in metricsL or 5 in metricsL: cvgTemp[neigh.id] += (numSP[neigh.id]/numSP[farest.id])*((tension/(level[farest.id]+1))+cvgTemp[farest.id])
+                #paths with zero weight that do not carry any accumulated value add nothing to their pivots
+                propCent = doCent and (pot != 0 or fkcTemp[farest.pos] != 0)
+                propCvg = doCvg and (tension != 0 or cvgTemp[farest.pos] != 0)
+                if doBtw or propCent or propCvg:
+                    for neigh in pivotA[farest.pos]:
+                        if radius == 0.0 or cost <= radius:
+                            if doBtw: btwTemp[neigh.pos] += (numSP[neigh.pos]/numSP[farest.pos])*(1 + btwTemp[farest.pos])
+                            if propCent: fkcTemp[neigh.pos] += (numSP[neigh.pos]/numSP[farest.pos])*((pot/(level[farest.pos]+1))+fkcTemp[farest.pos])
+                            if propCvg: cvgTemp[neigh.pos] += (numSP[neigh.pos]/numSP[farest.pos])*((tension/(level[farest.pos]+1))+cvgTemp[farest.pos])
+                elif pivotA[farest.pos] != []: prunedAcc += 1
                 
-                if pivotA[farest.id] == [] and level[farest.id] == 1 and (radius == 0.0 or cost <= radius): 
-                    if 2 in metricsL: fkcTemp[source.id] += (pot/2)+fkcTemp[farest.id]
-                    if 4 in metricsL or 5 in metricsL: cvgTemp[source.id] += (numSP[neigh.id]/numSP[farest.id])*((tension/(level[farest.id]+1))+cvgTemp[farest.id])
+                #flows through the lines from the pivots of the node, each parallel line of minimum cost is a different shortest path
+                if lineFlows and (doBtw or propCent) and farest.id != source.id and (radius == 0.0 or cost <= radius):
+                    for neigh in list(dict.fromkeys(pivotA[farest.pos])) + ([source] if level[farest.pos] == 1 else []):
+                        linesA = linesD.get((min(neigh.id, farest.id), max(neigh.id, farest.id)), [])
+                        usedA = [line for line in linesA if costA[neigh.pos] + line[1] == cost]
+                        if usedA == [] and neigh != source: usedA = [line for line in linesA if line[1] == min(line[1] for line in linesA)] #rounding of the costs
+                        for lineId, dist in usedA:
+                            if doBtw: lineBtwA[lineId] += (numSP[neigh.pos]/numSP[farest.pos])*(1 + btwTemp[farest.pos])/2
+                            if propCent: lineCentA[lineId] += (numSP[neigh.pos]/numSP[farest.pos])*((pot/(level[farest.pos]+1)) + fkcTemp[farest.pos])/2
+
+                if pivotA[farest.pos] == [] and level[farest.pos] == 1 and (radius == 0.0 or cost <= radius): 
+                    if doCent: fkcTemp[source.pos] += (pot/2)+fkcTemp[farest.pos]
+                    if doCvg: cvgTemp[source.pos] += (numSP[source.pos]/numSP[farest.pos])*((tension/(level[farest.pos]+1))+cvgTemp[farest.pos])
                 
                 if farest.id != source.id and (radius == 0.0 or cost <= radius): 
-                    if 1 in metricsL: farest.btw += btwTemp[farest.id]/2
-                    if 2 in metricsL: fkcTemp[farest.id] += pot/(level[farest.id]+1)
-                if (4 in metricsL or 5 in metricsL) and (radius == 0.0 or cost <= radius): cvgTemp[farest.id] += tension/(level[farest.id]+1)
+                    if doBtw: btwA[farest.id] += btwTemp[farest.pos]/2
+                    if doCent: fkcTemp[farest.pos] += pot/(level[farest.pos]+1)
+                if doCvg and (radius == 0.0 or cost <= radius): cvgTemp[farest.pos] += tension/(level[farest.pos]+1)
                 
-                if 2 in metricsL: farest.cent += fkcTemp[farest.id]/2
-                if 4 in metricsL and farest.supply > 0: farest.converg += cvgTemp[farest.id]
-                if 5 in metricsL: farest.polarity += cvgTemp[farest.id]
+                if doCent: centA[farest.id] += fkcTemp[farest.pos]/2
+                if 4 in metricsL and doCvg and supplyA[farest.id] > 0: convergA[farest.id] += cvgTemp[farest.pos]
+                if 5 in metricsL and doCvg: polarityA[farest.id] += cvgTemp[farest.pos]
+    
+        if twinsD != {}: feedback.pushInfo(f'Structural Equivalence: {sharedSearches} Searches Shared Between Equivalent Nodes')
+        if odPath != "":
+            odFile.close()
+            feedback.pushInfo(f'Origin-Destination Costs Written to {odPath}')
+        feedback.pushInfo(f'Weight Pruning: {skippedSearches} of {len(sourcesA)} searches skipped, {distSearches} searches without shortest paths recording, {prunedAcc} zero contributions not propagated')
+    if feedback.isCanceled(): #partial metrics are neither written nor stored in the results cache
+        feedback.pushWarning('Analysis canceled, no results were written')
+        return
     
     #update table of contents
     strBegin = "T" if analysisType == 0 else "G"
@@ -311,19 +1186,63 @@ def computeMetrics(instance, parameters, context, feedback, inputs):
         inputNodes.dataProvider().addAttributes([QgsField(strBegin + "Cnc" + str(aux),QVariant.Double)])
         inputNodes.updateFields()
         cncIndex = inputNodes.fields().indexFromName(strBegin + "Cnc" + str(aux))
+    statsIndex = []
+    for code in (statsCodes if distStats else []):
+        aux = 0
+        while inputNodes.fields().indexFromName(strBegin + code + str(aux)) != -1: aux += 1
+        inputNodes.dataProvider().addAttributes([QgsField(strBegin + code + str(aux),QVariant.Double)])
+        inputNodes.updateFields()
+        statsIndex.append(inputNodes.fields().indexFromName(strBegin + code + str(aux)))
+        if code[:2] == "Bd": inputNodes.setFieldAlias(statsIndex[-1], strBegin + code + str(aux) + f" (load within {bandsL[int(code[2:])-1]:g})")
     
+    #path based metrics computed from part of the sources are flagged in the fields' aliases
+    if sourceIds != None:
+        if 1 in metricsL: inputNodes.setFieldAlias(btwIndex, inputNodes.fields()[btwIndex].name() + " (sources subset)")
+        if 2 in metricsL: inputNodes.setFieldAlias(centIndex, inputNodes.fields()[centIndex].name() + " (sources subset)")
+        if 4 in metricsL: inputNodes.setFieldAlias(cvgIndex, inputNodes.fields()[cvgIndex].name() + " (sources subset)")
+        if 5 in metricsL: inputNodes.setFieldAlias(polIndex, inputNodes.fields()[polIndex].name() + " (sources subset)")
+
     for node in nodesA:
         metricsD = {}
-        if 0 in metricsL: metricsD[accIndex] = node.access
-        if 1 in metricsL: metricsD[btwIndex] = node.btw
-        if 2 in metricsL: metricsD[centIndex] = node.cent
-        if 3 in metricsL: metricsD[oppIndex] = node.opport
-        if 4 in metricsL: metricsD[cvgIndex] = node.converg
-        if 5 in metricsL: metricsD[polIndex] = node.polarity
-        if 6 in metricsL: metricsD[reachIndex] = node.reach
-        if 7 in metricsL: metricsD[cncIndex] = len(node.neighA)
-        inputNodes.dataProvider().changeAttributeValues({node.id : metricsD})
+        isSource = sourceIds == None or node.id in sourceIds
+        if 0 in metricsL and isSource: metricsD[accIndex] = accessA[node.id]
+        if 1 in metricsL: metricsD[btwIndex] = btwA[node.id]
+        if 2 in metricsL: metricsD[centIndex] = centA[node.id]
+        if 3 in metricsL and isSource: metricsD[oppIndex] = opportA[node.id]
+        if 4 in metricsL: metricsD[cvgIndex] = convergA[node.id]
+        if 5 in metricsL: metricsD[polIndex] = polarityA[node.id]
+        if 6 in metricsL and isSource: metricsD[reachIndex] = reachA[node.id]
+        if 7 in metricsL and isSource: metricsD[cncIndex] = len(node.neighA)
+        if isSource:
+            for col in range(len(statsIndex)): metricsD[statsIndex[col]] = None if math.isnan(statsA[col][node.id]) else statsA[col][node.id]
+        if metricsD != {}: inputNodes.dataProvider().changeAttributeValues({node.id : metricsD})
+
+    #results stored in the cache, NaN for the features without value
+    if cacheFolder != "":
+        valuesD = {}
+        for metric in metricsL:
+            valuesD[codesL[metric]] = array('d', [float('nan')])*nodesCount
+            for node in nodesA:
+                if metric in [1, 2, 4, 5] or sourceIds == None or node.id in sourceIds: valuesD[codesL[metric]][node.id] = len(node.neighA) if metric == 7 else metricA[metric][node.id]
+        for col in range(len(statsA)): valuesD[statsCodes[col]] = statsA[col]
+        writeCache(valuesD)
     
+    #metrics of the lines, written in the lines vector layer
+    if lineFlows:
+        lineIndexD = {}
+        for metric in [metric for metric in [1, 2] if metric in metricsL]:
+            code = "Btw" if metric == 1 else "Cen"
+            aux = 0
+            while inputEdges.fields().indexFromName(strBegin + code + str(aux)) != -1: aux += 1
+            inputEdges.dataProvider().addAttributes([QgsField(strBegin + code + str(aux),QVariant.Double)])
+            inputEdges.updateFields()
+            lineIndexD[metric] = inputEdges.fields().indexFromName(strBegin + code + str(aux))
+            if sourceIds != None: inputEdges.setFieldAlias(lineIndexD[metric], inputEdges.fields()[lineIndexD[metric]].name() + " (sources subset)")
+        changesD = {}
+        for linesA in linesD.values():
+            for lineId, dist in linesA: changesD[lineId] = {lineIndexD[metric]: (lineBtwA if metric == 1 else lineCentA)[lineId] for metric in lineIndexD}
+        inputEdges.dataProvider().changeAttributeValues(changesD)
+
     if outPath != "":
         crs = QgsProject.instance().crs()
         transform_context = QgsProject.instance().transformContext()
@@ -340,9 +1259,13 @@ def computeMetrics(instance, parameters, context, feedback, inputs):
         if 5 in metricsL: metricsOut.append(polIndex)
         if 6 in metricsL: metricsOut.append(reachIndex)
         if 7 in metricsL: metricsOut.append(cncIndex)
+        metricsOut += statsIndex
         inputNodes.dataProvider().deleteAttributes(metricsOut)
         inputNodes.updateFields()
 
+    #connections of the network kept for the next analyses of the same files
+    if netKey != None: renewNetwork(netKey)
+
     
     
     
@@ -0,0 +1,270 @@
+import json
+import time
+import math
+import heapq
+from array import array
+from urllib.parse import urlparse, parse_qs
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from qgis import processing
+from qgis.processing import alg
+from qgis.core import (NULL, QgsSpatialIndex, QgsDistanceArea, QgsGeometry, QgsPointXY)
+
+#ui input parameters
+@alg(name='GAUS_qs11', label='GAUS Query Service 1.1', group='GAUS v1.1', group_label='GAUS v1.1')
+@alg.input(type=alg.ENUM, name='network', label='Network Type', options=['Points+Lines','Lines'], default = 0)
+@alg.input(type=alg.VECTOR_LAYER, name='inpLines', label='Lines', types=[1])
+@alg.input(type=alg.VECTOR_LAYER, name='inpPoints', label='Points (Points+Lines networks)', types=[0], optional = True)
+@alg.input(type=alg.ENUM, name='analysis', label='Analysis Type', options=['Topological','Geodetic'], default = 1)
+@alg.input(type=alg.ENUM, name='geomrule', label='Rule for Connecting Lines (Lines networks)', options=['Overlapping Vertices','Crossing Lines', 'Overlapping Vertices + Crossing Lines'], default = 0)
+@alg.input(type=alg.NUMBER, name='vertextol', label='Tolerance of Overlapping Vertices (Lines networks, 0.0 = Exact Coordinates)', default=0.0)
+@alg.input(type=alg.BOOL, name='exactcheck', label='Verify Overlapping Vertices with the Exact Geometric Test (Lines networks)', default = True)
+@alg.input(type=alg.FIELD, name='impedance',label='Impedance of Lines',parentLayerParameterName = 'inpLines',allowMultiple=True,optional = True)
+@alg.input(type=alg.STRING, name='load',label='Load Fields (comma separated)', optional = True)
+@alg.input(type=alg.STRING, name='supply',label='Supply Fields (comma separated)', optional = True)
+@alg.input(type=alg.STRING, name='demand',label='Demand Fields (comma separated)', optional = True)
+@alg.input(type=alg.NUMBER, name='precision', label='Distance Precision', default=0.00015)
+@alg.input(type=alg.NUMBER, name='port', label='Port of the Service (localhost)', default=8765)
+
+#ui output definition (does nothing, it is here because qgis requires the declaration of at least one output)
+@alg.output(type=alg.NUMBER, name='numoffeat', label='Number of Queries Answered')
+
+def computeMetrics(instance, parameters, context, feedback, inputs):
+    """
+    Keeps a network in memory and answers Accessibility, Opportunity and Reach queries from other programs through a local HTTP service.
+
+    Fields Description:
+    Network Type: the network is built as in GAUS Points+Lines 1.1 (points connected by lines) or as in GAUS Lines 1.1 (lines connected to each other).
+    Lines: vector layer of the network's lines.
+    Points: vector layer of the network's nodes, only used for Points+Lines networks.
+    Analysis, Rule for Connecting Lines, Tolerance of Overlapping Vertices, Verify Overlapping Vertices with the Exact Geometric Test, Impedance and Distance Precision: the same as in the analysis of the whole network.
+    Load, Supply and Demand Fields: names of the fields of the points (or lines, in Lines networks) containing the load, supply and demand of each feature, separated by commas.
+    Port of the Service: port where the service listens, only on the local machine (127.0.0.1).
+    The network is built once and the service runs until the algorithm is canceled or a request to /shutdown is received. Queries:
+    GET /query?x=...&y=...&radius=...&metrics=Acc,Opp,Rea: the coordinates (in the layer's reference system) are snapped to the nearest feature and the metrics of that feature within the radius (0 = global) are returned. The feature can be informed by its id with id=... instead of the coordinates.
+    POST /query: a JSON list of queries with the same keys, answered in a single JSON list.
+    GET /health: number of features of the network and of queries answered.
+    The metrics are the same of GAUS Points+Lines 1.1 and GAUS Lines 1.1 for the queried feature. The gaus_query_client.py file is a client for the service that can be used from the command line.
+    """
+
+    #Nodes of the network
+    class NodeObj:
+        __slots__ = ('id', 'neighA')
+        def __init__(self, feat):
+            self.id = feat.id()
+            self.neighA = []  #list of connected nodes
+
+    #verifies if highest id number is lower than number of features
+    #in order to avoid potential conflicts with matrices' size
+    def verifyFeatCount(inputFeat):
+        featCount = inputFeat.featureCount()
+        for feat in inputFeat.getFeatures(): featCount = max(featCount, feat.id()+1)
+        return featCount
+
+    #Length Calculator
+    #a single calculator for every line: planar lengths in the units of the layer for projected systems, ellipsoidal lengths in meters for geographic systems
+    def lengthCalculator(layer):
+        distArea = QgsDistanceArea()
+        if layer.crs().isGeographic():
+            distArea.setSourceCrs(layer.crs(), context.transformContext())
+            distArea.setEllipsoid(context.ellipsoid() if context.ellipsoid() not in ('', 'NONE') else layer.crs().ellipsoidAcronym())
+        return distArea
+
+    def defineDistance(edge,analysisType,impField,edgeA,edgeB):
+        if impField == []: imp = 1
+        else:
+            imp = 0
+            for i in range(len(impField)):
+                if edge.attribute(impField[i]) != NULL: imp += edge.attribute(impField[i])
+
+        dist = imp if analysisType == 0 else imp*distArea.measureLine(edgeA,edgeB)
+        return dist
+
+    #sum of the selected fields of a feature, NULL values are ignored and no selected field means 1
+    def fieldsSum(feat, fieldsF):
+        if fieldsF == []: return 1
+        value = 0
+        for i in range(len(fieldsF)):
+            if feat.attribute(fieldsF[i]) != NULL: value += feat.attribute(fieldsF[i])
+        return value
+
+    #points connected by the lines whose ends are within the distance precision, as in GAUS Points+Lines 1.1
+    def buildPointsLines():
+        for edge in inputEdges.getFeatures():
+            edgesVertices = edge.geometry().asMultiPolyline()
+            vert1 = spaceIndex.nearestNeighbor(edgesVertices[0][0], 1, prec)
+            vert2 = spaceIndex.nearestNeighbor(edgesVertices[0][-1], 1, prec)
+            if vert1 != [] and vert2 != []:
+                dist = defineDistance(edge,analysisType,impField,edgesVertices[0][0],edgesVertices[0][-1])
+                nodesA[vert1[0]].neighA.append([nodesA[vert2[0]],dist])
+                nodesA[vert2[0]].neighA.append([nodesA[vert1[0]],dist])
+
+    #lines connected by the chosen geometric rule, at half of the sum of their lengths, as in GAUS Lines 1.1
+    def buildLines():
+        featsA, geomsA, halfA = [], [], []
+        for edge in inputEdges.getFeatures():
+            featsA.append(nodesA[edge.id()])
+            geomsA.append(edge.geometry())
+            imp = 1 if impField == [] else sum(edge.attribute(name) for name in impField if edge.attribute(name) != NULL)
+            halfA.append(imp*(distArea.measureLength(edge.geometry()) if analysisType == 1 else 1))
+        for pos1, pos2 in sorted(vertexPairs(geomsA) if geomR == 0 else crossingPairs(geomsA)):
+            dist = (halfA[pos1] + halfA[pos2])/2
+            featsA[pos1].neighA.append([featsA[pos2], dist])
+            featsA[pos2].neighA.append([featsA[pos1], dist])
+
+    #Overlapping Vertices by Hashing, as in GAUS Lines 1.1
+    #the vertices are bucketed by their coordinates (cells of the tolerance size), and an end of a line can only touch the lines with a vertex in its cell or in the cells around it
+    def vertexPairs(geomsA):
+        def cellOf(vertex):
+            return (vertex.x(), vertex.y()) if vertexTol == 0.0 else (math.floor(vertex.x()/vertexTol), math.floor(vertex.y()/vertexTol))
+
+        cellsD = {} #lines with a vertex in each cell and the coordinates of the vertex
+        endsD = {} #ends of the parts of each line
+        for pos in range(len(geomsA)):
+            partsA = geomsA[pos].asMultiPolyline() if geomsA[pos].isMultipart() else [geomsA[pos].asPolyline()]
+            for part in partsA:
+                for vertex in part: cellsD.setdefault(cellOf(vertex), []).append((pos, vertex.x(), vertex.y()))
+            endsD[pos] = [vertex for part in partsA if part != [] for vertex in [part[0], part[-1]]]
+        pairsS = set()
+        for pos in range(len(geomsA)):
+            for vertex in endsD[pos]:
+                cellX, cellY = cellOf(vertex)
+                for cell in ([(cellX, cellY)] if vertexTol == 0.0 else [(cellX + dx, cellY + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]):
+                    for other, x, y in cellsD.get(cell, []):
+                        if other != pos and (vertexTol == 0.0 or (x - vertex.x())**2 + (y - vertex.y())**2 <= vertexTol**2): pairsS.add((min(pos, other), max(pos, other)))
+        if exactCheck: pairsS = set(pair for pair in pairsS if geomsA[pair[1]].touches(geomsA[pair[0]]))
+        return pairsS
+
+    #Crossing Lines by Spatial Index, as in GAUS Lines 1.1
+    #only the lines with intersecting bounding boxes are candidates, tested by a prepared geometry of each line
+    #one relate gives the DE-9IM matrix of both rules: crossing lines meet at points of their interiors, touching lines only meet at their boundaries
+    def crossingPairs(geomsA):
+        linesIndex = QgsSpatialIndex()
+        for pos in range(len(geomsA)):
+            if not geomsA[pos].isEmpty(): linesIndex.addFeature(pos, geomsA[pos].boundingBox())
+        pairsS = set()
+        for pos in range(len(geomsA)):
+            if geomsA[pos].isEmpty(): continue
+            engine = QgsGeometry.createGeometryEngine(geomsA[pos].constGet())
+            engine.prepareGeometry()
+            for other in linesIndex.intersects(geomsA[pos].boundingBox()):
+                if other <= pos or not engine.intersects(geomsA[other].constGet()): continue
+                matrix = engine.relate(geomsA[other].constGet())
+                if matrix[0] == '0' or (geomR == 2 and matrix[0] == 'F' and matrix[1] + matrix[3] + matrix[4] != 'FFF'): pairsS.add((pos, other))
+        return pairsS
+
+    #nearest feature of a coordinate, lines are compared by their geometries among the nearest bounding boxes
+    def snapPoint(x, y):
+        point = QgsPointXY(x, y)
+        candidatesL = spaceIndex.nearestNeighbor(point, 1 if network == 0 else 5)
+        if candidatesL == []: return None, None
+        distD = {featId: geomsD[featId].distance(QgsGeometry.fromPointXY(point)) for featId in candidatesL}
+        featId = min(candidatesL, key = lambda featId: (distD[featId], featId))
+        return featId, distD[featId]
+
+    #Shortest Paths within the radius (Djikstra Algorithm with heapq as Priority Queue), only the distances are needed
+    def queryMetrics(source, radius, metricsL):
+        costD, heap = {source.id: 0}, [(0, source.id, source)]
+        resultD = {metric: 0 for metric in metricsL}
+        while heap != []:
+            cost, closestId, closest = heapq.heappop(heap)
+            if cost > costD[closestId]: continue #outdated entry
+            if "Acc" in metricsL and closestId != source.id: resultD["Acc"] += loadA[closestId]/cost
+            if "Opp" in metricsL and demandA[source.id] > 0: resultD["Opp"] += supplyA[closestId]/(cost+1)
+            if "Rea" in metricsL: resultD["Rea"] += loadA[closestId]
+            for neigh, dist in closest.neighA:
+                newCost = cost + dist
+                if newCost < costD.get(neigh.id, 99999999999999) and (radius == 0.0 or newCost <= radius):
+                    costD[neigh.id] = newCost
+                    heapq.heappush(heap, (newCost, neigh.id, neigh))
+        return resultD
+
+    #answer of a single query, with the same keys of the request
+    def answer(queryD):
+        start = time.perf_counter()
+        try:
+            if "id" in queryD: featId, snapDist = int(queryD["id"]), 0.0
+            else: featId, snapDist = snapPoint(float(queryD["x"]), float(queryD["y"]))
+            radius = float(queryD.get("radius", 0.0))
+            metricsL = [metric.strip() for metric in str(queryD.get("metrics", "Acc,Opp,Rea")).split(",") if metric.strip() in ["Acc", "Opp", "Rea"]]
+        except (KeyError, ValueError, TypeError): return {"error": "queries need id or x and y, and numeric radius"}
+        if featId == None or not 0 <= featId < featCount or nodesA[featId] == 0: return {"error": "feature not found"}
+        resultD = {"id": featId, "snapDistance": snapDist, "radius": radius}
+        resultD.update(queryMetrics(nodesA[featId], radius, metricsL))
+        resultD["milliseconds"] = round(1000*(time.perf_counter() - start), 3)
+        return resultD
+
+    class QueryHandler(BaseHTTPRequestHandler):
+        def sendJson(self, status, value):
+            body = json.dumps(value).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/query":
+                self.sendJson(200, answer({key: values[0] for key, values in parse_qs(url.query).items()}))
+                stateD["queries"] += 1
+            elif url.path == "/health": self.sendJson(200, {"features": len(nodesA) - nodesA.count(0), "queries": stateD["queries"]})
+            elif url.path == "/shutdown":
+                self.sendJson(200, {"shutdown": True})
+                stateD["running"] = False
+            else: self.sendJson(404, {"error": "unknown path"})
+
+        def do_POST(self):
+            if urlparse(self.path).path != "/query": return self.sendJson(404, {"error": "unknown path"})
+            try: queriesL = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            except ValueError: return self.sendJson(400, {"error": "invalid JSON"})
+            if not isinstance(queriesL, list): queriesL = [queriesL]
+            self.sendJson(200, [answer(queryD) if isinstance(queryD, dict) else {"error": "invalid query"} for queryD in queriesL])
+            stateD["queries"] += len(queriesL)
+
+        def log_message(self, format, *args): pass #requests are not logged in the processing window
+
+    #import user input parameters
+    network = instance.parameterAsEnum(parameters, 'network', context)
+    inputEdges = instance.parameterAsVectorLayer(parameters, 'inpLines', context)
+    distArea = lengthCalculator(inputEdges) #single calculator of the lengths of the lines
+    inputNodes = instance.parameterAsVectorLayer(parameters, 'inpPoints', context)
+    analysisType = instance.parameterAsEnum(parameters, 'analysis', context)
+    geomR = instance.parameterAsEnum(parameters, 'geomrule', context)
+    vertexTol = instance.parameterAsDouble(parameters, 'vertextol', context) #tolerance of the overlapping vertices
+    exactCheck = instance.parameterAsBool(parameters, 'exactcheck', context) #touches test of the lines with overlapping vertices
+    impField = instance.parameterAsFields(parameters, 'impedance', context)
+    loadField = [name.strip() for name in instance.parameterAsString(parameters, 'load', context).split(',') if name.strip() != '']
+    supplyField = [name.strip() for name in instance.parameterAsString(parameters, 'supply', context).split(',') if name.strip() != '']
+    demandField = [name.strip() for name in instance.parameterAsString(parameters, 'demand', context).split(',') if name.strip() != '']
+    prec = instance.parameterAsDouble(parameters, 'precision', context)
+    port = instance.parameterAsInt(parameters, 'port', context)
+
+    if network == 0 and inputNodes == None:
+        feedback.reportError('Points+Lines networks require the points vector layer')
+        return {'numoffeat': 0}
+    resLayer = inputNodes if network == 0 else inputEdges #layer whose features are the nodes of the network
+
+    #network built once and kept while the service runs
+    featCount = verifyFeatCount(resLayer)
+    nodesA = [0 for i in range(featCount)] #array that stores network nodes
+    loadA, supplyA, demandA = [array('d', [0])*featCount for i in range(3)] #load, supply and demand of each node, indexed by its id
+    geomsD = {} #geometries used to snap the queried coordinates
+    for feat in resLayer.getFeatures():
+        nodesA[feat.id()] = NodeObj(feat)
+        loadA[feat.id()], supplyA[feat.id()], demandA[feat.id()] = fieldsSum(feat, loadField), fieldsSum(feat, supplyField), fieldsSum(feat, demandField)
+        geomsD[feat.id()] = feat.geometry()
+    spaceIndex = QgsSpatialIndex(resLayer.getFeatures())
+    feedback.pushInfo("Initialize Edges")
+    if network == 0: buildPointsLines()
+    else: buildLines()
+
+    stateD = {"running": True, "queries": 0}
+    server = HTTPServer(("127.0.0.1", port), QueryHandler)
+    server.timeout = 0.5 #the cancel button is checked between requests
+    feedback.pushInfo(f'GAUS Query Service Listening on http://127.0.0.1:{server.server_address[1]}/query, {featCount} Features')
+    try:
+        while stateD["running"] and not feedback.isCanceled(): server.handle_request()
+    finally: server.server_close()
+    feedback.pushInfo(f'GAUS Query Service Stopped after {stateD["queries"]} Queries')
+
+    return {'numoffeat': stateD["queries"]}
@@ -0,0 +1,174 @@
+import os
+import tempfile
+from qgis import processing
+from qgis.processing import alg
+from qgis.PyQt.QtCore import QVariant
+from qgis.core import (QgsVectorLayer, QgsVectorFileWriter, QgsFeature, QgsFeatureRequest, QgsField, QgsRectangle, QgsWkbTypes)
+
+#ui input parameters
+@alg(name='GAUS_tiles11', label='GAUS Tiled Analysis 1.1', group='GAUS v1.1', group_label='GAUS v1.1')
+@alg.input(type=alg.ENUM, name='network', label='Network Type', options=['Points+Lines','Lines'], default = 0)
+@alg.input(type=alg.VECTOR_LAYER, name='inpLines', label='Lines', types=[1])
+@alg.input(type=alg.VECTOR_LAYER, name='inpPoints', label='Points (Points+Lines networks)', types=[0], optional = True)
+@alg.input(type=alg.ENUM, name='analysis', label='Analysis Type', options=['Topological','Geodetic'], default = 1)
+@alg.input(type=alg.ENUM, name='metrics', label='Metrics to be Computed', options=['Accessibility','Betweenness','Freeman-Krafta Centrality','Opportunity','Convergence','Polarity','Reach','Connectivity'], allowMultiple=True)
+@alg.input(type=alg.ENUM, name='geomrule', label='Rule for Connecting Lines (Lines networks)', options=['Overlapping Vertices','Crossing Lines', 'Overlapping Vertices + Crossing Lines'], default = 0)
+@alg.input(type=alg.NUMBER, name='radius', label='Analysis Radius')
+@alg.input(type=alg.FIELD, name='impedance',label='Impedance of Lines',parentLayerParameterName = 'inpLines',allowMultiple=True,optional = True)
+@alg.input(type=alg.STRING, name='load',label='Load Fields (comma separated)', optional = True)
+@alg.input(type=alg.STRING, name='supply',label='Supply Fields (comma separated)', optional = True)
+@alg.input(type=alg.STRING, name='demand',label='Demand Fields (comma separated)', optional = True)
+@alg.input(type=alg.NUMBER, name='precision', label='Distance Precision', default=0.00015)
+@alg.input(type=alg.NUMBER, name='tilesize', label='Tile Size', default=5000.0)
+@alg.input(type=alg.NUMBER, name='halo', label='Halo Width (0.0 = Analysis Radius)', default=0.0)
+@alg.input(type=alg.NUMBER, name='part', label='Part to be Processed', default=1)
+@alg.input(type=alg.NUMBER, name='parts', label='Number of Parts', default=1)
+@alg.input(type=alg.NUMBER, name='suffix', label='Number at the End of the Result Fields (-1 = Automatic)', default=-1)
+
+#ui output definition (does nothing, it is here because qgis requires the declaration of at least one output)
+@alg.output(type=alg.NUMBER, name='numoffeat', label='Number of Features Processed')
+
+def computeMetrics(instance, parameters, context, feedback, inputs):
+    """
+    Computes the configurational metrics of a large network with a defined radius, tile by tile.
+
+    Fields Description:
+    Network Type: the analysis of each tile is made by GAUS Points+Lines 1.1 or by GAUS Lines 1.1.
+    Lines: vector layer of the network's lines.
+    Points: vector layer of the network's nodes, only used for Points+Lines networks.
+    Analysis, Metrics to be Computed, Rule for Connecting Lines, Impedance and Distance Precision: the same as in the analysis of the whole network.
+    Analysis Radius: radius of the analysis, it must be higher than zero since the metrics of each feature only depend on the network within the radius.
+    Load, Supply and Demand Fields: names of the fields of the points (or lines, in Lines networks) containing the load, supply and demand of each feature, separated by commas.
+    Tile Size: width and height of the square tiles, in the units of the layers. Each tile only loads the features within it and its halo, so the size bounds the memory used by each analysis.
+    Halo Width: width of the band around each tile that is loaded with it. Only the features inside the tile receive results, the ones in the halo complete the paths that reach them. It must be at least the largest straight distance covered within the radius: in geodetic analysis with impedances not lower than 1 it is the radius itself, which is used when zero is informed. In topological analysis it must be informed.
+    Part to be Processed and Number of Parts: the tiles are divided in this number of parts and only the informed part is processed, so the parts can be run in parallel in separate QGIS processes or machines on copies of the layers, every part writing in the same result fields.
+    Number at the End of the Result Fields: the result fields are named as in the analysis of the whole network, ending with this number, and existing fields with the same name receive the results of the tiles. Automatic means the first free number for a single part. For divided runs it means 0, and the run is refused if a field ending with 0 already exists, so the results of another analysis are not overwritten: the number must then be informed, the same one in every part.
+    The results are inserted in the points vector layer (or in the lines vector layer, in Lines networks).
+    """
+
+    #copies the features within a rectangle to a temporary GeoPackage, keeping their original ids
+    #GeoPackage keeps the full names of the fields, which shapefiles cut to 10 characters
+    def writeTile(layer, rect, fieldNames, path):
+        memLayer = QgsVectorLayer(QgsWkbTypes.displayString(layer.wkbType()) + "?crs=" + layer.crs().authid(), "tile", "memory")
+        memLayer.dataProvider().addAttributes([layer.fields().field(name) for name in fieldNames] + [QgsField("gausFid", QVariant.Int)])
+        memLayer.updateFields()
+        featsA = []
+        for feat in layer.getFeatures(QgsFeatureRequest().setFilterRect(rect)):
+            tileFeat = QgsFeature(memLayer.fields())
+            tileFeat.setGeometry(feat.geometry())
+            tileFeat.setAttributes([feat.attribute(name) for name in fieldNames] + [feat.id()])
+            featsA.append(tileFeat)
+        memLayer.dataProvider().addFeatures(featsA)
+        QgsVectorFileWriter.writeAsVectorFormat(memLayer, path, "UTF-8", layer.crs(), "GPKG")
+        return QgsVectorLayer(path, "tile", "ogr"), len(featsA)
+
+    #a feature belongs to the tile containing its point or the center of its bounding box
+    def tileCore(feat, x0, y0):
+        center = feat.geometry().boundingBox().center()
+        return x0 <= center.x() < x0 + tileSize and y0 <= center.y() < y0 + tileSize
+
+    #import user input parameters
+    network = instance.parameterAsEnum(parameters, 'network', context)
+    inputEdges = instance.parameterAsVectorLayer(parameters, 'inpLines', context)
+    inputNodes = instance.parameterAsVectorLayer(parameters, 'inpPoints', context)
+    analysisType = instance.parameterAsEnum(parameters, 'analysis', context)
+    metricsL = instance.parameterAsEnums(parameters, 'metrics', context)
+    geomR = instance.parameterAsEnum(parameters, 'geomrule', context)
+    radius = instance.parameterAsDouble(parameters, 'radius', context)
+    impField = instance.parameterAsFields(parameters, 'impedance', context)
+    loadField = [name.strip() for name in instance.parameterAsString(parameters, 'load', context).split(',') if name.strip() != '']
+    supplyField = [name.strip() for name in instance.parameterAsString(parameters, 'supply', context).split(',') if name.strip() != '']
+    demandField = [name.strip() for name in instance.parameterAsString(parameters, 'demand', context).split(',') if name.strip() != '']
+    prec = instance.parameterAsDouble(parameters, 'precision', context)
+    tileSize = instance.parameterAsDouble(parameters, 'tilesize', context)
+    halo = instance.parameterAsDouble(parameters, 'halo', context)
+    parts = max(1, instance.parameterAsInt(parameters, 'parts', context))
+    part = min(max(1, instance.parameterAsInt(parameters, 'part', context)), parts)
+    suffix = instance.parameterAsInt(parameters, 'suffix', context)
+
+    if radius <= 0.0:
+        feedback.reportError('The tiled analysis requires an analysis radius higher than zero')
+        return {'numoffeat': 0}
+    if network == 0 and inputNodes == None:
+        feedback.reportError('Points+Lines networks require the points vector layer')
+        return {'numoffeat': 0}
+    if tileSize <= 0.0:
+        feedback.reportError('The tile size must be higher than zero')
+        return {'numoffeat': 0}
+    if halo == 0.0 and analysisType == 0:
+        feedback.reportError('In topological analysis the radius is not a distance, the halo width must be informed')
+        return {'numoffeat': 0}
+    if halo == 0.0: halo = radius
+
+    resLayer = inputNodes if network == 0 else inputEdges #layer whose features receive the results
+    weightFields = [name for name in loadField + supplyField + demandField if resLayer.fields().indexFromName(name) != -1]
+    impFields = [name for name in impField if inputEdges.fields().indexFromName(name) != -1]
+
+    #result fields, the parts of a divided run share the same fields
+    strBegin = "T" if analysisType == 0 else "G"
+    strMid = str(int(radius))
+    if len(strMid) > 5: strBegin += strMid[0:5]
+    else: strBegin += strMid
+    codesL = ["Acc","Btw","Cen","Opp","Cvg","Pol","Rea","Cnc"]
+    existingL = [strBegin + codesL[metric] + "0" for metric in metricsL if resLayer.fields().indexFromName(strBegin + codesL[metric] + "0") != -1]
+    if parts > 1 and suffix < 0 and existingL != []:
+        feedback.reportError(f'The result fields {", ".join(existingL)} already exist, inform the number at the end of the result fields, the same in every part')
+        return {'numoffeat': 0}
+    indexD = {}
+    for metric in metricsL:
+        aux = max(0, suffix)
+        if parts == 1 and suffix < 0:
+            while resLayer.fields().indexFromName(strBegin + codesL[metric] + str(aux)) != -1: aux += 1
+        if resLayer.fields().indexFromName(strBegin + codesL[metric] + str(aux)) == -1:
+            resLayer.dataProvider().addAttributes([QgsField(strBegin + codesL[metric] + str(aux),QVariant.Double)])
+            resLayer.updateFields()
+        indexD[metric] = resLayer.fields().indexFromName(strBegin + codesL[metric] + str(aux))
+
+    #tiles grid over the extent of the layer that receives the results
+    extent = resLayer.extent()
+    cols, rows = int(extent.width()//tileSize) + 1, int(extent.height()//tileSize) + 1
+    tilesA = [[col, row] for row in range(rows) for col in range(cols) if (row*cols + col) % parts == part - 1]
+    feedback.pushInfo(f'Part {part} of {parts}: {len(tilesA)} of {rows*cols} Tiles, Halo Width {halo}')
+
+    tempDir = tempfile.mkdtemp(prefix='gaus_tiles_')
+    processed = 0
+    for ind in range(len(tilesA)):
+        if feedback.isCanceled(): break
+        col, row = tilesA[ind]
+        x0, y0 = extent.xMinimum() + col*tileSize, extent.yMinimum() + row*tileSize
+        coreRect = QgsRectangle(x0, y0, x0 + tileSize, y0 + tileSize)
+        coreIds = set(feat.id() for feat in resLayer.getFeatures(QgsFeatureRequest().setFilterRect(coreRect)) if tileCore(feat, x0, y0))
+        if coreIds == set(): continue
+        haloRect = QgsRectangle(x0 - halo, y0 - halo, x0 + tileSize + halo, y0 + tileSize + halo)
+
+        #analysis of the tile and its halo with the whole network algorithm
+        linesPath = os.path.join(tempDir, f'lines_{col}_{row}.gpkg')
+        if network == 0:
+            pointsPath = os.path.join(tempDir, f'points_{col}_{row}.gpkg')
+            tileLayer, tileCount = writeTile(inputNodes, haloRect, weightFields, pointsPath)
+            tileLines, linesCount = writeTile(inputEdges, haloRect, impFields, linesPath)
+            params = {'inpLines': tileLines, 'inpPoints': tileLayer, 'analysis': analysisType, 'metrics': metricsL, 'radius': radius, 'impedance': impFields, 'load': [name for name in loadField if name in weightFields], 'supply': [name for name in supplyField if name in weightFields], 'demand': [name for name in demandField if name in weightFields], 'precision': prec}
+            processing.run("script:GAUS_pl11", params, context = context, is_child_algorithm = True)
+        else:
+            tileLayer, tileCount = writeTile(inputEdges, haloRect, list(dict.fromkeys(weightFields + impFields)), linesPath)
+            params = {'inpLines': tileLayer, 'analysis': analysisType, 'metrics': metricsL, 'geomrule': geomR, 'radius': radius, 'impedance': impFields, 'load': [name for name in loadField if name in weightFields], 'supply': [name for name in supplyField if name in weightFields], 'demand': [name for name in demandField if name in weightFields]}
+            processing.run("script:GAUS_l11", params, context = context, is_child_algorithm = True)
+
+        #results written back only for the features inside the tile
+        tileIndexD = {metric: tileLayer.fields().indexFromName(strBegin + codesL[metric] + "0") for metric in metricsL}
+        changesD = {}
+        for feat in tileLayer.getFeatures():
+            if feat.attribute("gausFid") in coreIds: changesD[feat.attribute("gausFid")] = {indexD[metric]: feat.attributes()[tileIndexD[metric]] for metric in metricsL}
+        resLayer.dataProvider().changeAttributeValues(changesD)
+        processed += len(changesD)
+        feedback.pushInfo(f'Tile {ind+1} of {len(tilesA)}: {len(changesD)} Features with Results, {tileCount} Features with Halo')
+        feedback.setProgress(100*(ind+1)/len(tilesA))
+
+        del tileLayer
+        if network == 0: del tileLines
+        for path in [linesPath] + ([pointsPath] if network == 0 else []):
+            for fileSuffix in ['', '-wal', '-shm']:
+                if os.path.isfile(path + fileSuffix): os.remove(path + fileSuffix)
+    if os.listdir(tempDir) == []: os.rmdir(tempDir)
+
+    return {'numoffeat': processed}
@@ -0,0 +1,61 @@
+"""
+Client of the GAUS Query Service 1.1, it runs outside QGIS with the standard library only.
+
+Command line:
+python gaus_query_client.py X Y [--radius 800] [--metrics Acc,Opp,Rea] [--port 8765]
+python gaus_query_client.py --id 12 [--radius 800]
+python gaus_query_client.py --csv points.csv [--radius 800]   (columns x and y, or id, and optionally radius, answered in a single request)
+python gaus_query_client.py --shutdown
+"""
+
+import csv
+import sys
+import json
+import argparse
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+#answer of a single query, informed by the coordinates or by the feature id
+def query(x = None, y = None, featId = None, radius = 0.0, metrics = "Acc,Opp,Rea", port = 8765):
+    queryD = {"radius": radius, "metrics": metrics}
+    if featId != None: queryD["id"] = featId
+    else: queryD["x"], queryD["y"] = x, y
+    with urlopen(f"http://127.0.0.1:{port}/query?" + urlencode(queryD)) as response:
+        return json.loads(response.read())
+
+#answers of a list of queries (dicts with the keys of the single query), made in a single request
+def queryBatch(queriesL, port = 8765):
+    request = Request(f"http://127.0.0.1:{port}/query", data = json.dumps(queriesL).encode(), headers = {"Content-Type": "application/json"})
+    with urlopen(request) as response:
+        return json.loads(response.read())
+
+def health(port = 8765):
+    with urlopen(f"http://127.0.0.1:{port}/health") as response:
+        return json.loads(response.read())
+
+def shutdown(port = 8765):
+    with urlopen(f"http://127.0.0.1:{port}/shutdown") as response:
+        return json.loads(response.read())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Client of the GAUS Query Service 1.1")
+    parser.add_argument("x", type = float, nargs = "?")
+    parser.add_argument("y", type = float, nargs = "?")
+    parser.add_argument("--id", type = int)
+    parser.add_argument("--csv")
+    parser.add_argument("--radius", type = float, default = 0.0)
+    parser.add_argument("--metrics", default = "Acc,Opp,Rea")
+    parser.add_argument("--port", type = int, default = 8765)
+    parser.add_argument("--shutdown", action = "store_true")
+    args = parser.parse_args()
+
+    if args.shutdown: result = shutdown(args.port)
+    elif args.csv != None:
+        with open(args.csv, newline = "") as csvFile:
+            queriesL = [dict({"radius": args.radius, "metrics": args.metrics}, **{key: value for key, value in row.items() if value != ""}) for row in csv.DictReader(csvFile)]
+        result = queryBatch(queriesL, args.port)
+    elif args.id != None: result = query(featId = args.id, radius = args.radius, metrics = args.metrics, port = args.port)
+    elif args.x != None and args.y != None: result = query(args.x, args.y, radius = args.radius, metrics = args.metrics, port = args.port)
+    else: parser.error("inform X and Y, --id, --csv or --shutdown")
+    json.dump(result, sys.stdout, indent = 1)
+    print()